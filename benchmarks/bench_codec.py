@@ -0,0 +1,61 @@
+"""
+Compare the installed JSON codecs on recorded Kraken websocket frames.
+
+Usage: ::
+
+    python -m benchmarks.bench_codec [iterations]
+"""
+import sys
+import timeit
+
+from kraken_async_api.codec import get_codec, PREFERENCE
+
+# Frames recorded from the public websocket, covering each channel
+FRAMES = [
+    '{"event":"heartbeat"}',
+    '[340,{"a":["30405.80000",0,"0.22930000"],"b":["30405.70000",3,"3.98700000"],'
+    '"c":["30405.80000","0.00120000"],"v":["1063.01532574","3087.98745329"],'
+    '"p":["30325.33839","30337.49637"],"t":[12345,30987],"l":["30100.00000","30100.00000"],'
+    '"h":["30512.10000","30601.40000"],"o":["30210.50000","30412.90000"]},"ticker","XBT/USD"]',
+    '[336,{"as":[["30405.80000","0.22930000","1648745692.462371"],'
+    '["30406.40000","0.50000000","1648745692.310418"],'
+    '["30407.10000","1.12780000","1648745691.839125"],'
+    '["30408.00000","0.06000000","1648745690.021377"],'
+    '["30409.50000","2.00000000","1648745689.564109"]],'
+    '"bs":[["30405.70000","3.98700000","1648745692.468320"],'
+    '["30404.60000","0.10000000","1648745692.001372"],'
+    '["30403.90000","1.50000000","1648745691.713288"],'
+    '["30402.20000","0.32890000","1648745690.998412"],'
+    '["30401.00000","4.00000000","1648745688.732716"]]},"book-10","XBT/USD"]',
+    '[336,{"a":[["30406.40000","0.00000000","1648745692.512907"],'
+    '["30410.10000","0.25000000","1648745692.512907","r"]],"c":"3419215718"},"book-10","XBT/USD"]',
+    '[337,[["30405.80000","0.00120000","1648745692.520114","b","l",""],'
+    '["30405.80000","0.10000000","1648745692.520309","b","m",""]],"trade","XBT/USD"]',
+    '[338,["30405.70000","30405.80000","1648745692.530112","3.98700000","0.22930000"],'
+    '"spread","XBT/USD"]',
+    '[339,["1648745692.539417","1648745700.000000","30410.10000","30412.00000",'
+    '"30400.00000","30405.80000","30406.73190","3.34120000",42],"ohlc-1","XBT/USD"]',
+]
+
+PAYLOAD = {"event": "subscribe", "pair": ["XBT/USD", "ETH/USD", "XBT/EUR"],
+           "subscription": {"name": "book", "depth": 1000}}
+
+
+def main(iterations: int = 20000):
+    frames = [frame.encode() for frame in FRAMES]
+    print(f"{'codec':<10}{'decode (frames/s)':>20}{'encode (payloads/s)':>22}")
+    for name in PREFERENCE:
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            print(f"{name:<10}{'not installed':>20}")
+            continue
+        loads, dumps = codec.loads, codec.dumps
+        decode = timeit.timeit(lambda: [loads(frame) for frame in frames], number=iterations)
+        encode = timeit.timeit(lambda: dumps(PAYLOAD), number=iterations)
+        print(f"{name:<10}{len(frames) * iterations / decode:>20,.0f}"
+              f"{iterations / encode:>22,.0f}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
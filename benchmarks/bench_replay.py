@@ -0,0 +1,57 @@
+"""
+Measure dispatch throughput by replaying a capture file through a public websocket API.
+
+If no capture file is given, one is written from the frames used by
+:mod:`benchmarks.bench_codec`, so results are reproducible without a network.
+
+Usage: ::
+
+    python -m benchmarks.bench_replay [capture file] [frames]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from websockets.exceptions import ConnectionClosedOK
+
+from benchmarks.bench_codec import FRAMES
+from kraken_async_api.capture import FrameRecorder, ReplaySocket
+from kraken_async_api.websocket import PublicWebSocketApi
+
+
+async def replay(path: str, raw: bool) -> float:
+    received = 0
+
+    async def count(_):
+        nonlocal received
+        received += 1
+
+    socket = ReplaySocket(path, raw=raw)
+    api = PublicWebSocketApi(count, socket)
+    started = time.perf_counter()
+    api.start()
+    try:
+        await api.listening
+    except ConnectionClosedOK:
+        pass
+    elapsed = time.perf_counter() - started
+    await socket.close()
+    return received / elapsed
+
+
+def main(path: str = None, frames: int = 200000):
+    with tempfile.TemporaryDirectory() as directory:
+        if path is None:
+            path = os.path.join(directory, "bench.capture")
+            with FrameRecorder(path) as recorder:
+                for index in range(frames):
+                    recorder.record(FRAMES[index % len(FRAMES)])
+        for raw in (False, True):
+            rate = asyncio.run(replay(path, raw))
+            print(f"{'bytes' if raw else 'str':<6}{rate:>14,.0f} messages/s")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *map(int, sys.argv[2:3]))
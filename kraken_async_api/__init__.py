@@ -11,6 +11,23 @@ endpoints, grouped by communications protocol (REST or Websockets) and authorisa
 """
 from .exchange import Kraken
 from .config import Config
+from .auth import NonceGenerator, Signer
 from .rest import PublicRestApi, PrivateRestApi
-from .websocket import PublicWebSocketApi, PrivateWebSocketApi
+from .websocket import PublicWebSocketApi, PrivateWebSocketApi, PublicSubscription, \
+    PrivateSubscription
+from .dispatch import Dispatcher, EVENT
+from .book import LocalOrderBook, OrderBookManager, ChecksumError, to_scaled
+from .sharding import ShardedPublicWebSocketApi
+from .workers import ProcessPublicWebSocketApi
+from .errors import KrakenError, RateLimitError, InvalidNonceError, AuthenticationError, \
+    OrderError
+from .ratelimit import Tier, Priority, RateLimiter, PairRateLimiter
+from .history import History, iter_pages, backfill, Checkpoint, NpyColumnWriter
+from .metadata import MetadataCache, PairInfo, format_scaled
+from .capture import FrameRecorder, ReplaySocket
+from .queues import QueuedHandler, MessageQueue, Overflow, QueueStats
+from .state import MarketState, Quote
+from .subscriptions import SubscriptionBatcher
+from .metrics import Metrics, LatencyHistogram
+from .pool import PoolStats, create_session
 from .constants import Depth, Interval, AssetClass
@@ -0,0 +1,260 @@
+"""
+Authentication helpers used by the private REST and Websocket APIs.
+
+:class:`TokenManager` caches the websocket authentication token and keeps it
+fresh in the background so that sending orders never waits on a REST call.
+
+:class:`NonceGenerator` provides the strictly increasing nonces required by
+private REST calls, which are signed by a :class:`Signer`.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Coroutine, Optional
+
+from kraken_async_api.errors import KrakenError
+from kraken_async_api.metrics import Metrics
+
+
+@dataclass
+class WsToken:
+    """
+    A kraken websocket authorisation token.
+
+    This consists of the token itself, and the time at which it should no
+    longer be used, given in seconds on the monotonic clock.
+    """
+    data: str
+    expiry_time: float
+
+
+@dataclass
+class TokenStats:
+    """
+    Counters describing how a :class:`TokenManager` has served its tokens.
+    """
+    hits: int = 0
+    """Number of requests served from the cache"""
+
+    misses: int = 0
+    """Number of requests which had to wait for a token to be fetched"""
+
+    refreshes: int = 0
+    """Number of tokens fetched from the REST API"""
+
+
+class TokenManager:
+    """
+    Caches a websocket token and refreshes it before it expires.
+
+    Reading the token with :meth:`peek` never awaits, so it can be used on the
+    order path. When a token is fetched, a background refresh is scheduled at
+    `refresh_ratio` of its lifetime. Concurrent refreshes share a single call
+    to `fetch_token`.
+
+    :param fetch_token: coroutine function which requests a new token over REST, returning
+        the decoded result of :meth:`PrivateRestApi.get_ws_token`
+    :param refresh_ratio: fraction of the token lifetime after which it is refreshed
+    :param expiry_ratio: fraction of the token lifetime after which it is no longer used.
+        This is slightly less than 1 to account for latency.
+    """
+
+    def __init__(self, fetch_token: Callable[[], Coroutine],
+                 refresh_ratio: float = 0.75, expiry_ratio: float = 0.9):
+        self._fetch_token = fetch_token
+        self._refresh_ratio = refresh_ratio
+        self._expiry_ratio = expiry_ratio
+        self._token: Optional[WsToken] = None
+        self._pending: Optional[asyncio.Future] = None
+        self._refresh_handle: Optional[asyncio.TimerHandle] = None
+        self._background: Optional[asyncio.Task] = None
+        self.stats = TokenStats()
+        self.metrics = Metrics()
+        """Latency of token fetches, recorded if enabled"""
+
+    def peek(self) -> Optional[WsToken]:
+        """
+        Return the cached token if it is still valid, otherwise None.
+        """
+        token = self._token
+        if token is not None and token.expiry_time > time.monotonic():
+            self.stats.hits += 1
+            return token
+        return None
+
+    async def get(self) -> WsToken:
+        """
+        Return a valid token, fetching one if the cached token is missing or expired.
+        """
+        token = self.peek()
+        if token is None:
+            self.stats.misses += 1
+            token = await self.refresh()
+        return token
+
+    async def refresh(self) -> WsToken:
+        """
+        Fetch a new token. If a fetch is already in progress, its result is shared.
+        """
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._fetch())
+            self._pending.add_done_callback(self._clear_pending)
+        return await asyncio.shield(self._pending)
+
+    def close(self):
+        """
+        Cancel any scheduled or running background refresh.
+        """
+        if self._refresh_handle is not None:
+            self._refresh_handle.cancel()
+            self._refresh_handle = None
+        if self._background is not None:
+            self._background.cancel()
+            self._background = None
+
+    async def _fetch(self) -> WsToken:
+        started = time.perf_counter()
+        try:
+            result = await self._fetch_token()
+        except KrakenError as error:
+            raise ConnectionError("Token could not be fetched. Please verify your api-key and"
+                                  f" api-sec. {' '.join(error.errors)}") from error
+        if self.metrics.enabled:
+            self.metrics.observe("token_fetch", "", time.perf_counter() - started)
+        self.stats.refreshes += 1
+        lifetime = result["expires"]
+        fetched_at = time.monotonic()
+        self._token = WsToken(result["token"], fetched_at + lifetime * self._expiry_ratio)
+        self._schedule_refresh(lifetime * self._refresh_ratio)
+        return self._token
+
+    def _clear_pending(self, _):
+        self._pending = None
+
+    def _schedule_refresh(self, delay: float):
+        if self._refresh_handle is not None:
+            self._refresh_handle.cancel()
+        self._refresh_handle = asyncio.get_running_loop().call_later(
+            delay, self._start_background_refresh)
+
+    def _start_background_refresh(self):
+        self._refresh_handle = None
+        self._background = asyncio.ensure_future(self._background_refresh())
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception:  # pylint: disable=broad-except
+            # The cached token is left to expire, so the next call to get()
+            # fetches again and surfaces the error to the caller.
+            pass
+
+
+class NonceGenerator:
+    """
+    Strictly increasing nonces for private REST calls, in microseconds since the epoch.
+
+    Each nonce is the current time, or one more than the previous nonce if the clock
+    has not moved on, so calls made in the same microsecond still get distinct nonces.
+    Nonces are generated without awaiting, so coroutines sharing a generator cannot
+    interleave.
+
+    If a `path` is given, the last nonce is also kept in that file, which is locked while
+    each nonce is generated, so that processes sharing an API key never reuse a nonce.
+    This requires :mod:`fcntl`, which is only available on POSIX systems. On an event loop,
+    use :meth:`next_async`, which retries rather than blocking while another process
+    holds the lock.
+
+    Calls sent concurrently may still reach Kraken out of nonce order. To send private
+    calls in parallel, set a nonce window on the API key.
+
+    :param path: An optional file used to share the last nonce between processes
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.last = 0
+        """The last nonce generated"""
+        self._fd: Optional[int] = None
+
+    def next(self) -> int:
+        """
+        Return a nonce greater than every nonce generated before it, waiting for the lock
+        on the shared file if necessary.
+        """
+        return self._generate(blocking=True)
+
+    async def next_async(self, retry_delay: float = 0.0005) -> int:
+        """
+        Return a nonce as :meth:`next` does, sleeping between attempts to lock the shared
+        file rather than blocking the event loop.
+
+        :param retry_delay: Seconds to wait before trying to lock the file again
+        """
+        while True:
+            try:
+                return self._generate(blocking=False)
+            except BlockingIOError:
+                # Another process holds the lock on the shared file
+                await asyncio.sleep(retry_delay)
+
+    def close(self):
+        """
+        Close the file used to share nonces between processes.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _generate(self, blocking: bool) -> int:
+        nonce = max(int(time.time() * 1_000_000), self.last + 1)
+        if self.path is not None:
+            nonce = self._next_shared(nonce, blocking)
+        self.last = nonce
+        return nonce
+
+    def _next_shared(self, nonce: int, blocking: bool) -> int:
+        import fcntl  # pylint: disable=import-outside-toplevel
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            stored = os.pread(self._fd, 8, 0)
+            if len(stored) == 8:
+                nonce = max(nonce, int.from_bytes(stored, "little") + 1)
+            os.pwrite(self._fd, nonce.to_bytes(8, "little"), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return nonce
+
+
+class Signer:
+    """
+    Signs private REST calls with an API secret.
+
+    The secret is decoded and an HMAC keyed with it is created once, and copied for
+    each signature, so that signing a call only hashes its own data.
+
+    :param api_sec: The base64 encoded API secret
+    """
+
+    def __init__(self, api_sec: str):
+        self.api_sec = api_sec
+        self._template = hmac.new(base64.b64decode(api_sec), digestmod=hashlib.sha512)
+
+    def sign(self, path: str, nonce: str, body: str) -> str:
+        """
+        Return the API-Sign header of a call.
+
+        :param path: The URL path of the call, e.g. "/0/private/Balance"
+        :param nonce: The nonce sent in the body
+        :param body: The url encoded body of the call, including the nonce
+        """
+        mac = self._template.copy()
+        mac.update(path.encode())
+        mac.update(hashlib.sha256((nonce + body).encode()).digest())
+        return base64.b64encode(mac.digest()).decode()
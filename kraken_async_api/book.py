@@ -0,0 +1,371 @@
+"""
+Local order books maintained from the websocket `book` subscription.
+
+:class:`LocalOrderBook` applies the snapshot and the level updates which follow
+it, keeps each side trimmed to the subscribed depth and verifies Kraken's
+`CRC32 checksum`_ after every update. Prices and volumes are kept as integers
+scaled by the pair's decimal places, and the checksum is calculated from the
+strings Kraken sent for each level, so it matches whatever the scale.
+
+:class:`OrderBookManager` keeps one :class:`LocalOrderBook` per pair up to date
+from a :class:`PublicWebSocketApi`, and resubscribes to pairs whose checksum fails.
+
+.. _CRC32 checksum: https://docs.kraken.com/websockets/#book-checksum
+"""
+from bisect import bisect_left
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+from zlib import crc32
+
+from kraken_async_api.constants import Depth
+from kraken_async_api.metadata import MetadataCache, PairInfo, format_scaled
+from kraken_async_api.websocket import PublicSubscription, PublicWebSocketApi
+
+Level = Tuple[int, int]
+"""A price level given as (price, volume), each scaled to an integer"""
+
+CHECKSUM_LEVELS = 10
+"""Number of levels each side used to calculate the checksum"""
+
+
+class ChecksumError(ValueError):
+    """
+    Raised when a local order book no longer matches the checksum sent by Kraken.
+    """
+
+
+def to_scaled(text: str, decimals: int) -> int:
+    """
+    Return a decimal string as an integer scaled by 10 ** `decimals`, without rounding
+    through a float.
+
+    :raises ValueError: if the value has non-zero digits beyond `decimals` decimal places,
+        which cannot be represented at this scale
+    """
+    whole, _, fraction = text.partition(".")
+    if len(fraction) != decimals:
+        if fraction[decimals:].strip("0"):
+            raise ValueError(f"{text} has more than {decimals} decimal places")
+        fraction = fraction.ljust(decimals, "0")[:decimals]
+    return int(whole + fraction)
+
+
+def _checksum_digits(text: str) -> str:
+    # A price or volume contributes its digits without the "." or leading zeros
+    return text.replace(".", "").lstrip("0")
+
+
+def _decimals(text: str) -> int:
+    whole, _, fraction = text.partition(".")
+    return len(fraction) if whole else 0
+
+
+class _BookSide:
+    """
+    One side of an order book, held as a sorted list of price keys and a map of
+    each key to its level, along with the checksum digits of the strings the level
+    was received as. Bids are keyed by negated price so that the best level of both
+    sides is at index 0.
+    """
+    __slots__ = ("keys", "levels", "digits", "sign")
+
+    def __init__(self, descending: bool):
+        self.keys: List[int] = []
+        self.levels: Dict[int, Level] = {}
+        self.digits: Dict[int, str] = {}
+        self.sign = -1 if descending else 1
+
+    def update(self, price: int, volume: int, digits: str):
+        key = self.sign * price
+        levels = self.levels
+        if volume == 0:
+            if levels.pop(key, None) is not None:
+                del self.digits[key]
+                keys = self.keys
+                del keys[bisect_left(keys, key)]
+            return
+        if key not in levels:
+            keys = self.keys
+            keys.insert(bisect_left(keys, key), key)
+        levels[key] = (price, volume)
+        self.digits[key] = digits
+
+    def trim(self, depth: int):
+        keys, levels, digits = self.keys, self.levels, self.digits
+        while len(keys) > depth:
+            key = keys.pop()
+            del levels[key]
+            del digits[key]
+
+    def top(self, count: int) -> List[Level]:
+        levels = self.levels
+        return [levels[key] for key in self.keys[:count]]
+
+    def best(self) -> Optional[Level]:
+        if not self.keys:
+            return None
+        return self.levels[self.keys[0]]
+
+    def checksum_string(self) -> str:
+        digits = self.digits
+        return "".join(digits[key] for key in self.keys[:CHECKSUM_LEVELS])
+
+    def clear(self):
+        self.keys.clear()
+        self.levels.clear()
+        self.digits.clear()
+
+
+class LocalOrderBook:
+    """
+    An order book for a single pair, built from a snapshot and level updates.
+
+    Prices and volumes are held as integers, scaled by 10 ** :attr:`price_decimals` and
+    10 ** :attr:`volume_decimals`, so comparisons and the checksum are exact. Unless they
+    are given, the decimal places are taken from the first snapshot, as Kraken sends every
+    price and volume of a pair with the same number of decimal places.
+
+    Updates are applied in O(log n) per level. The best bid and ask are available
+    in O(1) and the top N levels in O(N).
+
+    Example: ::
+
+        >>> book = LocalOrderBook("XBT/USD", Depth.D1000)
+        >>> book.apply(message)
+        >>> book.best_bid
+        (554120000, 152900000)
+        >>> book.format_price(book.best_bid[0])
+        '5541.20000'
+
+    :param pair: The pair this book is for
+    :param depth: The depth subscribed to. Levels beyond this depth are discarded.
+    :param price_decimals: The number of decimal places of prices in the book
+    :param volume_decimals: The number of decimal places of volumes in the book
+    """
+
+    def __init__(self, pair: str, depth: Union[Depth, int] = Depth.D10,
+                 price_decimals: Optional[int] = None, volume_decimals: Optional[int] = None):
+        if isinstance(depth, Depth):
+            depth = depth.value
+        self.pair = pair
+        self.depth = depth
+        self.price_decimals = price_decimals
+        self.volume_decimals = volume_decimals
+        self.synced = False
+        """Whether a snapshot has been received since the book was created or cleared"""
+        self._asks = _BookSide(descending=False)
+        self._bids = _BookSide(descending=True)
+
+    @classmethod
+    def for_pair(cls, info: PairInfo, depth: Union[Depth, int] = Depth.D10) -> "LocalOrderBook":
+        """
+        Create a book scaled by the decimal places of a pair's metadata.
+        """
+        return cls(info.wsname, depth, info.pair_decimals, info.lot_decimals)
+
+    @property
+    def best_bid(self) -> Optional[Level]:
+        """The highest bid, or None if there are no bids"""
+        return self._bids.best()
+
+    @property
+    def best_ask(self) -> Optional[Level]:
+        """The lowest ask, or None if there are no asks"""
+        return self._asks.best()
+
+    def bids(self, count: Optional[int] = None) -> List[Level]:
+        """Return the best `count` bids, highest first. By default, all bids are returned."""
+        return self._bids.top(self.depth if count is None else count)
+
+    def asks(self, count: Optional[int] = None) -> List[Level]:
+        """Return the best `count` asks, lowest first. By default, all asks are returned."""
+        return self._asks.top(self.depth if count is None else count)
+
+    def format_price(self, price: int) -> str:
+        """Return a scaled price as a decimal string, as sent by Kraken"""
+        return format_scaled(price, self.price_decimals)
+
+    def format_volume(self, volume: int) -> str:
+        """Return a scaled volume as a decimal string, as sent by Kraken"""
+        return format_scaled(volume, self.volume_decimals)
+
+    def apply(self, message: List[Any]):
+        """
+        Apply a message received on the `book` channel. Messages received before
+        the first snapshot, or after the book has been cleared, are ignored.
+
+        :param message: A decoded `book` message
+        :raises ChecksumError: if the book does not match the checksum sent with an update
+        :raises ValueError: if a price or volume has more decimal places than the book
+        """
+        data = message[1:-2]
+        if "as" in data[0] or "bs" in data[0]:
+            self.apply_snapshot(data[0])
+        elif self.synced:
+            self.apply_update(*data)
+
+    def apply_snapshot(self, snapshot: Dict[str, List[List[str]]]):
+        """
+        Replace the contents of the book with a snapshot.
+
+        :param snapshot: The snapshot, containing the keys "as" and "bs"
+        """
+        self.clear()
+        asks, bids = snapshot.get("as", ()), snapshot.get("bs", ())
+        if self.price_decimals is None or self.volume_decimals is None:
+            first = (asks or bids or [("0", "0")])[0]
+            if self.price_decimals is None:
+                self.price_decimals = _decimals(first[0])
+            if self.volume_decimals is None:
+                self.volume_decimals = _decimals(first[1])
+        self._apply_levels(self._asks, asks)
+        self._apply_levels(self._bids, bids)
+        self._asks.trim(self.depth)
+        self._bids.trim(self.depth)
+        self.synced = True
+
+    def apply_update(self, *updates: Dict[str, Any]):
+        """
+        Apply level updates. The checksum is verified once all given updates are applied.
+
+        :param updates: One or two updates, containing the keys "a" and/or "b", and "c"
+        :raises ChecksumError: if the book does not match the checksum
+        """
+        checksum = None
+        for update in updates:
+            self._apply_levels(self._asks, update.get("a", ()))
+            self._apply_levels(self._bids, update.get("b", ()))
+            checksum = update.get("c", checksum)
+        self._asks.trim(self.depth)
+        self._bids.trim(self.depth)
+        if checksum is not None and int(checksum) != self.checksum():
+            raise ChecksumError(f"Checksum mismatch for {self.pair}: expected {checksum},"
+                                f" calculated {self.checksum()}")
+
+    def checksum(self) -> int:
+        """
+        Calculate the CRC32 checksum of the top 10 levels each side, as defined by Kraken.
+        """
+        return crc32((self._asks.checksum_string() + self._bids.checksum_string()).encode())
+
+    def clear(self):
+        """
+        Remove all levels. Updates are ignored until the next snapshot is applied.
+        """
+        self._asks.clear()
+        self._bids.clear()
+        self.synced = False
+
+    def _apply_levels(self, side: _BookSide, levels: List[List[str]]):
+        price_decimals, volume_decimals = self.price_decimals, self.volume_decimals
+        update = side.update
+        for price, volume, *_ in levels:
+            update(to_scaled(price, price_decimals), to_scaled(volume, volume_decimals),
+                   _checksum_digits(price) + _checksum_digits(volume))
+
+
+class OrderBookManager:
+    """
+    Maintains a :class:`LocalOrderBook` for each pair subscribed to through it.
+
+    When a book fails its checksum, it is cleared and the pair is resubscribed
+    to so that a new snapshot is sent.
+
+    Example: ::
+
+        >>> books = OrderBookManager(kraken.public, Depth.D1000)
+        >>> await books.subscribe(["XBT/USD", "ETH/USD"])
+        >>> books["XBT/USD"].best_ask
+
+    :param api: The public websocket API that book messages are received from. A `book`
+        handler already registered on it is kept, and called first, as is its
+        default callback if there is none.
+    :param depth: The depth to subscribe to
+    :param on_update: An optional coroutine function called with each updated book
+    :param metadata: Optional pair metadata, used to scale each book by its pair's decimal
+        places rather than those of the first snapshot
+    """
+
+    def __init__(self, api: PublicWebSocketApi, depth: Union[Depth, int] = Depth.D10,
+                 on_update: Optional[Callable[[LocalOrderBook], Coroutine]] = None,
+                 metadata: Optional[MetadataCache] = None):
+        self.api = api
+        self.depth = depth
+        self.on_update = on_update
+        self.metadata = metadata
+        self.books: Dict[str, LocalOrderBook] = {}
+        self.resyncs = 0
+        """Number of times a book has been resubscribed to after failing its checksum"""
+        api.chain_handler(PublicSubscription.BOOK, self.handle)
+
+    def __getitem__(self, pair: str) -> LocalOrderBook:
+        return self.books[pair]
+
+    async def subscribe(self, pairs: List[str], depth: Union[Depth, int, None] = None):
+        """
+        Create books for the given pairs and subscribe to them. Books are keyed by the
+        websocket name of their pair, as converted by the API's `pair_resolver`, which
+        is the name book messages arrive with.
+
+        :param depth: The depth of these books, if not the manager's `depth`
+        """
+        pairs = await self._resolve(pairs)
+        depth = self.depth if depth is None else depth
+        if isinstance(depth, Depth):
+            depth = depth.value
+        for pair in pairs:
+            book = self.books.get(pair)
+            if book is None or book.depth != depth:
+                self.books[pair] = self._new_book(pair, depth)
+        await self.api.subscribe_to_book(pairs, depth)
+
+    async def unsubscribe(self, pairs: List[str]):
+        """
+        Unsubscribe from the given pairs, at the depth each was subscribed to, and discard
+        their books.
+        """
+        by_depth: Dict[Union[Depth, int], List[str]] = {}
+        for pair in await self._resolve(pairs):
+            book = self.books.pop(pair, None)
+            by_depth.setdefault(self.depth if book is None else book.depth, []).append(pair)
+        for depth, depth_pairs in by_depth.items():
+            await self.api.unsubscribe_from_book(depth_pairs, depth)
+
+    async def handle(self, message: List[Any]):
+        """
+        Apply a `book` message to the book for its pair.
+        """
+        pair = message[-1]
+        book = self.books.get(pair)
+        if book is None:
+            book = self.books[pair] = self._new_book(pair)
+        try:
+            book.apply(message)
+        except ChecksumError:
+            await self.resync(pair)
+            return
+        if self.on_update is not None and book.synced:
+            await self.on_update(book)
+
+    async def resync(self, pair: str):
+        """
+        Clear the book for a pair and resubscribe to receive a new snapshot.
+        """
+        self.resyncs += 1
+        book = self.books[pair]
+        book.clear()
+        await self.api.unsubscribe_from_book([pair], book.depth)
+        await self.api.subscribe_to_book([pair], book.depth)
+
+    async def _resolve(self, pairs: List[str]) -> List[str]:
+        resolver = getattr(self.api, "pair_resolver", None)
+        return pairs if resolver is None else await resolver(pairs)
+
+    def _new_book(self, pair: str, depth: Union[Depth, int, None] = None) -> LocalOrderBook:
+        depth = self.depth if depth is None else depth
+        metadata = self.metadata
+        if metadata is not None:
+            try:
+                return LocalOrderBook.for_pair(metadata.pair(pair), depth)
+            except KeyError:
+                pass
+        return LocalOrderBook(pair, depth)
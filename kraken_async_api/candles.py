@@ -0,0 +1,285 @@
+"""
+OHLC candles kept in fixed-size ring buffers.
+
+:class:`CandleManager` seeds the candles of a pair from the REST API, then keeps
+them up to date from the 1 minute `ohlc` websocket subscription. Candles for
+longer intervals are built from the 1 minute updates, so each pair needs only
+one subscription.
+
+Candles are stored in a :class:`CandleBuffer`, a NumPy array which can be
+memory-mapped to a file so that history is reloaded on restart, and only the
+candles since the last stored one are requested from the REST API.
+
+NumPy is required by this module, and is installed with the `candles` extra.
+"""
+import os
+from typing import Any, Callable, Coroutine, Dict, Iterable, List, Optional, Tuple
+
+import numpy
+
+from kraken_async_api.constants import Interval
+from kraken_async_api.rest import PublicRestApi
+from kraken_async_api.websocket import PublicSubscription, PublicWebSocketApi
+
+FIELDS = ("time", "open", "high", "low", "close", "vwap", "volume", "count")
+"""The columns of a candle. `time` is the start of the candle in epoch seconds."""
+
+TIME, OPEN, HIGH, LOW, CLOSE, VWAP, VOLUME, COUNT = range(len(FIELDS))
+
+
+class CandleBuffer:
+    """
+    The most recent `capacity` candles of a series, in order of their start time.
+
+    Every candle is written twice, `capacity` rows apart, so that any window of recent
+    candles is a contiguous slice of the array and can be read without copying.
+
+    If a path is given, the buffer is memory-mapped to that file and reloaded from it
+    if it already exists with the same capacity.
+
+    :param capacity: The number of candles kept
+    :param path: An optional file to persist the candles to
+    """
+
+    def __init__(self, capacity: int, path: Optional[str] = None):
+        self.capacity = capacity
+        self.path = path
+        shape = (2 * capacity + 1, len(FIELDS))
+        if path is None:
+            storage = numpy.zeros(shape)
+        elif os.path.exists(path) and os.path.getsize(path) == shape[0] * shape[1] * 8:
+            storage = numpy.memmap(path, numpy.float64, "r+", shape=shape)
+        else:
+            storage = numpy.memmap(path, numpy.float64, "w+", shape=shape)
+        # The first row holds the number of candles written, so that it is persisted too
+        self._state = storage[0]
+        self._rows = storage[1:]
+        self._storage = storage
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    @property
+    def written(self) -> int:
+        """The number of candles written since the buffer was created"""
+        return int(self._state[0])
+
+    @property
+    def last(self) -> Optional[numpy.ndarray]:
+        """A copy of the most recent candle, or None if the buffer is empty"""
+        return self.window(1)[0].copy() if self.written else None
+
+    def window(self, size: Optional[int] = None) -> numpy.ndarray:
+        """
+        Return a view of the most recent `size` candles, oldest first, with one row per
+        candle and one column per field in :data:`FIELDS`. The view is not a copy, so it
+        changes as candles are updated.
+
+        :param size: The number of candles, by default all candles kept
+        """
+        size = len(self) if size is None else min(size, len(self))
+        end = self.written % self.capacity + self.capacity
+        return self._rows[end - size:end]
+
+    def column(self, field: str, size: Optional[int] = None) -> numpy.ndarray:
+        """
+        Return a view of one field of the most recent `size` candles, oldest first.
+        """
+        return self.window(size)[:, FIELDS.index(field)]
+
+    def upsert(self, candle) -> bool:
+        """
+        Add a candle, or replace the most recent candle if it has the same start time.
+        Candles older than the most recent candle are ignored.
+
+        :param candle: The values of the candle in the order of :data:`FIELDS`
+        :return: True if a new candle was added
+        """
+        last = self.last
+        if last is not None and candle[TIME] < last[TIME]:
+            return False
+        added = last is None or candle[TIME] > last[TIME]
+        written = self.written + added
+        index = (written - 1) % self.capacity
+        self._rows[index] = candle
+        self._rows[index + self.capacity] = candle
+        self._state[0] = written
+        return added
+
+    def flush(self):
+        """
+        Write the candles to the file, if the buffer is persisted.
+        """
+        if isinstance(self._storage, numpy.memmap):
+            self._storage.flush()
+
+
+def _merge(first: numpy.ndarray, second: numpy.ndarray) -> numpy.ndarray:
+    merged = first.copy()
+    merged[HIGH] = max(first[HIGH], second[HIGH])
+    merged[LOW] = min(first[LOW], second[LOW])
+    merged[CLOSE] = second[CLOSE]
+    merged[VOLUME] = first[VOLUME] + second[VOLUME]
+    merged[COUNT] = first[COUNT] + second[COUNT]
+    if merged[VOLUME]:
+        merged[VWAP] = (first[VWAP] * first[VOLUME]
+                        + second[VWAP] * second[VOLUME]) / merged[VOLUME]
+    return merged
+
+
+class _Aggregate:
+    """Builds the running candle of a longer interval from 1 minute candles"""
+
+    def __init__(self, buffer: CandleBuffer, interval: Interval):
+        self.buffer = buffer
+        self.seconds = interval.value * 60
+        self.start: Optional[float] = None
+        self.closed: Optional[numpy.ndarray] = None
+        """The merged 1 minute candles of the running candle which have closed"""
+
+    def seed(self, minutes: numpy.ndarray):
+        """Set up the running candle from the 1 minute candles kept so far"""
+        if minutes.shape[0] == 0:
+            return
+        now = minutes[-1, TIME]
+        self.start = now - now % self.seconds
+        if minutes[0, TIME] <= self.start:
+            # The running candle is rebuilt from the closed minutes in the 1 minute buffer
+            for minute in minutes[minutes[:, TIME] >= self.start][:-1]:
+                self.close_minute(minute)
+        else:
+            # The 1 minute buffer does not reach back to the start of the running candle,
+            # so the candle given by the REST API is used as the closed part of it
+            self.closed = self.buffer.last
+
+    def close_minute(self, minute: numpy.ndarray):
+        """Add a closed 1 minute candle to the running candle"""
+        start = minute[TIME] - minute[TIME] % self.seconds
+        if start != self.start:
+            self.start, self.closed = start, None
+        self.closed = minute.copy() if self.closed is None else _merge(self.closed, minute)
+        self.closed[TIME] = start
+
+    def update(self, minute: numpy.ndarray) -> bool:
+        """Update the running candle with the running 1 minute candle"""
+        start = minute[TIME] - minute[TIME] % self.seconds
+        if start != self.start or self.closed is None:
+            candle = minute.copy()
+        else:
+            candle = _merge(self.closed, minute)
+        candle[TIME] = start
+        return self.buffer.upsert(candle)
+
+
+OnClose = Callable[[str, Interval, numpy.ndarray], Coroutine]
+
+
+class CandleManager:
+    """
+    Maintains candles for each pair and interval tracked through it.
+
+    Example: ::
+
+        >>> candles = CandleManager(kraken.public_rest, kraken.public, directory="candles")
+        >>> await candles.track(["XBT/USD"], [Interval.I1, Interval.I15])
+        >>> closes = candles["XBT/USD", Interval.I15].column("close", 20)
+
+    :param rest: The public REST API used to seed candles
+    :param api: The public websocket API that `ohlc` messages are received from. An `ohlc`
+        handler already registered on it is kept, and called first, as is its
+        default callback if there is none.
+    :param capacity: The number of candles kept for each pair and interval
+    :param directory: An optional directory to persist candles to
+    :param on_close: An optional coroutine function called with the pair, interval and
+        values of each candle when it closes
+    """
+
+    def __init__(self, rest: PublicRestApi, api: PublicWebSocketApi, capacity: int = 1440,
+                 directory: Optional[str] = None, on_close: Optional[OnClose] = None):
+        self.rest = rest
+        self.api = api
+        self.capacity = capacity
+        self.directory = directory
+        self.on_close = on_close
+        self.buffers: Dict[Tuple[str, Interval], CandleBuffer] = {}
+        self._aggregates: Dict[str, List[Tuple[Interval, _Aggregate]]] = {}
+        api.chain_handler(PublicSubscription.OHLC, self.handle)
+
+    def __getitem__(self, key: Tuple[str, Interval]) -> CandleBuffer:
+        return self.buffers[key]
+
+    async def track(self, pairs: List[str], intervals: Iterable[Interval] = (Interval.I1,)):
+        """
+        Seed the candles of each pair for the given intervals, then subscribe to their
+        1 minute candles.
+
+        :param pairs: Websocket names of the pairs to track, e.g. "XBT/USD"
+        :param intervals: The intervals to keep candles for
+        """
+        intervals = sorted({Interval.I1, *intervals}, key=lambda interval: interval.value)
+        for pair in pairs:
+            for interval in intervals:
+                await self._seed(pair, interval)
+            minutes = self.buffers[pair, Interval.I1].window()
+            aggregates = self._aggregates[pair] = []
+            for interval in intervals[1:]:
+                aggregate = _Aggregate(self.buffers[pair, interval], interval)
+                aggregate.seed(minutes)
+                aggregates.append((interval, aggregate))
+        await self.api.subscribe_to_ohlc(pairs, Interval.I1)
+
+    async def untrack(self, pairs: List[str]):
+        """
+        Unsubscribe from the given pairs and stop updating their candles.
+        """
+        await self.api.unsubscribe_from_ohlc(pairs, Interval.I1)
+        for pair in pairs:
+            self._aggregates.pop(pair, None)
+            for key in [key for key in self.buffers if key[0] == pair]:
+                self.buffers.pop(key).flush()
+
+    async def handle(self, message: List[Any]):
+        """
+        Apply a 1 minute `ohlc` message to the candles of its pair.
+        """
+        pair = message[-1]
+        minutes = self.buffers.get((pair, Interval.I1))
+        if minutes is None or message[-2] != "ohlc-1":
+            return
+        _, end, *values = message[1]
+        minute = numpy.array([float(end) - 60, *map(float, values)])
+        previous = minutes.last
+        if minutes.upsert(minute) and previous is not None:
+            await self._closed(pair, Interval.I1, previous)
+        for interval, aggregate in self._aggregates.get(pair, ()):
+            if previous is not None and minute[TIME] > previous[TIME]:
+                aggregate.close_minute(previous)
+            if aggregate.update(minute) and len(aggregate.buffer) > 1:
+                await self._closed(pair, interval, aggregate.buffer.window(2)[0])
+
+    def flush(self):
+        """
+        Write all persisted candles to their files.
+        """
+        for buffer in self.buffers.values():
+            buffer.flush()
+
+    async def _closed(self, pair: str, interval: Interval, candle: numpy.ndarray):
+        if self.on_close is not None:
+            await self.on_close(pair, interval, candle)
+
+    async def _seed(self, pair: str, interval: Interval):
+        path = None
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory,
+                                f"{pair.replace('/', '')}-{interval.value}.candles")
+        buffer = self.buffers[pair, interval] = CandleBuffer(self.capacity, path)
+        last = buffer.last
+        # Only candles from the most recent stored one onwards are requested
+        since = int(last[TIME]) - 1 if last is not None else None
+        result = await self.rest.get_ohlc_data(pair.replace("/", ""), interval, since,
+                                               compact=True)
+        for row in zip(result.time, result.open, result.high, result.low, result.close,
+                       result.vwap, result.volume, result.count):
+            buffer.upsert(row)
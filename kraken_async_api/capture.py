@@ -0,0 +1,206 @@
+"""
+Capture of raw websocket frames, and replay of captured frames.
+
+:class:`FrameRecorder` appends each frame received by a websocket API, along
+with the monotonic time it was received at, to a capture file. Frames are
+buffered in memory and written by a background thread, so the receive loop
+never waits on the disk.
+
+:class:`ReplaySocket` reads a capture file through :mod:`mmap` and stands in for
+a :class:`WebSocketClientProtocol`, so captured frames can be fed through the
+dispatch path at their original pace, or as fast as possible to measure
+throughput without a network.
+
+A capture file starts with :data:`MAGIC`, followed by one record per frame: a
+header of the receive time in nanoseconds, the frame length and whether the
+frame is text, then the frame itself.
+"""
+import asyncio
+import mmap
+import queue
+import struct
+import threading
+import time
+from typing import Any, List, Optional, Union
+
+from websockets.exceptions import ConnectionClosedOK
+
+MAGIC = b"KRAKENWSCAP\x01"
+"""The first bytes of every capture file"""
+
+_RECORD = struct.Struct("<qI?")
+
+
+class FrameRecorder:
+    """
+    Appends frames to a capture file.
+
+    Frames are added to a buffer, which is handed to a background thread to be written
+    once it holds `buffer_size` bytes, or when :meth:`flush` is called.
+
+    Example: ::
+
+        >>> kraken.public.recorder = FrameRecorder("feed.capture")
+        >>> ...
+        >>> kraken.public.recorder.close()
+
+    :param path: The capture file, which is created or truncated
+    :param buffer_size: The number of bytes buffered before they are written
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 20):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.frames = 0
+        """The number of frames recorded"""
+        self._buffer = bytearray(MAGIC)
+        self._file = open(path, "wb")  # pylint: disable=consider-using-with
+        self._chunks: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write, name="frame-recorder", daemon=True)
+        self._writer.start()
+
+    def record(self, frame: Union[str, bytes], received: Optional[int] = None):
+        """
+        Add a frame to the capture.
+
+        :param frame: The frame as returned by `recv()`
+        :param received: The time the frame was received, from :func:`time.monotonic_ns`.
+            By default, the current time.
+        """
+        text = isinstance(frame, str)
+        data = frame.encode() if text else frame
+        buffer = self._buffer
+        buffer += _RECORD.pack(time.monotonic_ns() if received is None else received,
+                               len(data), text)
+        buffer += data
+        self.frames += 1
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Hand the buffered frames to the background thread to be written.
+        """
+        if self._buffer:
+            self._chunks.put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def close(self):
+        """
+        Write all buffered frames, wait for the background thread to finish and close the file.
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        self._chunks.put(None)
+        self._writer.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _write(self):
+        file, chunks = self._file, self._chunks
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            file.write(chunk)
+            if chunks.empty():
+                file.flush()
+
+
+class ReplaySocket:
+    """
+    Replays a capture file in place of a websocket connection.
+
+    Each call to :meth:`recv` returns the next captured frame. With a `speed`, frames
+    are returned at the pace they were received at, scaled by `speed`; otherwise they
+    are returned as fast as they are read. Once every frame has been returned,
+    :meth:`recv` raises :class:`ConnectionClosedOK`.
+
+    Payloads sent to the socket are kept in :attr:`sent` rather than sent anywhere.
+
+    Example: ::
+
+        >>> api = PublicWebSocketApi(callback, ReplaySocket("feed.capture"))
+        >>> api.start()
+        >>> await api.listening
+
+    :param path: The capture file to replay
+    :param speed: An optional multiple of the original pace to replay frames at
+    :param raw: Whether text frames are returned as bytes without being decoded, which
+        every codec in :mod:`kraken_async_api.codec` accepts
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = None, raw: bool = False):
+        self.path = path
+        self.speed = speed
+        self.raw = raw
+        self.sent: List[Any] = []
+        """Payloads passed to :meth:`send`"""
+        self.closed = False
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a capture file")
+        self._view = memoryview(self._map)
+        self._offset = len(MAGIC)
+        self._first: Optional[int] = None
+        self._started: Optional[int] = None
+
+    @property
+    def remaining(self) -> bool:
+        """Whether there are frames left to replay"""
+        return not self.closed and self._offset < len(self._map)
+
+    async def recv(self) -> Union[str, bytes]:
+        """
+        Return the next captured frame.
+
+        :raises ConnectionClosedOK: if there are no frames left or the socket is closed
+        """
+        if not self.remaining:
+            raise ConnectionClosedOK(None, None)
+        received, length, text = _RECORD.unpack_from(self._map, self._offset)
+        start = self._offset + _RECORD.size
+        self._offset = start + length
+        if self.speed is not None:
+            await self._wait_until(received)
+        data = self._view[start:start + length]
+        if text and not self.raw:
+            return str(data, "utf-8")
+        return bytes(data)
+
+    async def send(self, payload: Any):
+        """Keep a payload which would have been sent"""
+        self.sent.append(payload)
+
+    async def close(self):
+        """Stop replaying and release the capture file"""
+        if not self.closed:
+            self.closed = True
+            self._view.release()
+            self._map.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Union[str, bytes]:
+        try:
+            return await self.recv()
+        except ConnectionClosedOK:
+            raise StopAsyncIteration from None
+
+    async def _wait_until(self, received: int):
+        now = time.monotonic_ns()
+        if self._first is None:
+            self._first, self._started = received, now
+            return
+        delay = (received - self._first) / self.speed - (now - self._started)
+        if delay > 0:
+            await asyncio.sleep(delay / 1e9)
@@ -0,0 +1,88 @@
+"""
+JSON codecs used to encode payloads sent to, and decode messages received from, Kraken.
+
+The fastest installed codec is used by default. `orjson`_, `msgspec`_ and `ujson`_
+are supported, falling back to the standard library :mod:`json` module.
+
+All codecs decode directly from `bytes` or `str`, and encode to `str` as Kraken
+expects text websocket frames.
+
+.. _orjson: https://github.com/ijl/orjson
+.. _msgspec: https://github.com/jcrist/msgspec
+.. _ujson: https://github.com/ultrajson/ultrajson
+"""
+import importlib
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Union
+
+AUTO = "auto"
+"""Codec name selecting the fastest installed codec"""
+
+PREFERENCE = ("orjson", "msgspec", "ujson", "json")
+"""Codec names in the order they are tried when :data:`AUTO` is used"""
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    A pair of functions used to encode and decode JSON.
+    """
+    name: str
+    """The name of the library providing the codec"""
+
+    dumps: Callable[[Any], str]
+    """Encode an object to a JSON string"""
+
+    loads: Callable[[Union[str, bytes]], Any]
+    """Decode a JSON string or bytes"""
+
+
+def _json() -> Codec:
+    return Codec("json", json.dumps, json.loads)
+
+
+def _orjson() -> Codec:
+    orjson = importlib.import_module("orjson")
+    dumps = orjson.dumps
+    return Codec("orjson", lambda obj: dumps(obj).decode(), orjson.loads)
+
+
+def _msgspec() -> Codec:
+    msgspec_json = importlib.import_module("msgspec.json")
+    encode = msgspec_json.Encoder().encode
+    return Codec("msgspec", lambda obj: encode(obj).decode(), msgspec_json.Decoder().decode)
+
+
+def _ujson() -> Codec:
+    ujson = importlib.import_module("ujson")
+    return Codec("ujson", ujson.dumps, ujson.loads)
+
+
+_FACTORIES = {
+    "json": _json,
+    "orjson": _orjson,
+    "msgspec": _msgspec,
+    "ujson": _ujson,
+}
+
+
+def get_codec(name: str = AUTO) -> Codec:
+    """
+    Return the codec with the given name.
+
+    If `name` is :data:`AUTO`, the first installed codec in :data:`PREFERENCE` is returned.
+
+    :param name: One of "auto", "orjson", "msgspec", "ujson" or "json"
+    :raises ValueError: if the codec name is unknown
+    :raises ImportError: if the named codec is not installed
+    """
+    if name == AUTO:
+        for candidate in PREFERENCE:
+            try:
+                return _FACTORIES[candidate]()
+            except ImportError:
+                continue
+    if name not in _FACTORIES:
+        raise ValueError(f"Unknown codec '{name}'. Choose from {', '.join(_FACTORIES)} or {AUTO}.")
+    return _FACTORIES[name]()
@@ -2,6 +2,8 @@
 from dataclasses import dataclass
 from typing import Optional
 
+from kraken_async_api.ratelimit import Tier
+
 
 @dataclass
 class Config:
@@ -34,6 +36,82 @@ class Config:
     private_websocket_url: str = "wss://ws-auth.kraken.com"
     """Kraken Websocket URL for querying private endpoints"""
 
+    public_connections: int = 1
+    """
+    Number of public websocket connections to spread subscriptions across. If more than
+    one, :attr:`Kraken.public` is a :class:`ShardedPublicWebSocketApi`.
+    """
+
+    worker_processes: int = 0
+    """
+    If greater than 0, public websocket connections are run in this many worker processes,
+    which decode messages and send the results to :attr:`Kraken.public`, a
+    :class:`ProcessPublicWebSocketApi`. This takes precedence over :attr:`public_connections`.
+    """
+
+    worker_book_levels: int = 0
+    """
+    If greater than 0, worker processes maintain order books and send this many levels each
+    side after every update instead of forwarding book updates.
+    """
+
+    warm_up_http: bool = True
+    """
+    Whether :meth:`Kraken.connect` sends a request to the REST api while the websockets
+    connect, so that DNS resolution and the TLS handshake are done before the first REST call.
+    """
+
+    warm_up_connections: int = 1
+    """
+    Number of requests sent concurrently to warm up the HTTP session, each of which opens a
+    pooled connection that later REST calls reuse.
+    """
+
+    http_limit_per_host: int = 10
+    """
+    The maximum number of connections the HTTP session created by :class:`Kraken` opens to
+    the REST api. 0 means no limit.
+    """
+
+    http_dns_cache_ttl: Optional[int] = 300
+    """Seconds the REST api's address is cached for. None caches it forever."""
+
+    http_keepalive_timeout: float = 60
+    """Seconds an idle pooled connection is kept open to be reused"""
+
+    http_timeout: Optional[float] = 30
+    """Seconds after which a REST call is abandoned. None waits indefinitely."""
+
+    rate_limit: bool = True
+    """
+    Whether REST calls and websocket orders are delayed so that Kraken's rate limits,
+    given by :attr:`tier`, are not exceeded.
+    """
+
+    tier: Tier = Tier.STARTER
+    """The verification tier of the account, which determines its rate limits"""
+
+    nonce_file: Optional[str] = None
+    """
+    A file used to share the last nonce of private REST calls between processes using the
+    same API key. See :class:`NonceGenerator`.
+    """
+
+    metadata_ttl: float = 3600
+    """Seconds after which the asset and asset pair metadata cached by the REST api is reloaded"""
+
+    metrics: bool = False
+    """
+    Whether latency histograms and counters are recorded into :attr:`Kraken.metrics`.
+    See :class:`Metrics`.
+    """
+
+    json_codec: str = "auto"
+    """
+    JSON library used to encode and decode messages. One of "orjson", "msgspec", "ujson"
+    or "json". By default, the fastest installed library is used.
+    """
+
 
 @dataclass
 class BetaConfig(Config):
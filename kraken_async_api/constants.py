@@ -38,6 +38,7 @@ class Header:
     """
     API_KEY = "API-KEY"
     API_SIGN = "API-Sign"
+    CONTENT_TYPE = "Content-Type"
 
 
 class AssetClass(Enum):
@@ -0,0 +1,212 @@
+"""
+Routing of websocket messages to the handlers registered for them.
+
+Each frame received from a socket is decoded once by the :class:`Dispatcher`
+and passed to the handler registered for its channel and pair. Channels are
+named as they are subscribed to (`ticker`, `book`, `ohlc`, `ownTrades`, ...),
+and all messages sent as json objects (`subscriptionStatus`, `systemStatus`,
+`addOrderStatus`, ...) are routed to the :data:`EVENT` channel.
+
+Events replying to a request sent with a `reqid` also resolve the future
+registered for that `reqid` with :meth:`Dispatcher.expect`.
+
+If its :attr:`Dispatcher.metrics` are enabled, the time each message took to be
+delivered since its exchange timestamp, and the time its handler took, are
+recorded by channel.
+"""
+import asyncio
+import itertools
+import time
+from enum import Enum
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from kraken_async_api.codec import Codec, get_codec
+from kraken_async_api.metrics import Metrics
+
+EVENT = "event"
+"""Channel name used to register handlers for event messages"""
+
+HEARTBEAT = '{"event":"heartbeat"}'
+HEARTBEAT_BYTES = HEARTBEAT.encode()
+
+Handler = Callable[[Any], Coroutine]
+
+
+class Dispatcher:
+    """
+    Decodes websocket frames and routes them through a dispatch table keyed
+    by (channel name, pair).
+
+    A handler registered without a pair receives messages for every pair on
+    its channel which does not have a more specific handler. Messages that
+    match no handler are passed to :attr:`default`, if given.
+
+    Heartbeats are dropped before decoding.
+
+    :param default: The handler used for messages with no registered handler
+    :param codec: The codec used to decode frames. By default, the fastest installed codec.
+    """
+
+    def __init__(self, default: Optional[Handler] = None, codec: Optional[Codec] = None):
+        self.default: Optional[Handler] = default
+        self.codec: Codec = codec or get_codec()
+        self._handlers: Dict[Tuple[str, Optional[str]], Handler] = {}
+        self._channel_names: Dict[str, str] = {}
+        self._pending: Dict[int, Tuple[asyncio.Future, List[dict], int]] = {}
+        self._reqids = itertools.count(1)
+        self.metrics = Metrics()
+        """Delivery and handler latency by channel, recorded if enabled"""
+
+    def expect(self, count: int = 1) -> Tuple[int, asyncio.Future]:
+        """
+        Return a new `reqid` and a future resolved with the first event received with it.
+        The future is forgotten once it is done or cancelled.
+
+        :param count: If greater than 1, the future is instead resolved with a list of the
+            first `count` events received with the `reqid`, as Kraken replies to a
+            subscription with one event per pair. An error without a pair, which rejects the
+            whole request, resolves it at once.
+        """
+        reqid = next(self._reqids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[reqid] = (future, [], count)
+        future.add_done_callback(lambda _: self._pending.pop(reqid, None))
+        return reqid, future
+
+    def add_handler(self, channel: Union[Enum, str], handler: Handler,
+                    pair: Optional[str] = None):
+        """
+        Register a handler for all messages on a channel, or only those for a given pair.
+
+        Examples: ::
+
+            >>> self.add_handler(PublicSubscription.BOOK, on_book)
+            >>> self.add_handler("ticker", on_xbt_ticker, "XBT/USD")
+            >>> self.add_handler(EVENT, on_event)
+
+        :param channel: The channel name or subscription
+        :param handler: coroutine function called with each decoded message
+        :param pair: If given, only messages for this pair are sent to the handler
+        """
+        self._handlers[(self._key(channel), pair)] = handler
+
+    def chain_handler(self, channel: Union[Enum, str], handler: Handler,
+                      pair: Optional[str] = None):
+        """
+        Register a handler like :meth:`add_handler`, but if a handler is already registered
+        for the channel and pair, keep it and call the new handler after it. Otherwise the
+        messages are still passed to :attr:`default` first, as they were before.
+        """
+        key = (self._key(channel), pair)
+        previous = self._handlers.get(key)
+        self._handlers[key] = _chain(previous or self._call_default, handler)
+
+    async def _call_default(self, message: Any):
+        # Looked up for each message, so the default can be replaced after chaining
+        default = self.default
+        if default is not None:
+            await default(message)
+
+    def remove_handler(self, channel: Union[Enum, str], pair: Optional[str] = None):
+        """
+        Remove the handler registered for the given channel and pair, if any.
+        """
+        self._handlers.pop((self._key(channel), pair), None)
+
+    async def dispatch(self, frame: Union[str, bytes]):
+        """
+        Decode a frame received from a websocket and route it to its handler.
+        """
+        if frame in (HEARTBEAT, HEARTBEAT_BYTES):
+            return
+        await self.route(self.codec.loads(frame))
+
+    async def route(self, message: Any):
+        """
+        Route an already decoded message to its handler.
+        """
+        if self._pending and isinstance(message, dict):
+            pending = self._pending.get(message.get("reqid"))
+            if pending is not None and not pending[0].done():
+                self._reply(pending, message)
+        channel, pair = self.channel_of(message)
+        handlers = self._handlers
+        handler = handlers.get((channel, pair)) or handlers.get((channel, None)) or self.default
+        if handler is None:
+            return
+        if self.metrics.enabled:
+            await self._handle_measured(handler, message, channel)
+        else:
+            await handler(message)
+
+    async def _handle_measured(self, handler: Handler, message: Any, channel: str):
+        metrics = self.metrics
+        metrics.increment("messages", channel)
+        sent_at = _exchange_time(channel, message)
+        if sent_at is not None:
+            metrics.observe("delivery", channel, time.time() - sent_at)
+        started = time.perf_counter()
+        try:
+            await handler(message)
+        finally:
+            metrics.observe("handler", channel, time.perf_counter() - started)
+
+    @staticmethod
+    def _reply(pending: Tuple[asyncio.Future, List[dict], int], message: dict):
+        future, replies, count = pending
+        if count == 1:
+            future.set_result(message)
+            return
+        replies.append(message)
+        rejected = message.get("status") == "error" and "pair" not in message
+        if rejected or len(replies) == count:
+            future.set_result(replies)
+
+    def channel_of(self, message: Any) -> Tuple[str, Optional[str]]:
+        """
+        Return the (channel name, pair) a decoded message belongs to.
+
+        Public channel messages end with the channel name and pair, for example
+        `[chanID, data, "book-10", "XBT/USD"]`. Private channel messages are of the
+        form `[data, "ownTrades", {"sequence": 1}]`.
+        """
+        if isinstance(message, dict):
+            return EVENT, message.get("pair")
+        if isinstance(message[-1], str):
+            return self._channel_name(message[-2]), message[-1]
+        return self._channel_name(message[1]), None
+
+    def _channel_name(self, name: str) -> str:
+        # Channels subscribed to with options are named e.g. "book-10" or "ohlc-5"
+        base = self._channel_names.get(name)
+        if base is None:
+            base = self._channel_names[name] = name.split("-", 1)[0]
+        return base
+
+    @staticmethod
+    def _key(channel: Union[Enum, str]) -> str:
+        return channel.value if isinstance(channel, Enum) else channel
+
+
+def _exchange_time(channel: str, message: Any) -> Optional[float]:
+    """Return the latest exchange timestamp in a public channel message, if it has one"""
+    try:
+        if channel == "book":
+            return max(float(level[2]) for update in message[1:-2] for side in update.values()
+                       if isinstance(side, list) for level in side)
+        if channel == "trade":
+            return float(message[1][-1][2])
+        if channel == "spread":
+            return float(message[1][2])
+        if channel == "ohlc":
+            return float(message[1][0])
+    except (IndexError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _chain(first: Handler, second: Handler) -> Handler:
+    async def handle(message: Any):
+        await first(message)
+        await second(message)
+    return handle
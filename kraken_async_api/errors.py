@@ -0,0 +1,70 @@
+"""
+Errors returned by the Kraken REST API.
+
+Kraken reports errors as strings of the form `<severity><category>:<message>`,
+for example `EAPI:Rate limit exceeded`. A response containing any error of
+severity `E` is raised as a :class:`KrakenError`, or the subclass matching the
+first error.
+"""
+from typing import List, Optional
+
+
+class KrakenError(Exception):
+    """
+    Raised when a Kraken REST call returns errors.
+
+    The severity, category and message of the first error are available as
+    attributes, and all errors returned are given by :attr:`errors`.
+    """
+
+    def __init__(self, errors: List[str]):
+        super().__init__(", ".join(errors))
+        self.errors = errors
+        """All error strings returned by Kraken"""
+        category, _, message = errors[0].partition(":")
+        self.severity: str = category[:1]
+        """The severity of the first error, "E" for an error or "W" for a warning"""
+        self.category: str = category[1:]
+        """The category of the first error, such as API, Order or General"""
+        self.message: str = message
+        """The message of the first error, such as 'Rate limit exceeded'"""
+
+
+class RateLimitError(KrakenError):
+    """Raised when a call exceeds one of Kraken's rate limits"""
+
+
+class InvalidNonceError(KrakenError):
+    """Raised when the nonce of a private call is not greater than the last nonce used"""
+
+
+class AuthenticationError(KrakenError):
+    """Raised when the API-Key or API-Sign of a private call is rejected"""
+
+
+class OrderError(KrakenError):
+    """Raised when an order is rejected"""
+
+
+_BY_ERROR = {
+    "EAPI:Rate limit exceeded": RateLimitError,
+    "EOrder:Rate limit exceeded": RateLimitError,
+    "EGeneral:Too many requests": RateLimitError,
+    "EAPI:Invalid nonce": InvalidNonceError,
+    "EAPI:Invalid key": AuthenticationError,
+    "EAPI:Invalid signature": AuthenticationError,
+    "EGeneral:Permission denied": AuthenticationError,
+}
+
+
+def error_for(errors: List[str]) -> Optional[KrakenError]:
+    """
+    Return the exception for a list of Kraken errors, or None if it only contains warnings.
+    """
+    if not any(error.startswith("E") for error in errors):
+        return None
+    first = next(error for error in errors if error.startswith("E"))
+    error_type = _BY_ERROR.get(first)
+    if error_type is None:
+        error_type = OrderError if first.startswith("EOrder:") else KrakenError
+    return error_type([first] + [error for error in errors if error != first])
@@ -4,14 +4,23 @@ The entrypoint to the high level API.
 :class:`Kraken` manages authentication and provides an API to send all
 public and private Websocket messages supported by the Kraken exchange.
 """
-from typing import Callable, Coroutine, Any
+import asyncio
+from functools import partial
+from typing import Callable, Coroutine, Any, Optional, Union, List
 
 from aiohttp import ClientSession
 from websockets.legacy.client import connect, WebSocketClientProtocol
 
+from kraken_async_api.codec import get_codec
 from kraken_async_api.config import Config
+from kraken_async_api.dispatch import Dispatcher, Handler
+from kraken_async_api.metrics import Metrics
+from kraken_async_api.pool import PoolStats, create_session
+from kraken_async_api.ratelimit import PairRateLimiter, MATCHING_ENGINE_LIMITS
 from kraken_async_api.rest import PublicRestApi, PrivateRestApi
-from kraken_async_api.websocket import PublicWebSocketApi, PrivateWebSocketApi
+from kraken_async_api.sharding import ShardedPublicWebSocketApi
+from kraken_async_api.workers import ProcessPublicWebSocketApi
+from kraken_async_api.websocket import PublicWebSocketApi, PrivateWebSocketApi, Subscription
 
 
 class Kraken:
@@ -24,6 +33,10 @@ class Kraken:
     `Kraken.public` and `Kraken.private` attributes. Messages can be sent via
     method calls, and messages received are passed to the client via asynchronous callbacks.
 
+    Received messages are decoded once and routed to the handler registered for their
+    channel and pair with :meth:`Kraken.add_handler`. Messages without a handler are
+    passed to the `async_callback`.
+
     Access to public REST endpoints are done through `Kraken.public_rest`, which can
     be used for one off querying of public exchange data. `Kraken.private_rest` can be
     used for performing authentication. REST calls are executed asynchronously, and awaiting
@@ -31,29 +44,74 @@ class Kraken:
 
     It is recommended to prefer websockets for communicating with the exchange over
     REST calls.
+
+    If a websocket connection is lost, it is reopened with jittered exponential backoff
+    and its subscriptions are replayed. Reconnection metrics are available from
+    `Kraken.public.reconnect_stats` and `Kraken.private.reconnect_stats`. With several
+    public connections, those of all connections are added together; with
+    :attr:`Config.worker_processes`, public reconnections happen in the workers and
+    `Kraken.public.reconnect_stats` is None.
+
+    If :attr:`Config.metrics` is set, the latency of REST calls, signing, token fetches and
+    message delivery is recorded in `Kraken.metrics`.
     """
 
     def __init__(self,
                  async_callback: Callable,
-                 public_websocket: WebSocketClientProtocol,
-                 private_websocket: WebSocketClientProtocol,
+                 public_websocket: Optional[Union[WebSocketClientProtocol,
+                                                  List[WebSocketClientProtocol]]],
+                 private_websocket: Optional[WebSocketClientProtocol],
                  config: Config,
                  http_session: ClientSession = None) -> None:
 
+        self.config = config
         self._http_session = http_session
         self.created_client_session = False
+        self.pool_stats: Optional[PoolStats] = None
+        """Connection pool counters of the HTTP session, if it was created by this instance"""
         if self._http_session is None:
             # if no ClientSession is given to the instance, then open one and close it on
             # Kraken.close()
-            self._http_session = ClientSession()
+            self.pool_stats = PoolStats()
+            self._http_session = create_session(config, self.pool_stats)
             self.created_client_session = True
 
         self.public_rest = PublicRestApi(self._http_session, config)
         self.private_rest = PrivateRestApi(self._http_session, config)
 
-        self.public = PublicWebSocketApi(async_callback, public_websocket)
+        self.dispatcher = Dispatcher(async_callback, get_codec(config.json_codec))
+        public_connector = partial(connect, config.public_websocket_url)
+        if config.worker_processes > 0:
+            self.public = ProcessPublicWebSocketApi(
+                config.public_websocket_url, self.dispatcher, config.worker_processes,
+                config.json_codec, config.worker_book_levels)
+        elif isinstance(public_websocket, list) or config.public_connections > 1:
+            sockets = public_websocket or [None] * config.public_connections
+            self.public = ShardedPublicWebSocketApi(
+                [PublicWebSocketApi(None, socket, self.dispatcher, public_connector)
+                 for socket in sockets], self.dispatcher)
+        else:
+            self.public = PublicWebSocketApi(None, public_websocket, self.dispatcher,
+                                             public_connector)
+        order_limiter = PairRateLimiter(MATCHING_ENGINE_LIMITS[config.tier]) \
+            if config.rate_limit else None
+        # Public subscriptions accept REST names and altnames as well as websocket names
+        self.public.pair_resolver = self.public_rest.metadata.wsnames
         self.private = PrivateWebSocketApi(self.private_rest.get_ws_token,
-                                           async_callback, private_websocket)
+                                           None, private_websocket, self.dispatcher,
+                                           partial(connect, config.private_websocket_url),
+                                           order_limiter)
+        self.private.metadata = self.public_rest.metadata
+
+        self.metrics = Metrics(config.metrics)
+        """Latency histograms and counters of the REST and websocket APIs"""
+        for component in (self.public_rest, self.private_rest, self.dispatcher,
+                          self.private.token_manager):
+            component.metrics = self.metrics
+        self.metrics.register("ws_request", "private", self.private.request_latency)
+        for label, rest in (("public", self.public_rest), ("private", self.private_rest)):
+            if rest.rate_limiter is not None:
+                self.metrics.register("rate_limit_wait", label, rest.rate_limiter.wait_time)
 
     @classmethod
     async def connect(cls,
@@ -66,27 +124,78 @@ class Kraken:
         Providing a config is optional. If not provided, default options will be used,
         and private endpoints will not be accessible.
 
-        :param async_callback: the callback to use when messages are pushed to a websocket
+        The public websocket handshakes are run concurrently with fetching a websocket
+        token and warming up the HTTP session's connection (see :attr:`Config.warm_up_http`).
+        The private websocket is only opened here if an API key and secret are configured;
+        otherwise it is opened when first used.
+
+        :param async_callback: the callback receiving decoded messages which have no handler
         :param config: the Config object used to connect to the exchange
         :param http_session: The optional http session used to send REST calls
         :return: an instance of the Kraken API
         """
         config = config or Config()
+        kraken = cls(async_callback, None, None, config, http_session)
+        await kraken._start()
+        return kraken
+
+    async def _start(self):
+        connecting = [self.public.ensure_connected()]
+        # Failures to prefetch are not fatal, as the token is fetched again when first used
+        prefetching = []
+        if self.config.api_key is not None and self.config.api_sec is not None:
+            connecting.append(self.private.ensure_connected())
+            prefetching.append(self.private.token_manager.refresh())
+        if self.config.warm_up_http:
+            prefetching.append(self.public_rest.warm_up(self.config.warm_up_connections))
+
+        results = await asyncio.gather(*connecting, *prefetching, return_exceptions=True)
+        for result in results[:len(connecting)]:
+            if isinstance(result, BaseException):
+                # Nothing is returned to close, so the session and token timer are closed here
+                await self.close()
+                raise result
+
+    def add_handler(self, channel: Union[Subscription, str], handler: Handler,
+                    pair: Optional[str] = None):
+        """
+        Register a handler for decoded messages on a channel, or for a single pair on
+        that channel. Use :data:`EVENT` as the channel to handle event messages such as
+        `subscriptionStatus` or `addOrderStatus`.
+
+        Example: ::
 
-        public_websocket = await connect(config.public_websocket_url)
-        private_websocket = await connect(config.private_websocket_url)
+            >>> kraken.add_handler(PublicSubscription.BOOK, on_book)
+            >>> kraken.add_handler(PublicSubscription.TICKER, on_xbt_ticker, "XBT/USD")
 
-        return cls(async_callback, public_websocket, private_websocket, config, http_session)
+        :param channel: The channel name or subscription
+        :param handler: coroutine function called with each decoded message
+        :param pair: If given, only messages for this pair are sent to the handler
+        """
+        self.dispatcher.add_handler(channel, handler, pair)
+
+    def chain_handler(self, channel: Union[Subscription, str], handler: Handler,
+                      pair: Optional[str] = None):
+        """
+        Register a handler to be called after any handler already registered for the
+        channel and pair, rather than replacing it.
+        """
+        self.dispatcher.chain_handler(channel, handler, pair)
+
+    def remove_handler(self, channel: Union[Subscription, str], pair: Optional[str] = None):
+        """
+        Remove a handler registered with :meth:`add_handler`.
+        """
+        self.dispatcher.remove_handler(channel, pair)
 
     async def set_callback(self, async_callback: Callable[[Any], Coroutine]):
         """
-        Update the callback provided to the websocket clients. Messages will continue
-        to be received but will be sent to the new callback.
+        Update the callback receiving messages which have no registered handler. Messages
+        will continue to be received but will be sent to the new callback.
 
         :param async_callback: The new asynchronous callback for the websocket clients to use
         """
-        for socket in [self.public, self.private]:
-            socket.async_callback = async_callback
+        self.dispatcher.default = async_callback
 
     async def close(self):
         """
@@ -95,10 +204,8 @@ class Kraken:
         if self.created_client_session:
             await self._http_session.close()
 
-        if self.public.listening:
-            self.public.listening.cancel()
-        if self.private.listening:
-            self.private.listening.cancel()
+        self.private.token_manager.close()
+        self.private_rest.nonce.close()
 
-        await self.public.socket.close()
-        await self.private.socket.close()
+        await self.public.close()
+        await self.private.close()
@@ -0,0 +1,214 @@
+"""
+Download historical trades and spreads.
+
+Kraken returns history one page at a time, along with a `last` cursor to pass
+as `since` to get the next page. :func:`iter_pages` follows the cursor and
+yields each page as columns, so only one page is held in memory at a time.
+
+:func:`backfill` downloads the history of many pairs concurrently, paced by the
+rate limiter of the :class:`PublicRestApi`, and appends each page to a
+:class:`NpyColumnWriter`. Progress can be saved to a :class:`Checkpoint` so that
+an interrupted backfill resumes where it stopped.
+"""
+import asyncio
+import json
+import os
+import sys
+from enum import Enum
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Union
+
+from kraken_async_api.records import SpreadColumns, TradeColumns
+from kraken_async_api.rest import PublicRestApi
+
+
+class History(Enum):
+    """Endpoints history can be downloaded from"""
+    TRADES = "Trades"
+    SPREADS = "Spread"
+
+
+async def iter_pages(api: PublicRestApi, pair: str, history: History = History.TRADES,
+                     since: Optional[Union[int, str]] = None,
+                     until: Optional[float] = None
+                     ) -> AsyncIterator[Union[TradeColumns, SpreadColumns]]:
+    """
+    Yield pages of history for a pair as :class:`TradeColumns` or :class:`SpreadColumns`,
+    until there is no more data or the data reaches `until`.
+
+    :param api: The API used to request each page
+    :param pair: Asset pair to get data for
+    :param history: The endpoint to get data from
+    :param since: The cursor to start from, either a previous `last` value or an
+        epoch timestamp (given in seconds)
+    :param until: An epoch timestamp (given in seconds) to stop at
+    """
+    if history is History.TRADES:
+        get_page = api.get_recent_trades
+    else:
+        get_page = api.get_recent_spreads
+    while True:
+        page = await get_page(pair, since, compact=True)
+        if not page.time:
+            return
+        yield page
+        if str(page.last) == str(since) or (until is not None and page.time[-1] >= until):
+            return
+        since = page.last
+
+
+_HEADER_LENGTH = 128
+_BYTE_ORDER = "<" if sys.byteorder == "little" else ">"
+_KINDS = {"d": "f", "q": "i"}
+
+
+class NpyColumnWriter:
+    """
+    Appends columns to one NumPy `.npy` file per column in a directory.
+
+    Each file has a header of fixed length which is rewritten with the number of rows on
+    :meth:`flush`, so files are valid after every flush and can be opened with
+    :func:`numpy.load`, including with `mmap_mode`. NumPy is not needed to write them.
+
+    :param directory: The directory to write files to, which is created if necessary
+    :param rows: The number of rows already written to existing files. Any rows after
+        these are discarded, so that a resumed download does not duplicate data.
+    """
+
+    def __init__(self, directory: str, rows: int = 0):
+        self.directory = directory
+        self.rows = rows
+        """The number of rows written to each file"""
+        self._files = {}
+        self._descriptors: Dict[str, str] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, columns: NamedTuple):
+        """
+        Append a page of columns. The `last` cursor of the page is not written.
+
+        :raises ValueError: if the columns do not all have the same number of rows
+        """
+        data_columns = {name: column for name, column in columns._asdict().items()
+                        if name != "last"}
+        lengths = {len(column) for column in data_columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different numbers of rows: {sorted(lengths)}")
+        for name, column in data_columns.items():
+            if isinstance(column, str):
+                data, descriptor, size = column.encode(), "|S1", 1
+            else:
+                data, size = column, column.itemsize
+                descriptor = f"{_BYTE_ORDER}{_KINDS[column.typecode]}{size}"
+            file = self._files.get(name) or self._open(name, descriptor, size)
+            file.write(data)
+        self.rows += lengths.pop() if lengths else 0
+
+    def flush(self):
+        """
+        Update the header of every file with the number of rows and flush it to disk.
+        """
+        for name, file in self._files.items():
+            position = file.tell()
+            file.seek(0)
+            file.write(self._header(self._descriptors[name]))
+            file.seek(position)
+            file.flush()
+
+    def close(self):
+        """
+        Flush and close every file.
+        """
+        self.flush()
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _open(self, name: str, descriptor: str, size: int):
+        path = os.path.join(self.directory, name + ".npy")
+        self._descriptors[name] = descriptor
+        if self.rows and os.path.exists(path):
+            file = open(path, "r+b")  # pylint: disable=consider-using-with
+            file.truncate(_HEADER_LENGTH + self.rows * size)
+            file.seek(0, os.SEEK_END)
+        else:
+            file = open(path, "w+b")  # pylint: disable=consider-using-with
+            file.write(self._header(descriptor))
+        self._files[name] = file
+        return file
+
+    def _header(self, descriptor: str) -> bytes:
+        header = f"{{'descr': '{descriptor}', 'fortran_order': False, 'shape': ({self.rows},), }}"
+        header = header.ljust(_HEADER_LENGTH - 11) + "\n"
+        return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode()
+
+
+class Checkpoint:
+    """
+    The progress of a backfill for each pair, saved to a JSON file.
+
+    :param path: The file to load progress from and save it to
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.progress: Dict[str, dict] = {}
+        """The `since` cursor and number of rows written for each pair"""
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.progress = json.load(file)
+
+    def save(self, pair: str, since: Union[int, str], rows: int):
+        """
+        Record the progress of a pair and save all progress to the file.
+        """
+        self.progress[pair] = {"since": since, "rows": rows}
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.progress, file)
+        # Replacing the file is atomic, so the checkpoint is never left half written
+        os.replace(temporary, self.path)
+
+
+async def backfill(api: PublicRestApi, pairs: List[str], directory: str,
+                   history: History = History.TRADES, since: Optional[Union[int, str]] = None,
+                   until: Optional[float] = None, checkpoint: Optional[Checkpoint] = None,
+                   concurrency: int = 4) -> Dict[str, int]:
+    """
+    Download the history of several pairs concurrently, writing the columns of each pair
+    to `<directory>/<pair>/<history>/` with a :class:`NpyColumnWriter`.
+
+    If a checkpoint is given, its progress is saved after every page and pairs it has
+    progress for resume from where they stopped.
+
+    :param api: The API used to request pages, whose rate limiter paces the download
+    :param pairs: Asset pairs to get data for
+    :param directory: The directory to write files to
+    :param history: The endpoint to get data from
+    :param since: An epoch timestamp (given in seconds) to start from
+    :param until: An epoch timestamp (given in seconds) to stop at
+    :param checkpoint: The checkpoint to resume from and save progress to
+    :param concurrency: The maximum number of pairs downloaded at once
+    :return: The number of rows written for each pair
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def download(pair: str) -> int:
+        progress = checkpoint.progress.get(pair) if checkpoint else None
+        start, rows = (progress["since"], progress["rows"]) if progress else (since, 0)
+        async with semaphore:
+            path = os.path.join(directory, pair, history.value.lower())
+            with NpyColumnWriter(path, rows) as writer:
+                async for page in iter_pages(api, pair, history, start, until):
+                    writer.write(page)
+                    writer.flush()
+                    if checkpoint is not None:
+                        checkpoint.save(pair, page.last, writer.rows)
+                return writer.rows
+
+    return dict(zip(pairs, await asyncio.gather(*(download(pair) for pair in pairs))))
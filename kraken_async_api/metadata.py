@@ -0,0 +1,172 @@
+"""
+Cached asset and asset pair metadata.
+
+Kraken names each pair in three ways: its REST name (`XXBTZGBP`), its
+alternative name (`XBTGBP`) and its websocket name (`XBT/GBP`).
+:class:`MetadataCache` loads every pair once and indexes it by all three names,
+so converting between them is a dictionary lookup. Each :class:`PairInfo` also
+provides the scaling between prices and volumes and integer ticks and lots.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+_logger = logging.getLogger(__name__)
+
+
+class PairInfo:
+    """
+    The metadata of an asset pair needed to name it and to scale its prices and volumes.
+
+    :param name: The REST name of the pair
+    :param info: The pair's entry in the result of :meth:`PublicRestApi.get_asset_pairs`
+    """
+    __slots__ = ("name", "altname", "wsname", "base", "quote", "pair_decimals",
+                 "lot_decimals", "price_scale", "volume_scale", "ordermin", "tick_size", "info")
+
+    def __init__(self, name: str, info: Dict[str, Any]):
+        self.name = name
+        self.altname: str = info["altname"]
+        self.wsname: str = info.get("wsname", info["altname"])
+        self.base: str = info["base"]
+        self.quote: str = info["quote"]
+        self.pair_decimals: int = info["pair_decimals"]
+        """Number of decimal places of the pair's prices"""
+        self.lot_decimals: int = info["lot_decimals"]
+        """Number of decimal places of the pair's volumes"""
+        self.price_scale: int = 10 ** self.pair_decimals
+        """The number of ticks in one unit of the quote asset"""
+        self.volume_scale: int = 10 ** self.lot_decimals
+        """The number of lots in one unit of the base asset"""
+        self.ordermin: Optional[str] = info.get("ordermin")
+        self.tick_size: Optional[str] = info.get("tick_size")
+        self.info = info
+        """The pair's full entry in the asset pairs result"""
+
+    def to_ticks(self, price) -> int:
+        """Return a price, given as a string or number, as an integer number of ticks"""
+        return round(float(price) * self.price_scale)
+
+    def to_lots(self, volume) -> int:
+        """Return a volume, given as a string or number, as an integer number of lots"""
+        return round(float(volume) * self.volume_scale)
+
+    def format_price(self, ticks: int) -> str:
+        """Return a number of ticks as a price string with the pair's decimal places"""
+        return format_scaled(ticks, self.pair_decimals)
+
+    def format_volume(self, lots: int) -> str:
+        """Return a number of lots as a volume string with the pair's decimal places"""
+        return format_scaled(lots, self.lot_decimals)
+
+    def __repr__(self):
+        return f"PairInfo({self.name!r}, wsname={self.wsname!r})"
+
+
+def format_scaled(units: int, decimals: int) -> str:
+    """
+    Return an integer scaled by 10 ** `decimals` as a decimal string with `decimals`
+    decimal places.
+    """
+    if not decimals:
+        return str(units)
+    sign = "-" if units < 0 else ""
+    whole, fraction = divmod(abs(units), 10 ** decimals)
+    return f"{sign}{whole}.{fraction:0{decimals}d}"
+
+
+class MetadataCache:
+    """
+    Loads all assets and asset pairs, and reloads them once they are older than `ttl`.
+
+    Lookups by name never await; :meth:`load` must have been awaited first. Concurrent
+    loads share a single pair of REST calls.
+
+    Example: ::
+
+        >>> await kraken.public_rest.metadata.load()
+        >>> kraken.public_rest.metadata.pair("XBTGBP").wsname
+        'XBT/GBP'
+
+    :param fetch_pairs: coroutine function returning the result of the AssetPairs endpoint
+    :param fetch_assets: coroutine function returning the result of the Assets endpoint
+    :param ttl: Seconds after which the metadata is reloaded
+    """
+
+    def __init__(self, fetch_pairs: Callable[[], Coroutine],
+                 fetch_assets: Callable[[], Coroutine], ttl: float = 3600):
+        self._fetch_pairs = fetch_pairs
+        self._fetch_assets = fetch_assets
+        self.ttl = ttl
+        self.pairs: Dict[str, PairInfo] = {}
+        """Every pair, keyed by REST name"""
+        self.assets: Dict[str, Dict[str, Any]] = {}
+        """Every asset, keyed by name, as given by the Assets endpoint"""
+        self.loaded_at: Optional[float] = None
+        """Monotonic time at which the metadata was last loaded"""
+        self._index: Dict[str, PairInfo] = {}
+        self._pending: Optional[asyncio.Future] = None
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the metadata has been loaded within `ttl` seconds"""
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def load(self, force: bool = False):
+        """
+        Load the metadata if it has not been loaded, is older than `ttl` or `force` is set.
+        """
+        if self.fresh and not force:
+            return
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._load())
+            self._pending.add_done_callback(self._clear_pending)
+        await asyncio.shield(self._pending)
+
+    def pair(self, name: str) -> PairInfo:
+        """
+        Return a pair given by its REST name, altname or websocket name.
+
+        :raises KeyError: if no pair has the name
+        """
+        return self._index[name]
+
+    def wsname(self, name: str) -> str:
+        """Return the websocket name of a pair given by any of its names"""
+        return self._index[name].wsname
+
+    def rest_name(self, name: str) -> str:
+        """Return the REST name of a pair given by any of its names"""
+        return self._index[name].name
+
+    async def wsnames(self, names: Optional[List[str]]) -> Optional[List[str]]:
+        """
+        Return the websocket names of pairs given by any of their names. The metadata is
+        only loaded if a name is neither known nor a websocket name (containing "/"), and
+        if loading fails, names which cannot be converted are returned unchanged, so that
+        subscribing does not depend on the REST API.
+        """
+        if names is None:
+            return None
+        index = self._index
+        if any(name not in index and "/" not in name for name in names):
+            try:
+                await self.load()
+            except Exception as error:  # pylint: disable=broad-except
+                _logger.warning("Could not load pair metadata to convert %s: %r", names, error)
+            index = self._index
+        return [index[name].wsname if name in index else name for name in names]
+
+    async def _load(self):
+        pairs, assets = await asyncio.gather(self._fetch_pairs(), self._fetch_assets())
+        self.pairs = {name: PairInfo(name, info) for name, info in pairs.items()}
+        index = {}
+        for info in self.pairs.values():
+            index[info.name] = index[info.altname] = index[info.wsname] = info
+        self._index = index
+        self.assets = assets
+        self.loaded_at = time.monotonic()
+
+    def _clear_pending(self, _):
+        self._pending = None
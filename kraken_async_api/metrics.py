@@ -0,0 +1,207 @@
+"""
+Lightweight metrics recorded by the library.
+
+:class:`LatencyHistogram` records durations into logarithmic buckets, in the
+style of an HDR histogram, so that recording is O(1) and percentiles can be
+read with a bounded relative error.
+
+:class:`Metrics` is a registry of histograms and counters, labelled by endpoint
+or channel, which the REST and websocket APIs record into when it is enabled.
+When disabled, each instrumented call only checks :attr:`Metrics.enabled`.
+"""
+import math
+from typing import Callable, Dict, Optional, Tuple
+
+
+class LatencyHistogram:
+    """
+    A histogram of durations with a bounded relative error.
+
+    Durations are recorded in microseconds. Values below 2 ** `precision_bits`
+    microseconds are recorded exactly; larger values are recorded into buckets
+    whose width is a fixed fraction (2 ** -(`precision_bits` - 1)) of their value.
+
+    :param precision_bits: Number of significant bits kept for each value
+    """
+
+    def __init__(self, precision_bits: int = 5):
+        self._bits = precision_bits
+        self._half = 1 << (precision_bits - 1)
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        """Number of recorded values"""
+        self.total = 0.0
+        """Sum of all recorded values in seconds"""
+        self.min: Optional[float] = None
+        """Smallest recorded value in seconds"""
+        self.max: Optional[float] = None
+        """Largest recorded value in seconds"""
+
+    def record(self, seconds: float):
+        """
+        Record a duration given in seconds.
+        """
+        value = max(int(seconds * 1e6), 0)
+        exponent = value.bit_length() - self._bits
+        if exponent <= 0:
+            index = value
+        else:
+            index = exponent * self._half + (value >> exponent)
+        counts = self._counts
+        counts[index] = counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> Optional[float]:
+        """The mean of all recorded values in seconds, or None if nothing has been recorded"""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Return the value in seconds below which `percent` percent of recorded values fall.
+
+        :param percent: A percentage between 0 and 100
+        """
+        if not self.count:
+            return None
+        target = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= target:
+                return self._lower_bound(index) / 1e6
+        return self.max
+
+    def merge(self, other: "LatencyHistogram"):
+        """
+        Add the values recorded by another histogram with the same precision to this one.
+        """
+        # pylint: disable=protected-access
+        if other._bits != self._bits:
+            raise ValueError("Only histograms with the same precision can be merged")
+        counts = self._counts
+        for index, count in other._counts.items():
+            counts[index] = counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                if self.min is None or value < self.min:
+                    self.min = value
+                if self.max is None or value > self.max:
+                    self.max = value
+
+    def reset(self):
+        """
+        Discard all recorded values.
+        """
+        self._counts.clear()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _lower_bound(self, index: int) -> int:
+        if index < 2 * self._half:
+            return index
+        exponent = index // self._half - 1
+        return (index - exponent * self._half) << exponent
+
+
+Exporter = Callable[[str, str, float], None]
+"""
+A function called with the name, label and value of every observation and counter
+increment, used to forward them to a metrics system such as Prometheus or OpenTelemetry.
+"""
+
+
+class Metrics:
+    """
+    Latency histograms and counters, each identified by a name and a label.
+
+    Histograms and counters are created when first recorded to. Instrumented code checks
+    :attr:`enabled` before taking any timings, so a disabled registry costs a single
+    attribute lookup per call.
+
+    Names recorded by the library:
+
+    - `rest` and `rest_errors`: REST calls by endpoint
+    - `sign`: signing of private REST calls by endpoint
+    - `token_fetch`: fetches of the websocket token
+    - `delivery`: time from the exchange timestamp of a message to its delivery, by channel
+    - `handler` and `messages`: handling of messages by channel
+
+    Example: ::
+
+        >>> kraken = await Kraken.connect(callback, Config(metrics=True))
+        >>> kraken.metrics.histograms["rest", "Ticker"].percentile(99)
+        >>> kraken.metrics.exporter = lambda name, label, value: ...
+
+    :param enabled: Whether instrumented code records into the registry
+    :param exporter: An optional function called with every recorded value
+    """
+
+    def __init__(self, enabled: bool = False, exporter: Optional[Exporter] = None):
+        self.enabled = enabled
+        self.exporter = exporter
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        """Histograms keyed by (name, label)"""
+        self.counters: Dict[Tuple[str, str], int] = {}
+        """Counters keyed by (name, label)"""
+
+    def observe(self, name: str, label: str, seconds: float):
+        """
+        Record a duration in the histogram for `name` and `label`.
+        """
+        histogram = self.histograms.get((name, label))
+        if histogram is None:
+            histogram = self.histograms[name, label] = LatencyHistogram()
+        histogram.record(seconds)
+        if self.exporter is not None:
+            self.exporter(name, label, seconds)
+
+    def increment(self, name: str, label: str, amount: int = 1):
+        """
+        Add `amount` to the counter for `name` and `label`.
+        """
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + amount
+        if self.exporter is not None:
+            self.exporter(name, label, amount)
+
+    def register(self, name: str, label: str, histogram: LatencyHistogram):
+        """
+        Add a histogram recorded elsewhere, such as :attr:`RateLimiter.wait_time`, so that
+        it is read along with the others. Registered histograms are recorded to even
+        when the registry is disabled, and are not passed to the exporter.
+        """
+        self.histograms[name, label] = histogram
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return the count, mean, 50th and 99th percentile and maximum of every histogram,
+        in seconds, and the value of every counter, keyed by "name:label".
+        """
+        summary = {}
+        for (name, label), histogram in self.histograms.items():
+            if histogram.count:
+                summary[f"{name}:{label}"] = {
+                    "count": histogram.count, "mean": histogram.mean,
+                    "p50": histogram.percentile(50), "p99": histogram.percentile(99),
+                    "max": histogram.max}
+        for (name, label), value in self.counters.items():
+            summary[f"{name}:{label}"] = {"count": value}
+        return summary
+
+    def reset(self):
+        """
+        Discard all recorded values.
+        """
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.counters.clear()
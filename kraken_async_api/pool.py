@@ -0,0 +1,133 @@
+"""
+Tuning and statistics of the HTTP connection pool used for REST calls.
+
+:func:`create_session` creates the :class:`ClientSession` used by :class:`Kraken`
+when none is given, with a connector configured by :class:`Config`, so that
+REST calls reuse kept-alive connections instead of each paying for a DNS lookup
+and TLS handshake.
+
+:class:`PoolStats` counts how connections are acquired through aiohttp's
+tracing hooks, and can be added to any session with :meth:`PoolStats.trace_config`.
+"""
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
+
+from kraken_async_api.config import Config
+
+
+@dataclass
+class PoolStats:
+    """
+    Counters describing how REST calls acquired their connections.
+    """
+    created: int = 0
+    """Number of connections opened"""
+
+    reused: int = 0
+    """Number of requests sent on a kept-alive connection"""
+
+    queued: int = 0
+    """Number of requests which waited for a connection because the pool was at its limit"""
+
+    awaiting_response: int = 0
+    """
+    Number of requests sent which have not yet received their response headers. A request
+    whose body is still being read is no longer counted, though it still holds its
+    connection; see :attr:`active` for the connections in use.
+    """
+
+    connector: Optional[TCPConnector] = field(default=None, repr=False)
+    """The connector of the session, used to count active and idle connections"""
+
+    @property
+    def reuse_rate(self) -> Optional[float]:
+        """The fraction of connections acquired which were reused, or None if there were none"""
+        acquired = self.created + self.reused
+        return self.reused / acquired if acquired else None
+
+    @property
+    def idle(self) -> int:
+        """
+        Number of open connections waiting in the pool to be reused.
+
+        This is best-effort: aiohttp does not expose its pool, so it is read from the
+        connector's private `_conns`, and is 0 if a version of aiohttp stores it otherwise.
+        """
+        if self.connector is None:
+            return 0
+        pool = getattr(self.connector, "_conns", {})
+        return sum(len(connections) for connections in pool.values())
+
+    @property
+    def active(self) -> int:
+        """
+        Number of connections acquired from the pool and not yet released, including those
+        of requests whose body is still being read.
+
+        Like :attr:`idle`, this is best-effort: it is read from the connector's private
+        `_acquired`, and is 0 if a version of aiohttp stores it otherwise.
+        """
+        if self.connector is None:
+            return 0
+        return len(getattr(self.connector, "_acquired", ()))
+
+    def trace_config(self) -> TraceConfig:
+        """
+        Return a :class:`TraceConfig` which updates these counters, to be passed in the
+        `trace_configs` of a :class:`ClientSession`.
+        """
+        config = TraceConfig()
+        config.on_connection_create_end.append(self._on_created)
+        config.on_connection_reuseconn.append(self._on_reused)
+        config.on_connection_queued_start.append(self._on_queued)
+        config.on_request_start.append(self._on_request_start)
+        config.on_request_end.append(self._on_request_end)
+        config.on_request_exception.append(self._on_request_end)
+        return config
+
+    async def _on_created(self, *_):
+        self.created += 1
+
+    async def _on_reused(self, *_):
+        self.reused += 1
+
+    async def _on_queued(self, *_):
+        self.queued += 1
+
+    async def _on_request_start(self, *_):
+        self.awaiting_response += 1
+
+    async def _on_request_end(self, *_):
+        self.awaiting_response -= 1
+
+
+def create_connector(config: Config) -> TCPConnector:
+    """
+    Create a connector with the limits, DNS cache and keep-alive given by the config.
+
+    The keep-alive is the time an idle connection is kept in the pool. aiohttp sets
+    TCP_NODELAY on client connections but not SO_KEEPALIVE, so a dead pooled connection
+    is only noticed when a request is sent on it.
+    """
+    return TCPConnector(limit_per_host=config.http_limit_per_host,
+                        ttl_dns_cache=config.http_dns_cache_ttl,
+                        keepalive_timeout=config.http_keepalive_timeout)
+
+
+def create_session(config: Config, stats: Optional[PoolStats] = None) -> ClientSession:
+    """
+    Create a session using a connector made by :func:`create_connector`, with the timeout
+    given by the config.
+
+    :param config: The config giving the connector's settings
+    :param stats: Optional counters updated as connections are acquired
+    """
+    connector = create_connector(config)
+    trace_configs = []
+    if stats is not None:
+        stats.connector = connector
+        trace_configs.append(stats.trace_config())
+    return ClientSession(connector=connector, trace_configs=trace_configs,
+                         timeout=ClientTimeout(total=config.http_timeout))
@@ -0,0 +1,258 @@
+"""
+Bounded queues between the receive loop and slow handlers.
+
+The receive loop of a websocket API awaits the handler of each message before
+reading the next frame, so a slow handler holds up every channel on the socket.
+:class:`QueuedHandler` wraps a handler so that messages are put on a bounded
+queue for each pair instead, and handled by a consumer task per queue. What
+happens when a queue is full is chosen by its :class:`Overflow` policy.
+
+Example: ::
+
+    >>> handler = QueuedHandler(on_ticker, maxsize=1, overflow=Overflow.CONFLATE)
+    >>> kraken.public.add_handler(PublicSubscription.TICKER, handler)
+    >>> handler.stats["XBT/USD"].dropped
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from kraken_async_api.dispatch import Handler
+from kraken_async_api.metrics import LatencyHistogram
+
+Merge = Callable[[Any, Any], Optional[Any]]
+
+
+class Overflow(Enum):
+    """What a :class:`MessageQueue` does with a message when it is full"""
+    BLOCK = "block"
+    """Wait for space, which holds up the receive loop until the consumer catches up"""
+    DROP_OLDEST = "drop_oldest"
+    """Discard the oldest queued message"""
+    CONFLATE = "conflate"
+    """
+    Merge the message into the newest queued message, so only the latest state is kept.
+    A book snapshot which cannot be merged replaces the queued messages instead, and any
+    other message which cannot be merged waits for space, so no state is lost.
+    """
+
+
+@dataclass
+class QueueStats:
+    """
+    Counters describing how a :class:`MessageQueue` has handled its messages.
+    """
+    received: int = 0
+    """Number of messages put on the queue"""
+
+    handled: int = 0
+    """Number of messages passed to the handler"""
+
+    dropped: int = 0
+    """Number of messages discarded because the queue was full"""
+
+    conflated: int = 0
+    """Number of messages merged into a queued message"""
+
+    errors: int = 0
+    """Number of messages the handler raised an exception for"""
+
+    lag: LatencyHistogram = field(default_factory=LatencyHistogram)
+    """Time messages spent on the queue before being handled"""
+
+
+def is_book_snapshot(message: Any) -> bool:
+    """
+    Return whether a message is a `book` snapshot, which replaces the whole book.
+    """
+    return isinstance(message, list) and isinstance(message[-1], str) \
+        and message[-2].startswith("book") \
+        and any("as" in data or "bs" in data for data in message[1:-2])
+
+
+STATE_CHANNELS = ("ticker", "spread", "ohlc")
+"""Channels whose messages each replace the state given by the previous message"""
+
+
+def merge_messages(queued: Any, message: Any) -> Optional[Any]:
+    """
+    The default merge of :data:`Overflow.CONFLATE`. Book updates are combined into a
+    single update, in which later levels replace earlier ones. On the
+    :data:`STATE_CHANNELS`, the newest message is kept. Book snapshots and every other
+    message, such as trades, orders and events, are not merged, so None is returned.
+    """
+    if not (isinstance(message, list) and isinstance(message[-1], str)
+            and isinstance(queued, list) and queued[-2:] == message[-2:]):
+        return None
+    channel = message[-2]
+    if channel.startswith("book"):
+        return merge_book_updates(queued, message)
+    if channel.split("-")[0] in STATE_CHANNELS:
+        return message
+    return None
+
+
+def merge_book_updates(queued: List[Any], message: List[Any]) -> Optional[List[Any]]:
+    """
+    Combine two `book` update messages into one, or return None if either is a snapshot.
+    The checksum of the combined update is that of the later message.
+    """
+    asks: List[Any] = []
+    bids: List[Any] = []
+    checksum = None
+    for update in queued[1:-2] + message[1:-2]:
+        if "as" in update or "bs" in update:
+            return None
+        asks.extend(update.get("a", ()))
+        bids.extend(update.get("b", ()))
+        checksum = update.get("c", checksum)
+    data: Dict[str, Any] = {"a": asks, "b": bids}
+    if checksum is not None:
+        data["c"] = checksum
+    return [message[0], data, message[-2], message[-1]]
+
+
+class MessageQueue:
+    """
+    A bounded queue of messages, handled in order by a consumer task.
+
+    The consumer task is started when the first message is put on the queue.
+
+    :param handler: coroutine function called with each message
+    :param maxsize: The number of messages the queue holds
+    :param overflow: What to do with a message when the queue is full
+    :param merge: Function combining a queued message with a newer one under
+        :data:`Overflow.CONFLATE`, returning None if they cannot be combined
+    """
+
+    def __init__(self, handler: Handler, maxsize: int = 100,
+                 overflow: Overflow = Overflow.BLOCK, merge: Merge = merge_messages):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.merge = merge
+        self.stats = QueueStats()
+        self._items: Deque[Tuple[float, Any]] = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._consumer: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        """The number of messages waiting to be handled"""
+        return len(self._items)
+
+    async def put(self, message: Any):
+        """
+        Put a message on the queue. This only waits while the queue is full, under
+        :data:`Overflow.BLOCK`, or under :data:`Overflow.CONFLATE` for a message which
+        cannot be merged.
+        """
+        items, stats = self._items, self.stats
+        stats.received += 1
+        if self.overflow is Overflow.CONFLATE and items:
+            merged = self.merge(items[-1][1], message)
+            if merged is not None:
+                items[-1] = (items[-1][0], merged)
+                stats.conflated += 1
+                return
+        while len(items) >= self.maxsize:
+            if self.overflow is Overflow.DROP_OLDEST:
+                items.popleft()
+                stats.dropped += 1
+            elif self.overflow is Overflow.CONFLATE and is_book_snapshot(message):
+                # A snapshot supersedes everything queued before it
+                stats.dropped += len(items)
+                items.clear()
+            else:
+                self._space.clear()
+                await self._space.wait()
+        items.append((time.monotonic(), message))
+        self._ready.set()
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.ensure_future(self._consume())
+
+    def close(self):
+        """
+        Stop the consumer task. Messages still queued are discarded.
+        """
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        self._items.clear()
+
+    async def _consume(self):
+        items, stats = self._items, self.stats
+        while True:
+            if not items:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            queued_at, message = items.popleft()
+            self._space.set()
+            stats.lag.record(time.monotonic() - queued_at)
+            try:
+                await self.handler(message)
+            except Exception as error:  # pylint: disable=broad-except
+                # One failing message must not stop the queue, so the error is passed to
+                # the event loop's exception handler, which logs it by default
+                stats.errors += 1
+                asyncio.get_running_loop().call_exception_handler({
+                    "message": "Queued message handler failed",
+                    "exception": error,
+                    "task": self._consumer,
+                })
+            stats.handled += 1
+
+
+class QueuedHandler:
+    """
+    A handler which puts each message on a :class:`MessageQueue` for its pair, so that
+    messages for different pairs are handled concurrently and a slow handler does not
+    hold up the receive loop.
+
+    :param handler: coroutine function called with each message
+    :param maxsize: The number of messages each queue holds
+    :param overflow: What each queue does with a message when it is full
+    :param merge: Function combining messages under :data:`Overflow.CONFLATE`
+    """
+
+    def __init__(self, handler: Handler, maxsize: int = 100,
+                 overflow: Overflow = Overflow.BLOCK, merge: Merge = merge_messages):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.merge = merge
+        self.queues: Dict[Optional[str], MessageQueue] = {}
+        """The queue of each pair, or of None for messages without a pair"""
+
+    @property
+    def stats(self) -> Dict[Optional[str], QueueStats]:
+        """The counters of each pair's queue"""
+        return {pair: queue.stats for pair, queue in self.queues.items()}
+
+    async def __call__(self, message: Any):
+        pair = _pair_of(message)
+        queue = self.queues.get(pair)
+        if queue is None:
+            queue = self.queues[pair] = MessageQueue(self.handler, self.maxsize,
+                                                     self.overflow, self.merge)
+        await queue.put(message)
+
+    def close(self):
+        """
+        Stop every queue's consumer task.
+        """
+        for queue in self.queues.values():
+            queue.close()
+
+
+def _pair_of(message: Any) -> Optional[str]:
+    if isinstance(message, dict):
+        return message.get("pair")
+    if isinstance(message[-1], str):
+        return message[-1]
+    return None
@@ -0,0 +1,196 @@
+"""
+Client-side pacing of calls to match Kraken's rate limits.
+
+Kraken keeps a call counter for each API key, which is increased by the cost of
+each call and decays at a rate given by the account's verification tier. Calls
+made while the counter is above its maximum are rejected with
+`EAPI:Rate limit exceeded`, and repeated violations lock the key out for a
+while. :class:`RateLimiter` keeps a local copy of the counter and delays calls
+until they can be made without exceeding it.
+
+Orders have a separate counter per pair, kept by the matching engine, which is
+modelled by :class:`PairRateLimiter`.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass
+from enum import Enum, IntEnum
+from typing import Dict, List, Optional, Tuple
+
+from kraken_async_api.metrics import LatencyHistogram
+
+
+class Tier(Enum):
+    """Kraken account verification tiers, which determine the rate limits of an account"""
+    STARTER = "starter"
+    INTERMEDIATE = "intermediate"
+    PRO = "pro"
+
+
+class Priority(IntEnum):
+    """
+    Order in which waiting calls are made once the counter allows. Lower values go first.
+    """
+    ORDER = 0
+    NORMAL = 1
+    HISTORY = 2
+
+
+@dataclass(frozen=True)
+class CounterLimit:
+    """
+    The maximum value of a call counter, and the rate at which it decays per second.
+    """
+    maximum: float
+    decay: float
+
+
+REST_LIMITS = {
+    Tier.STARTER: CounterLimit(15, 0.33),
+    Tier.INTERMEDIATE: CounterLimit(20, 0.5),
+    Tier.PRO: CounterLimit(20, 1),
+}
+"""Limits of the private REST API call counter for each tier"""
+
+MATCHING_ENGINE_LIMITS = {
+    Tier.STARTER: CounterLimit(60, 1),
+    Tier.INTERMEDIATE: CounterLimit(125, 2.34),
+    Tier.PRO: CounterLimit(180, 3.75),
+}
+"""Limits of the per-pair order counter kept by the matching engine for each tier"""
+
+PUBLIC_LIMIT = CounterLimit(15, 1)
+"""Limit of the public REST API, which allows roughly one call per second per IP address"""
+
+_ORDER_ENDPOINTS = ("AddOrder", "AddOrderBatch", "EditOrder", "CancelOrder", "CancelOrderBatch",
+                    "CancelAll", "CancelAllOrdersAfter")
+_HISTORY_ENDPOINTS = ("Ledgers", "QueryLedgers", "TradesHistory", "ClosedOrders",
+                      "QueryTrades", "OHLC", "Trades", "Spread")
+
+ENDPOINTS: Dict[str, Tuple[int, Priority]] = {
+    **{endpoint: (0, Priority.ORDER) for endpoint in _ORDER_ENDPOINTS},
+    **{endpoint: (1, Priority.HISTORY) for endpoint in _HISTORY_ENDPOINTS},
+    "Ledgers": (2, Priority.HISTORY),
+    "QueryLedgers": (2, Priority.HISTORY),
+    "TradesHistory": (2, Priority.HISTORY),
+}
+"""
+The cost and priority of REST endpoints. Other endpoints cost 1 at :attr:`Priority.NORMAL`.
+Order endpoints cost nothing, as they are counted by the matching engine instead.
+"""
+
+
+def cost_of(endpoint: str) -> Tuple[int, Priority]:
+    """
+    Return the cost and priority of a REST endpoint, given by its path with any query string.
+    """
+    return ENDPOINTS.get(endpoint.partition("?")[0], (1, Priority.NORMAL))
+
+
+class RateLimiter:
+    """
+    A call counter which decays over time, used as a token bucket.
+
+    :meth:`acquire` returns immediately if the cost of a call fits under the
+    maximum of the counter and no other calls are waiting. Otherwise, the call
+    waits in a queue ordered by priority, then by arrival.
+
+    :param limit: The maximum and decay rate of the counter
+    """
+
+    def __init__(self, limit: CounterLimit):
+        self.limit = limit
+        self.counter = 0.0
+        """The value of the counter when it was last updated"""
+        self.wait_time = LatencyHistogram()
+        """Time spent waiting by calls which could not be made immediately"""
+        self._updated = time.monotonic()
+        self._queue: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of calls waiting to be made"""
+        return sum(1 for *_, future in self._queue if not future.done())
+
+    async def acquire(self, cost: float = 1, priority: Priority = Priority.NORMAL):
+        """
+        Wait until a call of the given cost can be made, and add its cost to the counter.
+
+        :param cost: The amount the call increases the counter by
+        :param priority: The priority of the call relative to other waiting calls
+        """
+        self._decay()
+        if not self._queue and self._fits(cost):
+            self.counter += cost
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), cost, future))
+        started = time.monotonic()
+        self._wake()
+        await future
+        self.wait_time.record(time.monotonic() - started)
+
+    def _fits(self, cost: float) -> bool:
+        # A call costing more than the maximum can still be made from an empty counter
+        return self.counter + cost <= self.limit.maximum or self.counter <= 0
+
+    def _decay(self):
+        now = time.monotonic()
+        self.counter = max(0.0, self.counter - (now - self._updated) * self.limit.decay)
+        self._updated = now
+
+    def _wake(self):
+        if self._wake_handle is not None:
+            self._wake_handle.cancel()
+            self._wake_handle = None
+        self._decay()
+        queue = self._queue
+        while queue:
+            _, _, cost, future = queue[0]
+            if future.done():
+                # The waiting call was cancelled
+                heapq.heappop(queue)
+            elif self._fits(cost):
+                heapq.heappop(queue)
+                self.counter += cost
+                future.set_result(None)
+            else:
+                break
+        if queue:
+            excess = self.counter + queue[0][2] - self.limit.maximum
+            self._wake_handle = asyncio.get_running_loop().call_later(
+                max(excess, 0) / self.limit.decay, self._wake)
+
+
+class PairRateLimiter:
+    """
+    Rate limiters for orders, one for each pair, as kept by the matching engine.
+
+    :param limit: The maximum and decay rate of each pair's counter
+    """
+
+    def __init__(self, limit: CounterLimit):
+        self.limit = limit
+        self.limiters: Dict[str, RateLimiter] = {}
+        """The rate limiter of each pair orders have been sent for"""
+
+    async def acquire(self, pair: str, cost: float = 1):
+        """
+        Wait until an order for `pair` can be sent.
+
+        :param pair: The pair of the order
+        :param cost: The amount the order increases the pair's counter by
+        """
+        limiter = self.limiters.get(pair)
+        if limiter is None:
+            limiter = self.limiters[pair] = RateLimiter(self.limit)
+        await limiter.acquire(cost, Priority.ORDER)
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of orders waiting to be sent across all pairs"""
+        return sum(limiter.queue_depth for limiter in self.limiters.values())
@@ -0,0 +1,78 @@
+"""
+Support for reconnecting websockets after the connection is lost.
+"""
+import random
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from kraken_async_api.metrics import LatencyHistogram
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter.
+
+    Each delay is drawn uniformly from the upper half of the current backoff
+    window, which doubles (by `factor`) after every attempt up to `maximum`.
+
+    :param initial: The first backoff window in seconds
+    :param maximum: The largest backoff window in seconds
+    :param factor: The factor the window grows by after each attempt
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 30.0, factor: float = 2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempts = 0
+
+    def next(self) -> float:
+        """
+        Return the delay in seconds before the next attempt.
+        """
+        window = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return window / 2 + random.uniform(0, window / 2)
+
+    def reset(self):
+        """
+        Reset the backoff window after a successful attempt.
+        """
+        self.attempts = 0
+
+
+@dataclass
+class ReconnectStats:
+    """
+    Metrics describing the reconnections of a websocket.
+    """
+    reconnects: int = 0
+    """Number of times the websocket has been reconnected"""
+
+    failed_attempts: int = 0
+    """Number of connection attempts which failed while reconnecting"""
+
+    reconnect_latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    """Time from the connection being lost to subscriptions being replayed"""
+
+    gap_duration: LatencyHistogram = field(default_factory=LatencyHistogram)
+    """Time between the last message before a disconnection and the first message after it"""
+
+    last_disconnect: Optional[float] = None
+    """Monotonic time at which the connection was last lost"""
+
+    @classmethod
+    def combined(cls, stats: Iterable["ReconnectStats"]) -> "ReconnectStats":
+        """
+        Return the stats of several websockets added together, with the latest disconnection.
+        """
+        total = cls()
+        for item in stats:
+            total.reconnects += item.reconnects
+            total.failed_attempts += item.failed_attempts
+            total.reconnect_latency.merge(item.reconnect_latency)
+            total.gap_duration.merge(item.gap_duration)
+            if item.last_disconnect is not None and (
+                    total.last_disconnect is None or item.last_disconnect > total.last_disconnect):
+                total.last_disconnect = item.last_disconnect
+        return total
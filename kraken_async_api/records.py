@@ -0,0 +1,117 @@
+"""
+Compact, typed representations of REST results.
+
+Endpoints returning rows of values (OHLC, trades, spreads and order books)
+can return their result as columns of :class:`array.array`, rather than lists
+of lists of strings. Columns can be wrapped without copying by libraries
+supporting the buffer protocol, e.g. :func:`numpy.frombuffer`.
+"""
+from array import array
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+
+def _columns(rows: List[List[Any]], width: int) -> Tuple[tuple, ...]:
+    if not rows:
+        return ((),) * width
+    return tuple(zip(*rows))[:width]
+
+
+def _float(values) -> array:
+    return array("d", map(float, values))
+
+
+def _int(values) -> array:
+    return array("q", map(int, values))
+
+
+def _pair_rows(result: Dict[str, Any]) -> List[List[Any]]:
+    return next(value for key, value in result.items() if key != "last")
+
+
+class OhlcColumns(NamedTuple):
+    """OHLC candles as columns, as returned by :meth:`PublicRestApi.get_ohlc_data`"""
+    time: array
+    open: array
+    high: array
+    low: array
+    close: array
+    vwap: array
+    volume: array
+    count: array
+    last: int
+    """The `since` value to use to poll for new, committed data"""
+
+    @classmethod
+    def from_result(cls, result: Dict[str, Any]) -> "OhlcColumns":
+        """Build columns from the result of the OHLC endpoint"""
+        time, open_, high, low, close, vwap, volume, count = _columns(_pair_rows(result), 8)
+        return cls(_int(time), _float(open_), _float(high), _float(low), _float(close),
+                   _float(vwap), _float(volume), _int(count), int(result["last"]))
+
+
+class TradeColumns(NamedTuple):
+    """Trades as columns, as returned by :meth:`PublicRestApi.get_recent_trades`"""
+    price: array
+    volume: array
+    time: array
+    side: str
+    """One character per trade, "b" for buy or "s" for sell"""
+    order_type: str
+    """One character per trade, "m" for market or "l" for limit"""
+    trade_id: array
+    """The ID of each trade, or -1 for trades returned without one"""
+    last: str
+    """The `since` value to use to poll for new trade data"""
+
+    @classmethod
+    def from_result(cls, result: Dict[str, Any]) -> "TradeColumns":
+        """Build columns from the result of the Trades endpoint"""
+        rows = _pair_rows(result)
+        if rows and len(rows[0]) < 7:
+            # Older responses do not include the trade ID
+            price, volume, time, side, order_type, _ = _columns(rows, 6)
+            trade_id = (-1,) * len(rows)
+        else:
+            price, volume, time, side, order_type, _, trade_id = _columns(rows, 7)
+        return cls(_float(price), _float(volume), _float(time), "".join(side),
+                   "".join(order_type), _int(trade_id), str(result["last"]))
+
+
+class SpreadColumns(NamedTuple):
+    """Spreads as columns, as returned by :meth:`PublicRestApi.get_recent_spreads`"""
+    time: array
+    bid: array
+    ask: array
+    last: int
+    """The `since` value to use to poll for new spread data"""
+
+    @classmethod
+    def from_result(cls, result: Dict[str, Any]) -> "SpreadColumns":
+        """Build columns from the result of the Spread endpoint"""
+        time, bid, ask = _columns(_pair_rows(result), 3)
+        return cls(_int(time), _float(bid), _float(ask), int(result["last"]))
+
+
+class BookColumns(NamedTuple):
+    """One side of an order book as columns"""
+    price: array
+    volume: array
+    time: array
+
+    @classmethod
+    def from_levels(cls, levels: List[List[Any]]) -> "BookColumns":
+        """Build columns from a list of [price, volume, timestamp] levels"""
+        price, volume, time = _columns(levels, 3)
+        return cls(_float(price), _float(volume), _int(time))
+
+
+class OrderBookColumns(NamedTuple):
+    """An order book as columns, as returned by :meth:`PublicRestApi.get_order_book`"""
+    asks: BookColumns
+    bids: BookColumns
+
+    @classmethod
+    def from_result(cls, result: Dict[str, Any]) -> "OrderBookColumns":
+        """Build columns from the result of the Depth endpoint"""
+        book = next(iter(result.values()))
+        return cls(BookColumns.from_levels(book["asks"]), BookColumns.from_levels(book["bids"]))
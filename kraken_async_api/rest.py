@@ -5,23 +5,61 @@ This library does not provide
 
 .. _specification (1.0.0): https://docs.kraken.com/rest/
 """
-import base64
-import hashlib
-import hmac
+import asyncio
 import time
-import urllib
-from typing import List, Optional, Union
+import urllib.parse
+from typing import Any, Dict, List, Optional, Union
 
 from aiohttp import ClientSession
 
+from kraken_async_api.auth import NonceGenerator, Signer
+from kraken_async_api.codec import get_codec
 from kraken_async_api.config import Config
 from kraken_async_api.constants import Interval, Header, AssetClass, InfoType
+from kraken_async_api.errors import error_for, KrakenError, RateLimitError, InvalidNonceError, \
+    AuthenticationError
+from kraken_async_api.metadata import MetadataCache
+from kraken_async_api.metrics import Metrics
+from kraken_async_api.ratelimit import RateLimiter, CounterLimit, PUBLIC_LIMIT, REST_LIMITS, cost_of
+from kraken_async_api.records import OhlcColumns, OrderBookColumns, SpreadColumns, TradeColumns
+
+MAX_PAIRS_PER_QUERY = 100
+"""The number of pairs comma-joined into one query by the batch methods of the public API"""
+
+_FORM = "application/x-www-form-urlencoded"
+_JSON = "application/json"
+
+MAX_ADD_ORDER_BATCH = 15
+"""The maximum number of orders in one call to AddOrderBatch"""
+
+MAX_CANCEL_ORDER_BATCH = 50
+"""The maximum number of orders in one call to CancelOrderBatch"""
+
+_FATAL_ERRORS = (RateLimitError, InvalidNonceError, AuthenticationError)
+
+
+def _endpoint(path: str) -> str:
+    # "/0/public/Ticker?pair=XBTUSD" is labelled "Ticker"
+    return path.partition("?")[0].rpartition("/")[2]
 
 
 class _RestApi:
     def __init__(self, http_session: ClientSession, config: Optional[Config] = None):
         self.http_session = http_session
         self.config = config or Config()
+        self.codec = get_codec(self.config.json_codec)
+        self.rate_limiter: Optional[RateLimiter] = \
+            RateLimiter(self._limit()) if self.config.rate_limit else None
+        """Delays calls so that Kraken's rate limit is not exceeded, if enabled by the config"""
+        self.metrics = Metrics()
+        """Latency of calls by endpoint, recorded if enabled"""
+
+    def _limit(self) -> CounterLimit:
+        return PUBLIC_LIMIT
+
+    async def _throttle(self, endpoint: str):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(*cost_of(endpoint))
 
     async def get(self, path, **kwargs):
         """
@@ -30,9 +68,10 @@ class _RestApi:
 
         :param path: the path to append to the rest_url and perform the request to
         :param kwargs: keyword arguments passed to the ClientSession
-        :return: The result of the get call
+        :return: The decoded result of the get call
+        :raises KrakenError: if Kraken responds with an error
         """
-        return await self.http_session.get(self.config.rest_url + path, **kwargs)
+        return await self._request(self.http_session.get, path, **kwargs)
 
     async def post(self, path, **kwargs):
         """
@@ -41,21 +80,58 @@ class _RestApi:
 
         :param path: the path to append to the rest_url and perform the request to
         :param kwargs: keyword arguments passed to the ClientSession
-        :return: The result of the post call
+        :return: The decoded result of the post call
+        :raises KrakenError: if Kraken responds with an error
         """
-        res = await self.http_session.post(self.config.rest_url + path, **kwargs)
-        return await res.read()
+        return await self._request(self.http_session.post, path, **kwargs)
+
+    async def _request(self, method, path: str, **kwargs):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return self._result(await self._read(method, path, **kwargs))
+        endpoint = _endpoint(path)
+        started = time.perf_counter()
+        try:
+            return self._result(await self._read(method, path, **kwargs))
+        except KrakenError:
+            metrics.increment("rest_errors", endpoint)
+            raise
+        finally:
+            metrics.observe("rest", endpoint, time.perf_counter() - started)
+
+    async def _read(self, method, path: str, **kwargs) -> bytes:
+        response = await method(self.config.rest_url + path, **kwargs)
+        # The response is released even if reading fails, so its connection is not leaked
+        async with response:
+            return await response.read()
+
+    def _result(self, body: bytes):
+        data = self.codec.loads(body)
+        errors = data.get("error")
+        if errors:
+            error = error_for(errors)
+            if error is not None:
+                raise error
+        return data.get("result")
 
 
 class PublicRestApi(_RestApi):
     """
     All the publicly available endpoints according to the `Kraken specification`_
 
-    All get methods return the results of the call they have made.
+    All get methods return the decoded `result` of the call they have made, and raise a
+    :class:`KrakenError` if Kraken responds with an error. Endpoints returning rows of data
+    accept `compact=True` to return the result as typed columns instead.
 
     .. _Kraken specification: https://docs.kraken.com/rest/#operation/getTickerInformation
     """
 
+    def __init__(self, http_session: ClientSession, config: Optional[Config] = None):
+        super().__init__(http_session, config)
+        self.metadata = MetadataCache(self.get_asset_pairs, self.get_asset_info,
+                                      self.config.metadata_ttl)
+        """Cached asset and asset pair metadata, loaded with :meth:`MetadataCache.load`"""
+
     async def get_public_endpoint(self, path, **kwargs):
         """
         Send a get request to a public Kraken endpoint given by `path`. The `path` is
@@ -75,6 +151,7 @@ class PublicRestApi(_RestApi):
         :param path: The unique path to a Kraken endpoint
         :param kwargs: keyword arguments passed to the ClientSession
         """
+        await self._throttle(path)
         return await super().get(self.config.public_path + path, **kwargs)
 
     async def get_server_time(self):
@@ -83,6 +160,13 @@ class PublicRestApi(_RestApi):
         """
         return await self.get_public_endpoint("Time")
 
+    async def warm_up(self, connections: int = 1):
+        """
+        Send `connections` concurrent requests, so that as many connections are opened and
+        kept in the HTTP session's pool before the first REST call that needs one.
+        """
+        await asyncio.gather(*(self.get_server_time() for _ in range(connections)))
+
     async def get_system_status(self):
         """
         Get the current system status or trading mode.
@@ -144,8 +228,40 @@ class PublicRestApi(_RestApi):
         """
         return await self.get_public_endpoint(f"Ticker?pair={pair}")
 
+    async def get_tickers(self, pairs: List[str], chunk_size: int = MAX_PAIRS_PER_QUERY):
+        """
+        Get ticker information for many pairs. Pairs are comma-joined into queries of up to
+        `chunk_size` pairs, which are sent concurrently.
+
+        Examples: ::
+
+        >>> self.get_tickers(["XXBTZGBP", "XETHZUSD"])
+
+        :param pairs: Asset pairs to get data for
+        :param chunk_size: The maximum number of pairs in each query
+        :return: The ticker information of every pair, keyed by the pair as given in `pairs`
+            rather than as named in Kraken's results, as :meth:`get_order_books` is
+        """
+        chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+        results = await asyncio.gather(*(self.get_public_endpoint(f"Ticker?pair={','.join(chunk)}")
+                                         for chunk in chunks))
+        tickers = {}
+        for chunk, result in zip(chunks, results):
+            tickers.update(await self._by_given_pairs(chunk, result))
+        return tickers
+
+    async def _by_given_pairs(self, pairs: List[str], result: Dict[str, Any]) -> Dict[str, Any]:
+        """Re-key a result keyed by Kraken's names for `pairs` by the names in `pairs`"""
+        if len(pairs) == 1 and len(result) == 1:
+            return {pairs[0]: next(iter(result.values()))}
+        if any(pair not in result for pair in pairs):
+            # Kraken names results by REST name, so map other names back through the metadata
+            await self.metadata.load()
+        return {pair: result[pair if pair in result else self.metadata.rest_name(pair)]
+                for pair in pairs}
+
     async def get_ohlc_data(self, pair: str, interval: Interval = Interval.I1,
-                            since: Optional[int] = None):
+                            since: Optional[int] = None, compact: bool = False):
         """
         Get OHLC. Available interval options are given by :class:`Interval`.
 
@@ -157,13 +273,15 @@ class PublicRestApi(_RestApi):
         :param pair: Asset pair to get data for
         :param interval: Time frame interval in minutes
         :param since: data since a given epoch timestamp (given in seconds)
+        :param compact: If True, return the candles as :class:`OhlcColumns`
         """
         path = f"OHLC?pair={pair}&interval={interval.value}"
         if since:
             path += f"&since={since}"
-        return await self.get_public_endpoint(path)
+        result = await self.get_public_endpoint(path)
+        return OhlcColumns.from_result(result) if compact else result
 
-    async def get_order_book(self, pair: str, count: int = 100):
+    async def get_order_book(self, pair: str, count: int = 100, compact: bool = False):
         """
         Get order book for a given pair. Count can be any integer between 1 and 500.
 
@@ -174,27 +292,53 @@ class PublicRestApi(_RestApi):
 
         :param pair:  Asset pair to get data for
         :param count: maximum number of asks/bids.
+        :param compact: If True, return the book as :class:`OrderBookColumns`
+        """
+        result = await self.get_public_endpoint(f"Depth?pair={pair}&count={count}")
+        return OrderBookColumns.from_result(result) if compact else result
+
+    async def get_order_books(self, pairs: List[str], count: int = 100, compact: bool = False):
         """
-        return await self.get_public_endpoint(f"Depth?pair={pair}&count={count}")
+        Get the order books of many pairs. Kraken only accepts one pair for each order book,
+        so one request is sent for each pair, concurrently.
 
-    async def get_recent_trades(self, pair: str, since: Optional[Union[int, str]] = None):
+        :param pairs: Asset pairs to get data for
+        :param count: maximum number of asks/bids.
+        :param compact: If True, return each book as :class:`OrderBookColumns`
+        :return: The order book of every pair, keyed by the pair as given in `pairs`
+            rather than as named in Kraken's results
+        """
+        results = await asyncio.gather(*(self.get_order_book(pair, count, compact)
+                                          for pair in pairs))
+        if compact:
+            return dict(zip(pairs, results))
+        # Each result holds the one book requested, under Kraken's name for the pair
+        return {pair: next(iter(result.values())) for pair, result in zip(pairs, results)}
+
+    async def get_recent_trades(self, pair: str, since: Optional[Union[int, str]] = None,
+                                compact: bool = False):
         """
         Return the last trades of an asset pair. If the `since` parameter
         is not supplied, return the last 1000 trades.
 
         :param pair: Asset pair to get data for
         :param since: data since a given epoch timestamp (given in seconds)
+        :param compact: If True, return the trades as :class:`TradeColumns`
         """
-        return await self._get_recent("Trades", pair, since)
+        result = await self._get_recent("Trades", pair, since)
+        return TradeColumns.from_result(result) if compact else result
 
-    async def get_recent_spreads(self, pair: str, since: Optional[Union[int, str]] = None):
+    async def get_recent_spreads(self, pair: str, since: Optional[Union[int, str]] = None,
+                                 compact: bool = False):
         """
         Get recent spreads for a given asset pair.
 
         :param pair: Asset pair to get data for
         :param since: data since a given epoch timestamp (given in seconds)
+        :param compact: If True, return the spreads as :class:`SpreadColumns`
         """
-        return await self._get_recent("Spread", pair, since)
+        result = await self._get_recent("Spread", pair, since)
+        return SpreadColumns.from_result(result) if compact else result
 
     async def _get_recent(self, endpoint: str, pair: str, since: Optional[Union[int, str]]):
         path = f"{endpoint}?pair={pair}"
@@ -207,7 +351,8 @@ class PrivateRestApi(_RestApi):
     """
     All the privately available endpoints according to the `Kraken specification`_
 
-    All get methods return the results of the call they have made.
+    All methods return the decoded `result` of the call they have made, and raise a
+    :class:`KrakenError` if Kraken responds with an error.
 
     For successfully calling private endpoints, the
     :attr:`Config.api_key` and :attr:`Config.api_sec` must be provided within the :class:`Config`.
@@ -215,32 +360,241 @@ class PrivateRestApi(_RestApi):
     .. _Kraken specification: https://docs.kraken.com/rest/#operation/getTickerInformation
     """
 
+    def __init__(self, http_session: ClientSession, config: Optional[Config] = None):
+        super().__init__(http_session, config)
+        self.nonce = NonceGenerator(self.config.nonce_file)
+        """
+        Generates the nonce of each call. APIs sharing an API key in one process should
+        share a generator.
+        """
+        self._signer: Optional[Signer] = None
+
+    @property
+    def signer(self) -> Signer:
+        """The signer for :attr:`Config.api_sec`, which is replaced if the secret changes"""
+        if self._signer is None or self._signer.api_sec != self.config.api_sec:
+            self._signer = Signer(self.config.api_sec)
+        return self._signer
+
+    def _limit(self) -> CounterLimit:
+        return REST_LIMITS[self.config.tier]
+
     async def get_ws_token(self):
         """
         Send a post request to the Websockets Authentication endpoint
         """
         return await self.post_with_auth("GetWebSocketsToken")
 
-    async def _get_signature(self, url_path, data):
-        post_data = urllib.parse.urlencode(data)
-        encoded = (str(data['nonce']) + post_data).encode()
-        message = url_path.encode() + hashlib.sha256(encoded).digest()
-        mac = hmac.new(base64.b64decode(self.config.api_sec), message, hashlib.sha512)
-        sig_digest = base64.b64encode(mac.digest())
-        return sig_digest.decode()
+    async def get_account_balance(self):
+        """
+        Get all cash balances, net of pending withdrawals.
+        """
+        return await self.post_with_auth("Balance")
+
+    async def get_open_orders(self, trades: bool = False, userref: Optional[int] = None):
+        """
+        Get information about currently open orders.
+
+        :param trades: Whether or not to include trades related to position in output
+        :param userref: Restrict results to a given user reference id
+        """
+        return await self.post_with_auth("OpenOrders", _params(trades=trades, userref=userref))
+
+    async def get_closed_orders(self, trades: bool = False, userref: Optional[int] = None,
+                                start: Optional[int] = None, end: Optional[int] = None,
+                                ofs: Optional[int] = None, closetime: str = "both"):
+        """
+        Get information about orders that have been closed (filled or cancelled).
+        50 results are returned at a time, the most recent by default.
+
+        :param trades: Whether or not to include trades related to position in output
+        :param userref: Restrict results to a given user reference id
+        :param start: Starting unix timestamp or order tx ID of results (exclusive)
+        :param end: Ending unix timestamp or order tx ID of results (inclusive)
+        :param ofs: Result offset for pagination
+        :param closetime: Which time to use to search, "open", "close" or "both"
+        """
+        return await self.post_with_auth("ClosedOrders", _params(
+            trades=trades, userref=userref, start=start, end=end, ofs=ofs, closetime=closetime))
+
+    async def query_orders(self, txids: List[str], trades: bool = False):
+        """
+        Get information about specific orders.
+
+        :param txids: Transaction IDs of the orders to query, up to 50
+        :param trades: Whether or not to include trades related to position in output
+        """
+        return await self.post_with_auth("QueryOrders",
+                                         _params(txid=",".join(txids), trades=trades))
 
-    async def post_with_auth(self, path, **kwargs):
+    async def get_trades_history(self, trade_type: str = "all", trades: bool = False,
+                                 start: Optional[int] = None, end: Optional[int] = None,
+                                 ofs: Optional[int] = None):
+        """
+        Get information about trades. 50 results are returned at a time, the most recent
+        by default.
+
+        :param trade_type: Type of trade, e.g. "all" or "closed position"
+        :param trades: Whether or not to include trades related to position in output
+        :param start: Starting unix timestamp or trade tx ID of results (exclusive)
+        :param end: Ending unix timestamp or trade tx ID of results (inclusive)
+        :param ofs: Result offset for pagination
+        """
+        return await self.post_with_auth("TradesHistory", _params(
+            type=trade_type, trades=trades, start=start, end=end, ofs=ofs))
+
+    async def get_ledgers(self, assets: Optional[List[str]] = None, ledger_type: str = "all",
+                          start: Optional[int] = None, end: Optional[int] = None,
+                          ofs: Optional[int] = None):
+        """
+        Get information about ledger entries. 50 results are returned at a time, the most
+        recent by default.
+
+        :param assets: Assets to restrict output to, by default all assets
+        :param ledger_type: Type of ledger to retrieve, e.g. "all", "trade" or "deposit"
+        :param start: Starting unix timestamp or ledger ID of results (exclusive)
+        :param end: Ending unix timestamp or ledger ID of results (inclusive)
+        :param ofs: Result offset for pagination
+        """
+        return await self.post_with_auth("Ledgers", _params(
+            asset=",".join(assets) if assets else None, type=ledger_type, start=start,
+            end=end, ofs=ofs))
+
+    async def add_order(self, order_type: str, side: str, volume: str, pair: str,
+                        price: Optional[str] = None, **kwargs):
+        """
+        Place a new order. Further parameters from the specification, such as `price2`,
+        `leverage` or `oflags`, can be given as keyword arguments.
+
+        Examples: ::
+
+            >>> self.add_order("limit", "buy", "1.25", "XBTUSD", "27500.0")
+            >>> self.add_order("market", "sell", "0.5", "XBTUSD", validate=True)
+
+        :param order_type: Order type, e.g. "market" or "limit"
+        :param side: Order direction, "buy" or "sell"
+        :param volume: Order quantity in terms of the base asset
+        :param pair: Asset pair the order is for
+        :param price: Limit price for limit orders, or trigger price for stop orders
+        """
+        return await self.post_with_auth("AddOrder", _params(
+            ordertype=order_type, type=side, volume=volume, pair=pair, price=price, **kwargs))
+
+    async def add_order_batch(self, orders: List[dict], pair: str, **kwargs) -> List[dict]:
+        """
+        Place a list of orders for a single pair. The orders are sent in batches of up to
+        :data:`MAX_ADD_ORDER_BATCH`, one batch after another, so that their nonces reach
+        Kraken in order. A final batch of a single order is sent with :meth:`add_order`.
+
+        Each order is given as in the specification, e.g. ::
+
+            >>> self.add_order_batch([{"ordertype": "limit", "type": "buy", "volume": "1",
+            ...                        "price": "27500.0"}], "XBTUSD")
+
+        Further parameters, such as `deadline` or `validate`, can be given as keyword
+        arguments and apply to every batch.
+
+        :param orders: The orders to place
+        :param pair: Asset pair the orders are for
+        :return: The result of each order, in the same order as `orders`. Each result holds
+            the order's `txid` and `descr`, or an `error` if the order or its batch was
+            rejected.
+        """
+        results = []
+        for start in range(0, len(orders), MAX_ADD_ORDER_BATCH):
+            batch = orders[start:start + MAX_ADD_ORDER_BATCH]
+            try:
+                if len(batch) == 1:
+                    results.append(_batch_entry(await self.post_with_auth(
+                        "AddOrder", _params(pair=pair, **batch[0], **kwargs))))
+                else:
+                    result = await self.post_with_auth(
+                        "AddOrderBatch", {"orders": batch, "pair": pair, **kwargs})
+                    results.extend(result["orders"])
+            except _FATAL_ERRORS:
+                raise
+            except KrakenError as error:
+                results.extend({"error": str(error)} for _ in batch)
+        return results
+
+    async def edit_order(self, txid: str, pair: str, **kwargs):
+        """
+        Edit the volume and price of an open order. Parameters to change, such as `volume`
+        or `price`, are given as keyword arguments.
+
+        :param txid: Transaction ID or user reference of the order to edit
+        :param pair: Asset pair of the order
+        """
+        return await self.post_with_auth("EditOrder", _params(txid=txid, pair=pair, **kwargs))
+
+    async def cancel_order(self, txid: Union[str, int]):
+        """
+        Cancel an open order, or all open orders with a given user reference.
+
+        :param txid: Transaction ID or user reference of the order(s) to cancel
+        """
+        return await self.post_with_auth("CancelOrder", {"txid": txid})
+
+    async def cancel_order_batch(self, txids: List[Union[str, int]]) -> int:
+        """
+        Cancel a list of open orders. The orders are cancelled in batches of up to
+        :data:`MAX_CANCEL_ORDER_BATCH`, one batch after another.
+
+        :param txids: Transaction IDs or user references of the orders to cancel
+        :return: The number of orders cancelled
+        """
+        count = 0
+        for start in range(0, len(txids), MAX_CANCEL_ORDER_BATCH):
+            result = await self.post_with_auth(
+                "CancelOrderBatch", {"orders": txids[start:start + MAX_CANCEL_ORDER_BATCH]})
+            count += result["count"]
+        return count
+
+    async def post_with_auth(self, path, data: Optional[dict] = None, **kwargs):
         """
         Send a post request to a Kraken endpoint given by `path`, which will have the
         additional :attr:`Header.API_KEY` and :attr:`Header.API_SIGN` headers.
 
+        The body is form encoded, or JSON encoded if any value of `data` is a list or dict.
+
         :param path: The endpoint to send the request to
+        :param data: The parameters of the call, to which the nonce is added
+        :param kwargs: keyword arguments passed to the ClientSession
         """
         if self.config.api_key is None or self.config.api_sec is None:
             raise ConnectionError("Complete config has not been provided."
                                   " Please supply a Kraken API-KEY and API-SEC.")
-        data = {"nonce": str(int(1000 * time.time()))}
+        # The nonce is taken after waiting, so that calls reach Kraken in nonce order
+        await self._throttle(path)
+        nonce = str(await self.nonce.next_async())
+        # The body is encoded once, and the same string is signed and sent
+        body, content_type = self._encode({"nonce": nonce, **(data or {})})
         path = self.config.private_path + path
+        if self.metrics.enabled:
+            started = time.perf_counter()
+            signature = self.signer.sign(path, nonce, body)
+            self.metrics.observe("sign", _endpoint(path), time.perf_counter() - started)
+        else:
+            signature = self.signer.sign(path, nonce, body)
         headers = {Header.API_KEY: self.config.api_key,
-                   Header.API_SIGN: await self._get_signature(path, data)}
-        return await super().post(path, data=data, headers=headers, **kwargs)
+                   Header.API_SIGN: signature,
+                   Header.CONTENT_TYPE: content_type}
+        return await super().post(path, data=body, headers=headers, **kwargs)
+
+    def _encode(self, data: dict):
+        if any(isinstance(value, (list, dict)) for value in data.values()):
+            return self.codec.dumps(data), _JSON
+        return urllib.parse.urlencode({key: str(value).lower() if isinstance(value, bool)
+                                       else value for key, value in data.items()}), _FORM
+
+
+def _params(**params) -> dict:
+    return {key: value for key, value in params.items() if value is not None}
+
+
+def _batch_entry(result: dict) -> dict:
+    # AddOrder returns a list of txids, where each AddOrderBatch order has a single txid
+    entry = {key: value for key, value in result.items() if key != "txid"}
+    if result.get("txid"):
+        entry["txid"] = result["txid"][0]
+    return entry
@@ -0,0 +1,188 @@
+"""
+Public websocket subscriptions spread across a pool of connections.
+
+Each pair is placed on one connection (a shard) of a
+:class:`ShardedPublicWebSocketApi`, so that a slow stream or a burst of
+messages for some markets does not hold up the others. All shards share one
+:class:`Dispatcher`, so messages are handled the same way as with a single
+:class:`PublicWebSocketApi`.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from kraken_async_api.dispatch import Dispatcher
+from kraken_async_api.reconnect import ReconnectStats
+from kraken_async_api.websocket import Event, PublicWebSocketApi, SubscriptionType, \
+    _PublicChannels, _Dispatching, _SubscriptionKey
+
+
+class ShardedPublicWebSocketApi(_PublicChannels, _Dispatching):
+    """
+    A public websocket API which places pairs on the least loaded of several connections.
+
+    The load of a shard is the number of (pair, channel) subscriptions on it. New
+    pairs are placed on the least loaded shard, and all channels for a pair are
+    subscribed to on the same shard. After subscribing, pairs are moved between
+    shards if the loads differ by more than `tolerance`. Subscriptions without pairs
+    are sent on the first shard.
+
+    :param shards: The public websocket APIs to spread subscriptions across
+    :param dispatcher: The dispatcher shared by all shards
+    :param tolerance: The largest difference in load between shards left unbalanced
+    """
+
+    def __init__(self, shards: List[PublicWebSocketApi], dispatcher: Dispatcher,
+                 tolerance: int = 1):
+        self.shards = shards
+        self.dispatcher = dispatcher
+        self.tolerance = tolerance
+        self.placement: Dict[str, PublicWebSocketApi] = {}
+        """The shard each pair is subscribed to on"""
+        for shard in shards:
+            shard.dispatcher = dispatcher
+
+    def start(self):
+        """
+        Start the receive loop of every shard.
+        """
+        for shard in self.shards:
+            shard.start()
+
+    async def ensure_connected(self):
+        """
+        Open every shard's socket concurrently and start their receive loops.
+        """
+        await asyncio.gather(*(shard.ensure_connected() for shard in self.shards))
+
+    async def close(self):
+        """
+        Stop the receive loops and close every shard's socket.
+        """
+        await asyncio.gather(*(shard.close() for shard in self.shards))
+
+    @property
+    def subscriptions(self) -> Dict[_SubscriptionKey, Dict[str, Any]]:
+        """The subscriptions of all shards, keyed as in :attr:`PublicWebSocketApi.subscriptions`"""
+        return {key: options for shard in self.shards
+                for key, options in shard.subscriptions.items()}
+
+    @property
+    def reconnect_stats(self) -> ReconnectStats:
+        """The reconnection metrics of all shards added together"""
+        return ReconnectStats.combined(shard.reconnect_stats for shard in self.shards)
+
+    def load(self, shard: PublicWebSocketApi) -> int:
+        """
+        Return the number of (pair, channel) subscriptions on a shard.
+        """
+        return len(shard.subscriptions)
+
+    async def send(self, payload: dict):
+        """
+        Send a user constructed payload. Payloads with a "pair" list are split across
+        the shards the pairs are placed on; other payloads are sent on the first shard.
+        """
+        pairs = payload.get("pair")
+        if not pairs:
+            await self.shards[0].send(payload)
+            return
+        await asyncio.gather(*(shard.send({**payload, "pair": shard_pairs})
+                               for shard, shard_pairs in self._place(pairs).items()))
+
+    async def subscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        if pair is None:
+            await self.shards[0].subscribe(name, None, **kwargs)
+            return
+        await asyncio.gather(*(shard.subscribe(name, shard_pairs, **kwargs)
+                               for shard, shard_pairs in self._place(pair).items()))
+        await self.rebalance()
+
+    async def unsubscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        if pair is None:
+            await self.shards[0].unsubscribe(name, None, **kwargs)
+            return
+        by_shard = self._placed(pair)
+        await asyncio.gather(*(shard.unsubscribe(name, shard_pairs, **kwargs)
+                               for shard, shard_pairs in by_shard.items()))
+        self._forget_unsubscribed(by_shard)
+
+    async def request_subscription(self, event: Event, name: SubscriptionType,
+                                   pair: List[str] = None, **kwargs) -> List[dict]:
+        """
+        Subscribe or unsubscribe on the shards the pairs are placed on, and return the
+        `subscriptionStatus` events replying to the request from every shard.
+
+        :raises asyncio.TimeoutError: if not every reply is received within the
+            `request_timeout` of a shard
+        """
+        if pair is None:
+            return await self.shards[0].request_subscription(event, name, None, **kwargs)
+        by_shard = self._place(pair) if event is Event.SUBSCRIBE else self._placed(pair)
+        results = await asyncio.gather(
+            *(shard.request_subscription(event, name, shard_pairs, **kwargs)
+              for shard, shard_pairs in by_shard.items()), return_exceptions=True)
+        # Pairs which failed to subscribe are untracked by their shard, so are forgotten too
+        self._forget_unsubscribed(by_shard)
+        if event is Event.SUBSCRIBE:
+            await self.rebalance()
+        replies: List[dict] = []
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+            replies.extend(result)
+        return replies
+
+    async def rebalance(self):
+        """
+        Move pairs from the most to the least loaded shard while the difference in
+        their loads is greater than :attr:`tolerance` and a move would reduce it.
+        """
+        while True:
+            busiest = max(self.shards, key=self.load)
+            idlest = min(self.shards, key=self.load)
+            difference = self.load(busiest) - self.load(idlest)
+            if difference <= self.tolerance:
+                return
+            candidates = [pair for pair, shard in self.placement.items()
+                          if shard is busiest
+                          and len(self._subscriptions_of(busiest, pair)) < difference]
+            if not candidates:
+                return
+            await self._move(candidates[0], busiest, idlest)
+
+    async def _move(self, pair: str, source: PublicWebSocketApi,
+                    destination: PublicWebSocketApi):
+        self.placement[pair] = destination
+        for name, options in self._subscriptions_of(source, pair):
+            await destination.subscribe(name, [pair], **options)
+            await source.unsubscribe(name, [pair], **options)
+
+    def _place(self, pairs: List[str]) -> Dict[PublicWebSocketApi, List[str]]:
+        loads = {shard: self.load(shard) for shard in self.shards}
+        by_shard: Dict[PublicWebSocketApi, List[str]] = {}
+        for pair in pairs:
+            shard = self.placement.get(pair)
+            if shard is None:
+                shard = self.placement[pair] = min(loads, key=loads.get)
+            loads[shard] += 1
+            by_shard.setdefault(shard, []).append(pair)
+        return by_shard
+
+    def _placed(self, pairs: List[str]) -> Dict[PublicWebSocketApi, List[str]]:
+        by_shard: Dict[PublicWebSocketApi, List[str]] = {}
+        for pair in pairs:
+            shard: Optional[PublicWebSocketApi] = self.placement.get(pair)
+            if shard is not None:
+                by_shard.setdefault(shard, []).append(pair)
+        return by_shard
+
+    def _forget_unsubscribed(self, by_shard: Dict[PublicWebSocketApi, List[str]]):
+        for shard, shard_pairs in by_shard.items():
+            for pair in shard_pairs:
+                if self.placement.get(pair) is shard and not self._subscriptions_of(shard, pair):
+                    del self.placement[pair]
+
+    @staticmethod
+    def _subscriptions_of(shard: PublicWebSocketApi, pair: str):
+        return [(name, options) for (name, item, _), options in shard.subscriptions.items()
+                if item == pair]
@@ -0,0 +1,156 @@
+"""
+The latest ticker and spread values of each pair.
+
+:class:`MarketState` handles the `ticker` and `spread` channels of a websocket
+API and keeps the latest values of each pair in a :class:`Quote`, so that any
+number of readers can look them up without awaiting or decoding messages again.
+
+The best bid and ask of every pair are also kept in :class:`array.array`
+columns, in the order pairs were first seen, so the mid prices of all pairs
+can be read at once. The columns can be wrapped without copying by
+:func:`numpy.frombuffer`, but a wrapped column cannot grow, so views should not
+be kept while new pairs may be added.
+"""
+import math
+from array import array
+from typing import Any, Callable, Coroutine, Dict, Iterable, List, Optional
+
+from kraken_async_api.websocket import PublicSubscription, PublicWebSocketApi
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Quote:
+    """
+    The latest values of a pair. Values which have not been received yet are NaN.
+    """
+    __slots__ = ("pair", "index", "bid", "bid_volume", "ask", "ask_volume", "last",
+                 "last_volume", "volume", "time")
+
+    def __init__(self, pair: str, index: int):
+        self.pair = pair
+        self.index = index
+        """The position of the pair in the columns of its :class:`MarketState`"""
+        self.bid = self.bid_volume = self.ask = self.ask_volume = math.nan
+        self.last = self.last_volume = math.nan
+        self.volume = math.nan
+        """The volume traded in the last 24 hours, given by the ticker"""
+        self.time = math.nan
+        """The time of the last spread update in epoch seconds"""
+
+    @property
+    def mid(self) -> float:
+        """The mid price between the best bid and ask"""
+        return (self.bid + self.ask) / 2
+
+    @property
+    def spread(self) -> float:
+        """The difference between the best ask and bid"""
+        return self.ask - self.bid
+
+    def __repr__(self):
+        return f"Quote({self.pair!r}, bid={self.bid}, ask={self.ask}, last={self.last})"
+
+
+class MarketState:
+    """
+    Keeps a :class:`Quote` for each pair up to date from `ticker` and `spread` messages.
+
+    Example: ::
+
+        >>> state = MarketState(kraken.public)
+        >>> await state.subscribe(["XBT/USD", "ETH/USD"])
+        >>> state["XBT/USD"].mid
+        >>> state.mids()
+
+    :param api: The public websocket API that messages are received from. Handlers already
+        registered on it for `ticker` or `spread` are kept, and called first, as is its
+        default callback if there is none.
+    :param on_change: An optional coroutine function called with each updated quote
+    """
+
+    def __init__(self, api: PublicWebSocketApi,
+                 on_change: Optional[Callable[[Quote], Coroutine]] = None):
+        self.api = api
+        self.on_change = on_change
+        self.quotes: Dict[str, Quote] = {}
+        self.pairs: List[str] = []
+        """Pairs in the order of the columns"""
+        self.bids = array("d")
+        """The best bid of each pair"""
+        self.asks = array("d")
+        """The best ask of each pair"""
+        api.chain_handler(PublicSubscription.TICKER, self.handle_ticker)
+        api.chain_handler(PublicSubscription.SPREAD, self.handle_spread)
+
+    def __getitem__(self, pair: str) -> Quote:
+        return self.quotes[pair]
+
+    def __contains__(self, pair: str) -> bool:
+        return pair in self.quotes
+
+    def get(self, pair: str) -> Optional[Quote]:
+        """Return the quote of a pair, or None if nothing has been received for it"""
+        return self.quotes.get(pair)
+
+    def mids(self):
+        """
+        Return the mid price of every pair, in the order of :attr:`pairs`, as a NumPy
+        array if NumPy is installed, otherwise as an :class:`array.array`.
+        """
+        if numpy is not None:
+            return (numpy.frombuffer(self.bids) + numpy.frombuffer(self.asks)) / 2
+        return array("d", [(bid + ask) / 2 for bid, ask in zip(self.bids, self.asks)])
+
+    async def subscribe(self, pairs: List[str],
+                        channels: Iterable[PublicSubscription] = (PublicSubscription.TICKER,
+                                                                  PublicSubscription.SPREAD)):
+        """
+        Subscribe to the given channels for each pair.
+        """
+        for channel in channels:
+            if channel is PublicSubscription.TICKER:
+                await self.api.subscribe_to_ticker(pairs)
+            elif channel is PublicSubscription.SPREAD:
+                await self.api.subscribe_to_spread(pairs)
+
+    async def handle_ticker(self, message: List[Any]):
+        """
+        Apply a `ticker` message to the quote of its pair.
+        """
+        data = message[1]
+        quote = self._quote(message[-1])
+        quote.bid, quote.bid_volume = float(data["b"][0]), float(data["b"][2])
+        quote.ask, quote.ask_volume = float(data["a"][0]), float(data["a"][2])
+        quote.last, quote.last_volume = float(data["c"][0]), float(data["c"][1])
+        quote.volume = float(data["v"][1])
+        await self._changed(quote)
+
+    async def handle_spread(self, message: List[Any]):
+        """
+        Apply a `spread` message to the quote of its pair.
+        """
+        bid, ask, timestamp, bid_volume, ask_volume = message[1]
+        quote = self._quote(message[-1])
+        quote.bid, quote.bid_volume = float(bid), float(bid_volume)
+        quote.ask, quote.ask_volume = float(ask), float(ask_volume)
+        quote.time = float(timestamp)
+        await self._changed(quote)
+
+    def _quote(self, pair: str) -> Quote:
+        quote = self.quotes.get(pair)
+        if quote is None:
+            quote = self.quotes[pair] = Quote(pair, len(self.pairs))
+            self.pairs.append(pair)
+            self.bids.append(math.nan)
+            self.asks.append(math.nan)
+        return quote
+
+    async def _changed(self, quote: Quote):
+        self.bids[quote.index] = quote.bid
+        self.asks[quote.index] = quote.ask
+        if self.on_change is not None:
+            await self.on_change(quote)
@@ -0,0 +1,141 @@
+"""
+Coalescing of subscription requests.
+
+Each `subscribe_to_*` call sends its own frame and Kraken replies to each pair
+separately. :class:`SubscriptionBatcher` gathers the requests made within a
+short window, merges those for the same channel and options into frames of up
+to `max_pairs` pairs, sends them together and waits for every reply at once,
+so subscribing to hundreds of pairs takes a few round trips.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from kraken_async_api.websocket import Event, SubscriptionType, _WebSocketApi
+
+MAX_PAIRS_PER_SUBSCRIPTION = 50
+"""The default maximum number of pairs sent in one subscription frame"""
+
+_BatchKey = Tuple[Event, SubscriptionType, Tuple[Tuple[str, Any], ...]]
+
+
+class SubscriptionBatcher:
+    """
+    Sends subscription requests made within `window` seconds of each other together.
+
+    Each call returns once Kraken has replied to all of its pairs, with the pairs which
+    could not be subscribed to, mapped to the reason. Pairs which were not replied to
+    within the API's `request_timeout` are reported as failed too.
+
+    Example: ::
+
+        >>> batcher = SubscriptionBatcher(kraken.public)
+        >>> failed = await asyncio.gather(
+        ...     batcher.subscribe(PublicSubscription.TICKER, pairs),
+        ...     batcher.subscribe(PublicSubscription.BOOK, pairs, depth=100))
+
+    :param api: The websocket API to subscribe through
+    :param window: Seconds to wait for more requests before sending
+    :param max_pairs: The maximum number of pairs in a single frame
+    :raises TypeError: if `api` cannot send subscription requests and wait for their replies
+    """
+
+    def __init__(self, api: _WebSocketApi, window: float = 0.01,
+                 max_pairs: int = MAX_PAIRS_PER_SUBSCRIPTION):
+        if not callable(getattr(api, "request_subscription", None)):
+            raise TypeError(f"{type(api).__name__} does not support request_subscription")
+        self.api = api
+        self.window = window
+        self.max_pairs = max_pairs
+        self.frames = 0
+        """The number of frames sent"""
+        self._batches: Dict[_BatchKey, Tuple[List[str], List[asyncio.Future]]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def subscribe(self, name: SubscriptionType, pairs: List[str],
+                        **options) -> Dict[str, str]:
+        """
+        Subscribe to a channel for the given pairs, along with any other requests made
+        within the window.
+
+        :param name: The channel to subscribe to
+        :param pairs: The pairs to subscribe to
+        :param options: Options of the subscription, such as `depth` or `interval`
+        :return: The error message of each pair which could not be subscribed to
+        """
+        return await self._add(Event.SUBSCRIBE, name, pairs, options)
+
+    async def unsubscribe(self, name: SubscriptionType, pairs: List[str],
+                          **options) -> Dict[str, str]:
+        """
+        Unsubscribe from a channel for the given pairs, along with any other requests made
+        within the window.
+
+        :return: The error message of each pair which could not be unsubscribed from
+        """
+        return await self._add(Event.UNSUBSCRIBE, name, pairs, options)
+
+    async def _add(self, event: Event, name: SubscriptionType, pairs: List[str],
+                   options: Dict[str, Any]) -> Dict[str, str]:
+        resolver = getattr(self.api, "pair_resolver", None)
+        if resolver is not None:
+            pairs = await resolver(pairs)
+        future = asyncio.get_running_loop().create_future()
+        key = (event, name, tuple(sorted(options.items())))
+        batch_pairs, waiters = self._batches.setdefault(key, ([], []))
+        batch_pairs.extend(pairs)
+        waiters.append(future)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+        failed = await future
+        return {pair: failed[pair] for pair in pairs if pair in failed}
+
+    def _flush(self):
+        self._flush_handle = None
+        batches, self._batches = self._batches, {}
+        for key, (pairs, waiters) in batches.items():
+            asyncio.ensure_future(self._send(key, pairs, waiters))
+
+    async def _send(self, key: _BatchKey, pairs: List[str], waiters: List[asyncio.Future]):
+        # Every caller waiting on the batch is woken, even if it could not be sent
+        failed: Optional[Dict[str, str]] = None
+        error: Optional[Exception] = None
+        try:
+            failed = await self._request(key, pairs)
+        except Exception as raised:  # pylint: disable=broad-except
+            error = raised
+        finally:
+            for waiter in waiters:
+                if waiter.done():
+                    continue
+                if error is not None:
+                    waiter.set_exception(error)
+                elif failed is None:
+                    waiter.cancel()
+                else:
+                    waiter.set_result(failed)
+
+    async def _request(self, key: _BatchKey, pairs: List[str]) -> Dict[str, str]:
+        event, name, options = key
+        pairs = list(dict.fromkeys(pairs))
+        chunks = [pairs[start:start + self.max_pairs]
+                  for start in range(0, len(pairs), self.max_pairs)]
+        self.frames += len(chunks)
+        results = await asyncio.gather(
+            *(self.api.request_subscription(event, name, chunk, **dict(options))
+              for chunk in chunks), return_exceptions=True)
+        failed: Dict[str, str] = {}
+        for chunk, replies in zip(chunks, results):
+            if isinstance(replies, BaseException):
+                reason = "Timed out waiting for a reply" \
+                    if isinstance(replies, asyncio.TimeoutError) else str(replies)
+                failed.update(dict.fromkeys(chunk, reason))
+                continue
+            for reply in replies:
+                if reply.get("status") != "error":
+                    continue
+                if "pair" in reply:
+                    failed[reply["pair"]] = reply.get("errorMessage", "")
+                else:
+                    # An error without a pair rejects the whole request
+                    failed.update(dict.fromkeys(chunk, reply.get("errorMessage", "")))
+        return failed
@@ -1,14 +1,22 @@
-import json
+import asyncio
 import time
-from abc import ABC
+from abc import ABC, abstractmethod
 from asyncio import Task
-from dataclasses import dataclass
 from enum import Enum
-from typing import Callable, Optional, List, Coroutine, Any, Dict, TypeVar, Union
+from typing import Callable, Optional, List, Coroutine, Any, Dict, TypeVar, Union, Awaitable, \
+    Tuple
 
+from websockets.exceptions import ConnectionClosed
 from websockets.legacy.client import WebSocketClientProtocol
 
+from kraken_async_api.auth import TokenManager, WsToken
+from kraken_async_api.capture import FrameRecorder
 from kraken_async_api.constants import Interval, Depth
+from kraken_async_api.dispatch import Dispatcher, Handler
+from kraken_async_api.metadata import MetadataCache
+from kraken_async_api.metrics import LatencyHistogram
+from kraken_async_api.ratelimit import PairRateLimiter
+from kraken_async_api.reconnect import Backoff, ReconnectStats
 
 
 class Event(Enum):
@@ -44,12 +52,121 @@ class PrivateMessage(Enum):
     CANCEL_ALL_ORDERS_AFTER = "cancelAllOrdersAfter"
 
 
-class _WebSocketApi(ABC):
+class _Dispatching:
+    """
+    Handler registration for APIs which route received messages through a :class:`Dispatcher`.
+    """
+    dispatcher: Dispatcher
+
+    @property
+    def async_callback(self) -> Optional[Callable[[Any], Coroutine]]:
+        """The callback receiving decoded messages which have no registered handler"""
+        return self.dispatcher.default
+
+    @async_callback.setter
+    def async_callback(self, async_callback: Callable[[Any], Coroutine]):
+        self.dispatcher.default = async_callback
+
+    def add_handler(self, channel: Union[Subscription, str], handler: Handler,
+                    pair: Optional[str] = None):
+        """
+        Register a handler for decoded messages on a channel. See :meth:`Dispatcher.add_handler`.
+        """
+        self.dispatcher.add_handler(channel, handler, pair)
+
+    def chain_handler(self, channel: Union[Subscription, str], handler: Handler,
+                      pair: Optional[str] = None):
+        """
+        Register a handler after any already registered. See :meth:`Dispatcher.chain_handler`.
+        """
+        self.dispatcher.chain_handler(channel, handler, pair)
+
+    def remove_handler(self, channel: Union[Subscription, str], pair: Optional[str] = None):
+        """
+        Remove a handler registered with :meth:`add_handler`.
+        """
+        self.dispatcher.remove_handler(channel, pair)
+
+
+Connector = Callable[[], Awaitable[WebSocketClientProtocol]]
+
+_SubscriptionKey = Tuple[Subscription, Optional[str], Tuple[Tuple[str, Any], ...]]
+
+PairResolver = Callable[[Optional[List[str]]], Awaitable[Optional[List[str]]]]
+"""A coroutine function converting pair names to the names used by the websocket"""
 
-    def __init__(self, async_callback: Callable[[str], Coroutine], socket: WebSocketClientProtocol):
-        self.socket: WebSocketClientProtocol = socket
-        self.async_callback: Callable = async_callback
+
+class _WebSocketApi(_Dispatching, ABC):
+    """
+    Base class for websocket APIs.
+
+    Active subscriptions are tracked so that, if a `connector` is given, the
+    socket can be reopened with :class:`Backoff` after the connection is lost
+    and the subscriptions replayed. Reconnection metrics are kept in
+    :attr:`reconnect_stats`.
+
+    If `socket` is None, it is opened with the `connector` when first used.
+
+    Requests sent with :meth:`request` wait for the event replying to them, matched
+    by `reqid`, for up to :attr:`request_timeout` seconds.
+
+    If a :attr:`recorder` is set, every frame received is also captured to its file.
+    """
+
+    def __init__(self, async_callback: Optional[Callable[[Any], Coroutine]],
+                 socket: Optional[WebSocketClientProtocol], dispatcher: Optional[Dispatcher] = None,
+                 connector: Optional[Connector] = None):
+        self.socket: Optional[WebSocketClientProtocol] = socket
+        self.dispatcher: Dispatcher = dispatcher or Dispatcher()
+        if async_callback is not None:
+            self.dispatcher.default = async_callback
         self.listening: Optional[Task] = None
+        self.connector: Optional[Connector] = connector
+        self.backoff = Backoff()
+        self.reconnect_stats = ReconnectStats()
+        self.subscriptions: Dict[_SubscriptionKey, Dict[str, Any]] = {}
+        self._last_received: Optional[float] = None
+        self._gap_start: Optional[float] = None
+        self._connecting: Optional[asyncio.Future] = None
+        self.request_timeout = 10.0
+        """Seconds to wait for the reply to a request before raising a TimeoutError"""
+        self.request_latency = LatencyHistogram()
+        """Time between sending requests and receiving their replies"""
+        self.recorder: Optional[FrameRecorder] = None
+        """An optional recorder which every frame received is captured by"""
+
+    def start(self):
+        """
+        Start the receive loop, which dispatches every message received on the socket.
+        If the socket has not been opened yet, the loop is started once it is.
+        """
+        if self.socket is None:
+            return
+        if self.listening is None or self.listening.done():
+            self.listening = asyncio.ensure_future(self._listen())
+
+    async def ensure_connected(self):
+        """
+        Open the socket with the `connector` if it has not been opened yet, and start
+        the receive loop. Concurrent calls share a single connection attempt.
+        """
+        if self.socket is None:
+            if self._connecting is None:
+                self._connecting = asyncio.ensure_future(self.connector())
+            try:
+                self.socket = await asyncio.shield(self._connecting)
+            finally:
+                self._connecting = None
+        self.start()
+
+    async def close(self):
+        """
+        Stop the receive loop and close the socket.
+        """
+        if self.listening:
+            self.listening.cancel()
+        if self.socket is not None:
+            await self.socket.close()
 
     async def send(self, payload: dict):
         """
@@ -59,10 +176,62 @@ class _WebSocketApi(ABC):
 
         :param payload: A dictionary of data to send to the endpoint
         """
-        await self.socket.send(json.dumps(payload))
+        if self.socket is None:
+            await self.ensure_connected()
+        await self.socket.send(self.dispatcher.codec.dumps(payload))
+
+    async def request(self, payload: dict) -> dict:
+        """
+        Send a payload with a new `reqid`, and return the event replying to it.
+
+        :param payload: A dictionary of data to send to the endpoint
+        :raises asyncio.TimeoutError: if no reply is received within :attr:`request_timeout`
+        """
+        reqid, reply = self.dispatcher.expect()
+        payload["reqid"] = reqid
+        sent_at = time.monotonic()
+        try:
+            await self.send(payload)
+            result = await asyncio.wait_for(reply, self.request_timeout)
+        finally:
+            reply.cancel()
+        self.request_latency.record(time.monotonic() - sent_at)
+        return result
+
+    async def request_subscription(self, event: Event, name: SubscriptionType,
+                                   pair: List[str] = None, **kwargs) -> List[dict]:
+        """
+        Subscribe or unsubscribe, and return the `subscriptionStatus` events replying to the
+        request, one for each pair, or the single error rejecting the whole request.
+        Pairs which could not be subscribed to are not replayed after reconnecting.
+
+        :raises asyncio.TimeoutError: if not every reply is received within
+            :attr:`request_timeout`
+        """
+        self._track(event, name, pair, kwargs)
+        reqid, replies = self.dispatcher.expect(len(pair) if pair else 1)
+        sent_at = time.monotonic()
+        try:
+            await self._send_subscription(event, name, pair, reqid=reqid, **kwargs)
+            result = await asyncio.wait_for(replies, self.request_timeout)
+        finally:
+            replies.cancel()
+        self.request_latency.record(time.monotonic() - sent_at)
+        result = result if pair and len(pair) > 1 else [result]
+        if event is Event.SUBSCRIBE:
+            self._untrack_failed(name, pair, kwargs, result)
+        return result
+
+    def _untrack_failed(self, name: SubscriptionType, pair: Optional[List[str]],
+                        options: Dict[str, Any], replies: List[dict]):
+        errors = [reply for reply in replies if reply.get("status") == "error"]
+        if any("pair" not in reply for reply in errors):
+            self._track(Event.UNSUBSCRIBE, name, pair, options)
+        elif errors:
+            self._track(Event.UNSUBSCRIBE, name, [reply["pair"] for reply in errors], options)
 
     async def _send_subscription(self, event, name: SubscriptionType, pair: List[str] = None,
-                                 **kwargs):
+                                 reqid: Optional[int] = None, **kwargs):
         payload: Dict[str, Any] = {
             "event": event.value,
             "subscription": {
@@ -73,30 +242,119 @@ class _WebSocketApi(ABC):
 
         if pair is not None:
             payload.update({"pair": pair})
+        if reqid is not None:
+            payload["reqid"] = reqid
 
         await self.send(payload)
 
     async def _listen(self):
+        dispatch = self.dispatcher.dispatch
         while True:
-            message = await self.socket.recv()
-            await self.async_callback(message)
+            try:
+                frame = await self.socket.recv()
+            except ConnectionClosed:
+                if self.connector is None:
+                    raise
+                await self._reconnect()
+                continue
+            self._last_received = received = time.monotonic()
+            if self.recorder is not None:
+                self.recorder.record(frame)
+            if self._gap_start is not None:
+                self.reconnect_stats.gap_duration.record(received - self._gap_start)
+                self._gap_start = None
+            try:
+                await dispatch(frame)
+            except Exception as error:  # pylint: disable=broad-except
+                # A handler failing on one message must not stop the feed, so the error is
+                # passed to the event loop's exception handler, which logs it by default
+                asyncio.get_running_loop().call_exception_handler({
+                    "message": "Websocket message handler failed",
+                    "exception": error,
+                    "task": self.listening,
+                })
+
+    async def _reconnect(self):
+        stats = self.reconnect_stats
+        stats.last_disconnect = disconnected_at = time.monotonic()
+        self._gap_start = self._last_received or disconnected_at
+        self.backoff.reset()
+        while True:
+            try:
+                self.socket = await self.connector()
+                await self._replay()
+                break
+            except Exception:  # pylint: disable=broad-except
+                # Replaying may also fail with REST or decoding errors, as the private
+                # token is refreshed; CancelledError is not an Exception, so closing stops it
+                stats.failed_attempts += 1
+                await asyncio.sleep(self.backoff.next())
+        stats.reconnects += 1
+        stats.reconnect_latency.record(time.monotonic() - disconnected_at)
+
+    async def _replay(self):
+        """
+        Resend all tracked subscriptions, grouping pairs with the same subscription.
+        """
+        grouped: Dict[Tuple[Subscription, Tuple], List[str]] = {}
+        for name, pair, options in self.subscriptions:
+            pairs = grouped.setdefault((name, options), [])
+            if pair is not None:
+                pairs.append(pair)
+        for (name, options), pairs in grouped.items():
+            await self._send_subscription(Event.SUBSCRIBE, name, pairs or None, **dict(options))
+
+    def _track(self, event: Event, name: SubscriptionType, pair: Optional[List[str]],
+               options: Dict[str, Any]):
+        frozen = tuple(sorted(options.items()))
+        for item in pair if pair is not None else [None]:
+            key = (name, item, frozen)
+            if event is Event.SUBSCRIBE:
+                self.subscriptions[key] = options
+            else:
+                self.subscriptions.pop(key, None)
 
     async def subscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        self._track(Event.SUBSCRIBE, name, pair, kwargs)
         await self._send_subscription(Event.SUBSCRIBE, name, pair, **kwargs)
 
     async def unsubscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        self._track(Event.UNSUBSCRIBE, name, pair, kwargs)
         await self._send_subscription(Event.UNSUBSCRIBE, name, pair, **kwargs)
 
 
-class PublicWebSocketApi(_WebSocketApi):
+class _PublicChannels(ABC):
+    """
+    Subscription methods for the public channels, sent through :meth:`subscribe`
+    and :meth:`unsubscribe`.
+
+    Pairs may be given by any of their names if a :attr:`pair_resolver` is set, such as
+    :meth:`MetadataCache.wsnames`, which converts them to websocket names.
+    """
+    pair_resolver: Optional[PairResolver] = None
+
+    @abstractmethod
+    async def subscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        """Subscribe to a channel"""
+
+    @abstractmethod
+    async def unsubscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        """Unsubscribe from a channel"""
+
+    async def _resolve(self, pair: Optional[List[str]]) -> Optional[List[str]]:
+        resolver = self.pair_resolver
+        if resolver is None:
+            return pair
+        # pylint infers only the class default of None, so the check above is not seen
+        return await resolver(pair)  # pylint: disable=not-callable
 
     async def subscribe_to_ticker(self, pair: List[str]):
         """Subscribe to ticker information on currency pair."""
-        await self.subscribe(PublicSubscription.TICKER, pair)
+        await self.subscribe(PublicSubscription.TICKER, await self._resolve(pair))
 
     async def unsubscribe_from_ticker(self, pair: List[str]):
         """Unsubscribe from ticker information on currency pair."""
-        await self.unsubscribe(PublicSubscription.TICKER, pair)
+        await self.unsubscribe(PublicSubscription.TICKER, await self._resolve(pair))
 
     async def subscribe_to_book(self, pair: List[str], depth: Union[Depth, int] = Depth.D10):
         """Subscribe to order book levels. On subscription,
@@ -104,13 +362,13 @@ class PublicWebSocketApi(_WebSocketApi):
         Following the snapshot, level updates will be published"""
         if isinstance(depth, Depth):
             depth = depth.value
-        await self.subscribe(PublicSubscription.BOOK, pair, depth=depth)
+        await self.subscribe(PublicSubscription.BOOK, await self._resolve(pair), depth=depth)
 
     async def unsubscribe_from_book(self, pair: List[str], depth: Union[Depth, int] = Depth.D10):
         """Unsubscribe from order book levels."""
         if isinstance(depth, Depth):
             depth = depth.value
-        await self.unsubscribe(PublicSubscription.BOOK, pair, depth=depth)
+        await self.unsubscribe(PublicSubscription.BOOK, await self._resolve(pair), depth=depth)
 
     async def subscribe_to_ohlc(self, pair: List[str], interval: Interval):
         """
@@ -120,79 +378,91 @@ class PublicWebSocketApi(_WebSocketApi):
         a snapshot of the last 1 min candle from 5 mins ago will be published. The endtime can be
         used to determine that it is an old candle.
         """
-        await self.subscribe(PublicSubscription.OHLC, pair, interval=interval.value)
+        await self.subscribe(PublicSubscription.OHLC, await self._resolve(pair),
+                             interval=interval.value)
 
     async def unsubscribe_from_ohlc(self, pair: List[str], interval: Interval):
         """
         Unsubscribe from OHLC for the given list of pairs.
         """
-        await self.unsubscribe(PublicSubscription.OHLC, pair, interval=interval.value)
+        await self.unsubscribe(PublicSubscription.OHLC, await self._resolve(pair),
+                               interval=interval.value)
 
     async def subscribe_to_trades(self, pair: List[str]):
         """
         Trade feed for a currency pair
         """
-        await self.subscribe(PublicSubscription.TRADE, pair)
+        await self.subscribe(PublicSubscription.TRADE, await self._resolve(pair))
 
     async def unsubscribe_from_trades(self, pair: List[str]):
         """
         Unsusbcribe from the trade feed for the given list of pairs
         """
-        await self.unsubscribe(PublicSubscription.TRADE, pair)
+        await self.unsubscribe(PublicSubscription.TRADE, await self._resolve(pair))
 
     async def subscribe_to_spread(self, pair: List[str]):
         """
         Spread feed for a given list of currency pairs
         """
-        await self.subscribe(PublicSubscription.SPREAD, pair)
+        await self.subscribe(PublicSubscription.SPREAD, await self._resolve(pair))
 
     async def unsubscribe_from_spread(self, pair: List[str]):
         """
         Unsubscribe from spread feed for a given list of currency pairs
         """
-        await self.unsubscribe(PublicSubscription.SPREAD, pair)
+        await self.unsubscribe(PublicSubscription.SPREAD, await self._resolve(pair))
 
 
-@dataclass
-class _WsToken:
+class PublicWebSocketApi(_WebSocketApi, _PublicChannels):
     """
-    A kraken websocket authorisation token.
-    This consists of the token itself, and its expiry time in seconds since Epoch
+    :class:`PublicWebSocketApi` handles a Kraken public websocket connection.
     """
-    data: str
-    expiry_time: Optional[int]
 
 
 class PrivateWebSocketApi(_WebSocketApi):
     """
     :class:`PrivateWebSocketApi` handles Kraken private websocket connections.
+
+    Websocket tokens are cached by a :class:`TokenManager`, which refreshes them in
+    the background so that sending orders does not wait on the REST API.
+
+    If an `order_limiter` is given, new orders wait until the matching engine's rate
+    limit for their pair allows them to be sent.
+
+    Prices and volumes of new orders may be given as integers scaled by the pair's decimal
+    places, as held by :class:`LocalOrderBook`, if `metadata` is set. They are formatted
+    as strings before being sent.
     """
 
     def __init__(self, get_websocket_token: Callable[[], Coroutine],
-                 async_callback: Callable[[str], Coroutine],
-                 socket: WebSocketClientProtocol):
-        super().__init__(async_callback, socket)
-        self._ws_token: Optional[_WsToken] = None
-        self._get_ws_token: Callable[[], Coroutine] = get_websocket_token
-
-    async def get_ws_token(self):
-        if self._ws_token is None or self._ws_token.expiry_time > int(time.time()):
-            token_data = json.loads(await self._get_ws_token())
-            if len(token_data["error"]) != 0:
-                raise ConnectionError("Token could not be fetched. Please verify your api-key and"
-                                      f" api-sec. {' '.join(token_data['error'])}")
-            # Slightly reduce expiry time to account for clock sync, latency etc.
-            self._ws_token = _WsToken(token_data["result"]["token"],
-                                      token_data["result"]["expires"] * 0.9)
-        return self._ws_token
-
-    async def subscribe(self, name: PrivateSubscription, pair: List[str] = None, **kwargs):
-        token = await self.get_ws_token()
-        await super().subscribe(name, pair, token=token.data, **kwargs)
+                 async_callback: Optional[Callable[[Any], Coroutine]],
+                 socket: Optional[WebSocketClientProtocol],
+                 dispatcher: Optional[Dispatcher] = None, connector: Optional[Connector] = None,
+                 order_limiter: Optional[PairRateLimiter] = None):
+        super().__init__(async_callback, socket, dispatcher, connector)
+        self.token_manager = TokenManager(get_websocket_token)
+        self.order_limiter = order_limiter
+        self.metadata: Optional[MetadataCache] = None
+        """Pair metadata used to format scaled prices and volumes of new orders"""
+
+    async def get_ws_token(self) -> WsToken:
+        """
+        Return a valid websocket token, only fetching a new one if the cached token
+        has expired.
+        """
+        return await self.token_manager.get()
 
-    async def unsubscribe(self, name: PrivateSubscription, pair: List[str] = None, **kwargs):
+    async def _send_subscription(self, event, name: SubscriptionType, pair: List[str] = None,
+                                 reqid: Optional[int] = None, **kwargs):
         token = await self.get_ws_token()
-        await super().unsubscribe(name, pair, token=token.data, **kwargs)
+        await super()._send_subscription(event, name, pair, reqid=reqid, token=token.data,
+                                         **kwargs)
+
+    async def _replay(self):
+        # Subscriptions are replayed with a fresh token for the new connection
+        if self.subscriptions:
+            await self.token_manager.refresh()
+        await super()._replay()
 
     async def subscribe_to_own_trades(self, **kwargs):
         """
@@ -216,23 +486,41 @@ class PrivateWebSocketApi(_WebSocketApi):
     async def unsubscribe_from_open_orders(self, **kwargs):
         await self.unsubscribe(PrivateSubscription.OPEN_ORDERS, **kwargs)
 
-    async def add_order(self, order_type: str, pair: str, price: str, side: str, volume: str,
-                        **kwargs):
+    async def add_order(self, order_type: str, pair: str, price: Union[str, int], side: str,
+                        volume: Union[str, int], **kwargs):
         """
-        Add new order.
+        Add new order, and return the `addOrderStatus` event replying to it, which holds the
+        `txid` of the order, or an `errorMessage` if its `status` is "error".
+
+        :raises ValueError: if `price` or `volume` is scaled but `metadata` is not set
         """
+        if isinstance(price, int) or isinstance(volume, int):
+            price, volume = await self._format_order(pair, price, volume)
         payload = {
             "event": "addOrder",
             "ordertype": order_type,
             "pair": pair,
             "price": price,
-            "token": (await self.get_ws_token()).data,
+            "token": (self.token_manager.peek() or await self.token_manager.get()).data,
             "type": side,
             "volume": volume,
             **kwargs
         }
 
-        await self.send(payload)
+        if self.order_limiter is not None:
+            await self.order_limiter.acquire(pair)
+        return await self.request(payload)
+
+    async def _format_order(self, pair: str, price: Union[str, int], volume: Union[str, int]):
+        if self.metadata is None:
+            raise ValueError("Scaled prices and volumes require pair metadata to be set")
+        await self.metadata.load()
+        info = self.metadata.pair(pair)
+        if isinstance(price, int):
+            price = info.format_price(price)
+        if isinstance(volume, int):
+            volume = info.format_volume(volume)
+        return price, volume
 
     async def cancel_order(self, trade_ids: List[str]):
         """
@@ -247,26 +535,29 @@ class PrivateWebSocketApi(_WebSocketApi):
         The error message could be different based on the condition which was not met by the
         'cancelOrder' request.
 
+        The first `cancelOrderStatus` event replying to the request is returned.
+
         :param trade_ids: A list of trade IDs for orders to cancel
         """
         payload = {
             "event": "cancelOrder",
-            "token": (await self.get_ws_token()).data,
+            "token": (self.token_manager.peek() or await self.token_manager.get()).data,
             "txid": trade_ids
         }
 
-        await self.send(payload)
+        return await self.request(payload)
 
     async def cancel_all(self):
         """
-        Cancel all open orders. Includes partially-filled orders.
+        Cancel all open orders. Includes partially-filled orders. Returns the `cancelAllStatus`
+        event replying to the request, which holds the number of orders cancelled.
         """
         payload = {
             "event": "cancelAll",
-            "token": (await self.get_ws_token()).data
+            "token": (self.token_manager.peek() or await self.token_manager.get()).data
         }
 
-        await self.send(payload)
+        return await self.request(payload)
 
     async def cancel_all_orders_after(self, timeout: int):
         """
@@ -284,11 +575,13 @@ class PrivateWebSocketApi(_WebSocketApi):
         It is also recommended to disable the timer ahead of regularly scheduled trading engine
         maintenance (if the timer is enabled, all orders will be cancelled when the trading
         engine comes back from downtime - planned or otherwise).
+
+        Returns the `cancelAllOrdersAfterStatus` event replying to the request.
         """
         payload = {
             "event": "cancelAllOrdersAfter",
             "timeout": timeout,
-            "token": (await self.get_ws_token()).data
+            "token": (self.token_manager.peek() or await self.token_manager.get()).data
         }
 
-        await self.send(payload)
+        return await self.request(payload)
@@ -0,0 +1,354 @@
+"""
+Public websocket feeds handled in worker processes.
+
+:class:`ProcessPublicWebSocketApi` runs one public websocket connection in
+each of several worker processes. Each worker decodes the frames it receives
+and, if `book_levels` is given, maintains the order books for its pairs. The
+decoded results are batched and sent to the parent over a pipe, framed as
+length-prefixed `marshal` payloads, where they are routed through the parent's
+:class:`Dispatcher` as usual.
+
+When books are maintained in the workers, each book update is replaced by a
+compact snapshot of the top `book_levels` levels, in the same format as the
+snapshot Kraken sends on subscription (`{"as": [...], "bs": [...]}`), so that
+book handlers and :class:`OrderBookManager` work unchanged in the parent.
+"""
+import asyncio
+import marshal
+import multiprocessing
+import queue
+import threading
+from functools import partial
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional
+from zlib import crc32
+
+from websockets.legacy.client import connect
+
+from kraken_async_api.book import LocalOrderBook, OrderBookManager
+from kraken_async_api.codec import get_codec
+from kraken_async_api.dispatch import Dispatcher
+from kraken_async_api.reconnect import ReconnectStats
+from kraken_async_api.websocket import PublicSubscription, PublicWebSocketApi, SubscriptionType, \
+    _PublicChannels, _Dispatching, _SubscriptionKey
+
+_SUBSCRIBE = "subscribe"
+_UNSUBSCRIBE = "unsubscribe"
+_STOP = "stop"
+
+
+def worker_for(pair: str, workers: int) -> int:
+    """
+    Return the index of the worker a pair is assigned to. The assignment is stable
+    across processes and restarts.
+    """
+    return crc32(pair.encode()) % workers
+
+
+class _WorkerFeed:
+    """
+    The part of a worker which turns decoded messages into batched result frames.
+
+    Messages handled during one iteration of the worker's event loop are sent to
+    the parent as a single frame.
+    """
+
+    def __init__(self, api: PublicWebSocketApi, send_bytes: Callable[[bytes], None],
+                 book_levels: int = 0):
+        self.api = api
+        self.send_bytes = send_bytes
+        self.book_levels = book_levels
+        self._batch: List[Any] = []
+        api.async_callback = self.forward
+        if book_levels:
+            self.books = OrderBookManager(api, on_update=self.forward_book)
+            # Book messages are replaced by compact snapshots, so are not forwarded as well
+            api.add_handler(PublicSubscription.BOOK, self.books.handle)
+
+    async def forward(self, message: Any):
+        """
+        Queue a decoded message to be sent to the parent.
+        """
+        if not self._batch:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self._batch.append(message)
+
+    async def forward_book(self, book: LocalOrderBook):
+        """
+        Queue a compact snapshot of the top levels of a book to be sent to the parent.
+        """
+        levels = self.book_levels
+        price, volume = book.format_price, book.format_volume
+        await self.forward([-1, {"as": [(price(p), volume(v)) for p, v in book.asks(levels)],
+                                 "bs": [(price(p), volume(v)) for p, v in book.bids(levels)]},
+                            f"book-{levels}", book.pair])
+
+    def flush(self):
+        """
+        Send all queued messages to the parent as one frame.
+        """
+        batch, self._batch = self._batch, []
+        if batch:
+            self.send_bytes(marshal.dumps(batch))
+
+    async def command(self, data: bytes) -> bool:
+        """
+        Apply a command sent by the parent. Returns False when the worker should stop.
+        """
+        action, *args = marshal.loads(data)
+        if action == _STOP:
+            return False
+        name, pairs, options = args
+        if name == PublicSubscription.BOOK.value and self.book_levels and pairs is not None:
+            if action == _SUBSCRIBE:
+                await self.books.subscribe(pairs, options.get("depth"))
+            else:
+                await self.books.unsubscribe(pairs)
+        elif action == _SUBSCRIBE:
+            await self.api.subscribe(PublicSubscription(name), pairs, **options)
+        else:
+            await self.api.unsubscribe(PublicSubscription(name), pairs, **options)
+        return True
+
+
+class _ResultWriter:
+    """
+    Sends result frames to the parent from a thread, so that a full pipe blocks the
+    thread rather than the worker's event loop.
+    """
+
+    def __init__(self, results: Connection):
+        self.results = results
+        self._frames: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="kraken-results", daemon=True)
+        self._thread.start()
+
+    def send_bytes(self, data: bytes):
+        """Queue a frame to be sent to the parent"""
+        self._frames.put(data)
+
+    def close(self):
+        """Send the queued frames and stop the thread"""
+        self._frames.put(None)
+        self._thread.join()
+
+    def _run(self):
+        frames = self._frames
+        while True:
+            data = frames.get()
+            if data is None:
+                return
+            try:
+                self.results.send_bytes(data)
+            except (BrokenPipeError, EOFError):
+                # The parent has exited
+                return
+
+
+def _run_worker(url: str, codec_name: str, commands: Connection, results: Connection,
+                book_levels: int):
+    asyncio.run(_worker_main(url, codec_name, commands, results, book_levels))
+
+
+async def _worker_main(url: str, codec_name: str, commands: Connection, results: Connection,
+                       book_levels: int):
+    loop = asyncio.get_running_loop()
+    api = PublicWebSocketApi(None, None, Dispatcher(codec=get_codec(codec_name)),
+                             partial(connect, url))
+    writer = _ResultWriter(results)
+    feed = _WorkerFeed(api, writer.send_bytes, book_levels)
+    await _connect(api)
+
+    received: asyncio.Queue = asyncio.Queue()
+
+    def read_command():
+        try:
+            received.put_nowait(commands.recv_bytes())
+        except EOFError:
+            # The parent has exited, so the worker stops
+            loop.remove_reader(commands.fileno())
+            received.put_nowait(marshal.dumps((_STOP,)))
+
+    loop.add_reader(commands.fileno(), read_command)
+    try:
+        while await feed.command(await received.get()):
+            pass
+    finally:
+        loop.remove_reader(commands.fileno())
+        await api.close()
+        writer.close()
+
+
+async def _connect(api: PublicWebSocketApi):
+    # The first connection is retried with backoff like a reconnection, so that a
+    # worker started while the network is down does not exit
+    while True:
+        try:
+            await api.ensure_connected()
+            return
+        except Exception:  # pylint: disable=broad-except
+            api.reconnect_stats.failed_attempts += 1
+            await asyncio.sleep(api.backoff.next())
+
+
+class _WorkerHandle:
+    """The parent's end of a worker process"""
+
+    def __init__(self, process, commands: Connection, results: Connection):
+        self.process = process
+        self.commands = commands
+        self.results = results
+        self.frames: asyncio.Queue = asyncio.Queue()
+        """Frames received from the worker, followed by None once it has exited"""
+        self.routing: Optional[asyncio.Task] = None
+        self.exited = False
+
+
+class ProcessPublicWebSocketApi(_PublicChannels, _Dispatching):
+    """
+    A public websocket API whose connections run in worker processes.
+
+    Pairs are assigned to workers by a stable hash, after being converted by the
+    :attr:`pair_resolver` if one is set. Subscriptions without pairs are sent to the
+    first worker. Messages from all workers are routed through `dispatcher` in the parent.
+    The workers are started on the first subscription if :meth:`start` was not called.
+
+    If a worker exits unexpectedly, the error is passed to the event loop's exception
+    handler, and commands for its pairs raise :class:`ConnectionError`.
+
+    Each worker reconnects and replays its own subscriptions, which the parent does not
+    see, so :attr:`reconnect_stats` is always None, and subscriptions can only be made
+    without waiting for Kraken's replies.
+
+    :param url: The public websocket url each worker connects to
+    :param dispatcher: The dispatcher messages are routed through in the parent
+    :param workers: The number of worker processes
+    :param codec_name: The name of the codec workers decode frames with
+    :param book_levels: If given, workers maintain books and send this many levels
+        each side after every update, rather than forwarding book updates
+    """
+
+    def __init__(self, url: str, dispatcher: Dispatcher, workers: int = 2,
+                 codec_name: str = "auto", book_levels: int = 0):
+        self.url = url
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.codec_name = codec_name
+        self.book_levels = book_levels
+        self.subscriptions: Dict[_SubscriptionKey, Dict[str, Any]] = {}
+        """The subscriptions sent to the workers, keyed as in
+        :attr:`PublicWebSocketApi.subscriptions`"""
+        self.reconnect_stats: Optional[ReconnectStats] = None
+        """Not available, as reconnections happen in the workers"""
+        self._handles: List[_WorkerHandle] = []
+
+    def start(self):
+        """
+        Start the worker processes and route the results they send.
+        """
+        if self._handles:
+            return
+        context = multiprocessing.get_context("spawn")
+        loop = asyncio.get_running_loop()
+        for _ in range(self.workers):
+            command_reader, command_writer = context.Pipe(duplex=False)
+            result_reader, result_writer = context.Pipe(duplex=False)
+            process = context.Process(target=_run_worker, daemon=True, args=(
+                self.url, self.codec_name, command_reader, result_writer, self.book_levels))
+            process.start()
+            command_reader.close()
+            result_writer.close()
+            handle = _WorkerHandle(process, command_writer, result_reader)
+            loop.add_reader(result_reader.fileno(), self._read_frames, handle)
+            handle.routing = asyncio.ensure_future(self._route_frames(handle))
+            self._handles.append(handle)
+
+    async def ensure_connected(self):
+        """
+        Start the worker processes, which each open their own connection.
+        """
+        self.start()
+
+    async def close(self):
+        """
+        Stop the worker processes.
+        """
+        loop = asyncio.get_running_loop()
+        for handle in self._handles:
+            loop.remove_reader(handle.results.fileno())
+            handle.routing.cancel()
+            if handle.process.is_alive():
+                handle.commands.send_bytes(marshal.dumps((_STOP,)))
+        for handle in self._handles:
+            await loop.run_in_executor(None, handle.process.join, 5)
+            if handle.process.is_alive():
+                handle.process.terminate()
+        self._handles = []
+
+    async def subscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        self._send_command(_SUBSCRIBE, name, await self._resolve(pair), kwargs)
+
+    async def unsubscribe(self, name: SubscriptionType, pair: List[str] = None, **kwargs):
+        self._send_command(_UNSUBSCRIBE, name, await self._resolve(pair), kwargs)
+
+    def _send_command(self, action: str, name: SubscriptionType, pairs: Optional[List[str]],
+                      options: Dict[str, Any]):
+        self.start()
+        frozen = tuple(sorted(options.items()))
+        for pair in pairs if pairs is not None else [None]:
+            if action == _SUBSCRIBE:
+                self.subscriptions[(name, pair, frozen)] = options
+            else:
+                self.subscriptions.pop((name, pair, frozen), None)
+        if pairs is None:
+            self._send_to(0, marshal.dumps((action, name.value, None, options)))
+            return
+        by_worker: Dict[int, List[str]] = {}
+        for pair in pairs:
+            by_worker.setdefault(worker_for(pair, self.workers), []).append(pair)
+        for index, worker_pairs in by_worker.items():
+            self._send_to(index, marshal.dumps((action, name.value, worker_pairs, options)))
+
+    def _send_to(self, index: int, command: bytes):
+        handle = self._handles[index]
+        if handle.exited:
+            raise ConnectionError(f"Worker {index} has exited")
+        try:
+            handle.commands.send_bytes(command)
+        except (BrokenPipeError, EOFError) as error:
+            raise ConnectionError(f"Worker {index} has exited") from error
+
+    @staticmethod
+    def _read_frames(handle: _WorkerHandle):
+        results = handle.results
+        try:
+            while results.poll():
+                handle.frames.put_nowait(results.recv_bytes())
+        except EOFError:
+            # The worker has exited
+            asyncio.get_running_loop().remove_reader(results.fileno())
+            handle.frames.put_nowait(None)
+
+    async def _route_frames(self, handle: _WorkerHandle):
+        route = self.dispatcher.route
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await handle.frames.get()
+            if frame is None:
+                handle.exited = True
+                loop.call_exception_handler({
+                    "message": f"Worker process {handle.process.pid} exited",
+                    "exception": ConnectionError("Worker process exited"),
+                    "task": handle.routing,
+                })
+                return
+            for message in marshal.loads(frame):
+                try:
+                    await route(message)
+                except Exception as error:  # pylint: disable=broad-except
+                    # A handler failing on one message must not stop the worker's feed
+                    loop.call_exception_handler({
+                        "message": "Websocket message handler failed",
+                        "exception": error,
+                        "task": handle.routing,
+                    })
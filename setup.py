@@ -32,5 +32,11 @@ setup(
         "aiohttp",
         "websockets"
     ],
+    extras_require={
+        "orjson": ["orjson"],
+        "msgspec": ["msgspec"],
+        "ujson": ["ujson"],
+        "candles": ["numpy"],
+    },
     python_requires=">=3.4.0"
 )
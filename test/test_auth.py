@@ -0,0 +1,170 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from kraken_async_api.auth import TokenManager, NonceGenerator, Signer
+from kraken_async_api.errors import KrakenError
+
+
+def token_response(token="fakeToken", expires=900):
+    return {"token": token, "expires": expires}
+
+
+class TestTokenManager(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.fetch_token = AsyncMock(return_value=token_response())
+        self.under_test = TokenManager(self.fetch_token)
+
+    async def asyncTearDown(self) -> None:
+        self.under_test.close()
+
+    async def test_peek_returns_none_before_a_token_is_fetched(self):
+        self.assertIsNone(self.under_test.peek())
+
+    async def test_cached_token_is_returned_without_fetching(self):
+        # given
+        await self.under_test.get()
+
+        # when
+        token = self.under_test.peek()
+
+        # then
+        self.assertEqual("fakeToken", token.data)
+        self.fetch_token.assert_awaited_once()
+
+    async def test_expired_token_is_fetched_again(self):
+        # given
+        with patch("time.monotonic", return_value=0):
+            await self.under_test.get()
+
+        # when
+        self.fetch_token.return_value = token_response("newToken")
+        with patch("time.monotonic", return_value=900):
+            token = await self.under_test.get()
+
+        # then
+        self.assertEqual("newToken", token.data)
+        self.assertEqual(2, self.fetch_token.await_count)
+
+    async def test_concurrent_refreshes_share_a_single_fetch(self):
+        # when
+        tokens = await asyncio.gather(*(self.under_test.get() for _ in range(5)))
+
+        # then
+        self.fetch_token.assert_awaited_once()
+        self.assertEqual({"fakeToken"}, {token.data for token in tokens})
+
+    async def test_token_is_refreshed_in_the_background_before_it_expires(self):
+        # given
+        self.fetch_token.return_value = token_response(expires=0.01)
+        await self.under_test.get()
+
+        # when
+        self.fetch_token.return_value = token_response("newToken")
+        await asyncio.sleep(0.02)
+
+        # then
+        self.assertEqual(2, self.fetch_token.await_count)
+        self.assertEqual("newToken", self.under_test.peek().data)
+
+    async def test_failed_background_refresh_is_surfaced_by_the_next_get(self):
+        # given
+        self.fetch_token.return_value = token_response(expires=0.01)
+        await self.under_test.get()
+        self.fetch_token.side_effect = KrakenError(["EGeneral:boo"])
+
+        # when
+        await asyncio.sleep(0.02)
+
+        # then
+        with self.assertRaisesRegex(ConnectionError, "boo"):
+            await self.under_test.get()
+
+    async def test_stats_count_hits_misses_and_refreshes(self):
+        # when
+        await self.under_test.get()
+        await self.under_test.get()
+        self.under_test.peek()
+
+        # then
+        self.assertEqual(1, self.under_test.stats.misses)
+        self.assertEqual(2, self.under_test.stats.hits)
+        self.assertEqual(1, self.under_test.stats.refreshes)
+
+
+class TestNonceGenerator(unittest.TestCase):
+
+    def test_nonces_are_the_time_in_microseconds(self):
+        with patch("time.time", return_value=5):
+            self.assertEqual(5000000, NonceGenerator().next())
+
+    def test_nonces_increase_when_the_clock_does_not(self):
+        # given
+        under_test = NonceGenerator()
+
+        # when
+        with patch("time.time", return_value=5):
+            nonces = [under_test.next() for _ in range(3)]
+
+        # then
+        self.assertEqual([5000000, 5000001, 5000002], nonces)
+
+    def test_nonces_increase_across_generators_sharing_a_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # given
+            path = os.path.join(directory, "nonce")
+            first, second = NonceGenerator(path), NonceGenerator(path)
+            self.addCleanup(first.close)
+            self.addCleanup(second.close)
+
+            # when
+            with patch("time.time", return_value=5):
+                nonces = [first.next(), second.next(), first.next()]
+
+            # then
+            self.assertEqual([5000000, 5000001, 5000002], nonces)
+
+    def test_async_nonces_wait_for_the_lock_without_blocking(self):
+        import fcntl  # pylint: disable=import-outside-toplevel
+        with tempfile.TemporaryDirectory() as directory:
+            # given
+            path = os.path.join(directory, "nonce")
+            under_test = NonceGenerator(path)
+            self.addCleanup(under_test.close)
+            other = os.open(path, os.O_RDWR | os.O_CREAT)
+            self.addCleanup(os.close, other)
+            fcntl.flock(other, fcntl.LOCK_EX)
+
+            async def generate():
+                pending = asyncio.ensure_future(under_test.next_async(retry_delay=0.001))
+                await asyncio.sleep(0.01)
+                blocked = not pending.done()
+                fcntl.flock(other, fcntl.LOCK_UN)
+                return blocked, await asyncio.wait_for(pending, 1)
+
+            # when
+            with patch("time.time", return_value=5):
+                blocked, nonce = asyncio.run(generate())
+
+            # then
+            self.assertTrue(blocked)
+            self.assertEqual(5000000, nonce)
+
+
+class TestSigner(unittest.TestCase):
+
+    def test_signing_does_not_change_the_template(self):
+        # given
+        under_test = Signer("123=")
+
+        # when
+        first = under_test.sign("/0/private/Balance", "5000000", "nonce=5000000")
+        second = under_test.sign("/0/private/Balance", "5000000", "nonce=5000000")
+
+        # then
+        self.assertEqual(first, second)
+        self.assertEqual("XrO8qJN01EbSNXU4+Z+Q0i6SQDt4HtpTS2JmXQ3lsoeOCF9nGP9nG"
+                         "BR4jtIrUdIK0mstry9nfur81/V4rba+Aw==", first)
@@ -0,0 +1,159 @@
+import unittest
+from unittest.mock import AsyncMock
+from zlib import crc32
+
+from websockets.legacy.client import WebSocketClientProtocol
+
+from kraken_async_api.book import LocalOrderBook, OrderBookManager, ChecksumError, to_scaled
+from kraken_async_api.constants import Depth
+from kraken_async_api.metadata import MetadataCache
+from kraken_async_api.websocket import PublicWebSocketApi
+
+
+def snapshot(asks, bids, pair="XBT/USD"):
+    return [0, {"as": [[p, v, "1534614057.321597"] for p, v in asks],
+                "bs": [[p, v, "1534614057.321597"] for p, v in bids]}, "book-10", pair]
+
+
+def update(side, levels, checksum=None, pair="XBT/USD"):
+    data = {side: [[p, v, "1534614248.456738"] for p, v in levels]}
+    if checksum is not None:
+        data["c"] = str(checksum)
+    return [0, data, "book-10", pair]
+
+
+class TestLocalOrderBook(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.under_test = LocalOrderBook("XBT/USD", Depth.D10)
+        self.under_test.apply(snapshot(
+            asks=[("5541.30000", "2.50700000"), ("5541.80000", "0.33000000")],
+            bids=[("5541.20000", "1.52900000"), ("5539.90000", "0.30000000")]))
+
+    def test_snapshot_sorts_each_side_best_first(self):
+        self.assertEqual((554130000, 250700000), self.under_test.best_ask)
+        self.assertEqual((554120000, 152900000), self.under_test.best_bid)
+        self.assertEqual([(554120000, 152900000), (553990000, 30000000)],
+                         self.under_test.bids())
+
+    def test_decimal_places_are_taken_from_the_first_snapshot(self):
+        self.assertEqual(5, self.under_test.price_decimals)
+        self.assertEqual(8, self.under_test.volume_decimals)
+        self.assertEqual("5541.30000", self.under_test.format_price(554130000))
+        self.assertEqual("2.50700000", self.under_test.format_volume(250700000))
+
+    def test_checksum_is_calculated_from_top_levels(self):
+        expected = crc32(b"554130000250700000" b"55418000033000000"
+                         b"554120000152900000" b"55399000030000000")
+
+        self.assertEqual(expected, self.under_test.checksum())
+
+    def test_updates_insert_replace_and_remove_levels(self):
+        self.under_test.apply(update("a", [("5541.50000", "1.00000000"),
+                                           ("5541.30000", "0.00000000")]))
+        self.under_test.apply(update("b", [("5539.90000", "0.10000000")]))
+
+        self.assertEqual([(554150000, 100000000), (554180000, 33000000)],
+                         self.under_test.asks())
+        self.assertEqual((553990000, 10000000), self.under_test.bids()[1])
+
+    def test_update_with_both_sides_is_verified_once_all_levels_are_applied(self):
+        book = LocalOrderBook("XBT/USD", 1)
+        book.apply(snapshot([("2.0", "1.0")], [("1.0", "1.0")]))
+        message = [0, {"a": [["3.0", "1.0", "1"]]}, {"b": [["1.5", "2.0", "1"]],
+                                                      "c": str(crc32(b"2010" b"1520"))},
+                   "book-1", "XBT/USD"]
+
+        book.apply(message)
+
+        self.assertEqual([(15, 20)], book.bids())
+
+    def test_book_is_trimmed_to_depth(self):
+        book = LocalOrderBook("XBT/USD", 2)
+        book.apply(snapshot([("1.0", "1.0"), ("2.0", "1.0")], []))
+
+        book.apply(update("a", [("0.5", "1.0")]))
+
+        self.assertEqual([(5, 10), (10, 10)], book.asks())
+
+    def test_given_decimal_places_scale_levels_with_fewer_decimal_places(self):
+        book = LocalOrderBook("XBT/USD", 10, price_decimals=3, volume_decimals=2)
+
+        book.apply(snapshot([("1.5", "2")], []))
+
+        self.assertEqual((1500, 200), book.best_ask)
+        self.assertEqual("1.500", book.format_price(1500))
+
+    def test_checksum_uses_the_digits_sent_whatever_the_scale(self):
+        book = LocalOrderBook("XBT/USD", 10, price_decimals=3, volume_decimals=2)
+
+        book.apply(snapshot([("1.5", "2")], [("0.5", "0.25")]))
+
+        self.assertEqual(crc32(b"152" b"525"), book.checksum())
+
+    def test_values_with_more_decimal_places_than_the_scale_are_rejected(self):
+        self.assertEqual(150, to_scaled("1.5000", 2))
+        with self.assertRaisesRegex(ValueError, "more than 2 decimal places"):
+            to_scaled("1.505", 2)
+
+    def test_checksum_mismatch_raises_an_error(self):
+        with self.assertRaisesRegex(ChecksumError, "Checksum mismatch for XBT/USD"):
+            self.under_test.apply(update("a", [("5541.50000", "1.00000000")], checksum=123))
+
+    def test_updates_are_ignored_until_a_snapshot_is_received(self):
+        self.under_test.clear()
+
+        self.under_test.apply(update("a", [("5541.50000", "1.00000000")], checksum=123))
+
+        self.assertIsNone(self.under_test.best_ask)
+        self.assertFalse(self.under_test.synced)
+
+
+class TestOrderBookManager(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.socket = AsyncMock(WebSocketClientProtocol)
+        self.api = PublicWebSocketApi(None, self.socket)
+        self.on_update = AsyncMock()
+        self.under_test = OrderBookManager(self.api, Depth.D10, self.on_update)
+
+    async def test_book_messages_are_applied_to_the_book_for_their_pair(self):
+        await self.under_test.subscribe(["XBT/USD", "ETH/USD"])
+
+        await self.api.dispatcher.route(snapshot([("2.0", "1.0")], [("1.0", "1.0")], "ETH/USD"))
+
+        self.assertEqual((20, 10), self.under_test["ETH/USD"].best_ask)
+        self.assertIsNone(self.under_test["XBT/USD"].best_ask)
+        self.on_update.assert_awaited_once_with(self.under_test["ETH/USD"])
+
+    async def test_checksum_failure_resubscribes_to_the_pair(self):
+        await self.under_test.subscribe(["XBT/USD"])
+        await self.api.dispatcher.route(snapshot([("2.0", "1.0")], [("1.0", "1.0")]))
+        self.socket.send.reset_mock()
+
+        await self.api.dispatcher.route(update("a", [("3.0", "1.0")], checksum=1))
+
+        self.assertEqual(1, self.under_test.resyncs)
+        self.assertFalse(self.under_test["XBT/USD"].synced)
+        self.assertEqual(2, self.socket.send.await_count)
+
+    async def test_books_are_scaled_by_pair_metadata(self):
+        metadata = MetadataCache(AsyncMock(return_value={"XXBTZUSD": {
+            "altname": "XBTUSD", "wsname": "XBT/USD", "base": "XXBT", "quote": "ZUSD",
+            "pair_decimals": 1, "lot_decimals": 8}}), AsyncMock(return_value={}))
+        await metadata.load()
+        self.under_test.metadata = metadata
+
+        await self.under_test.subscribe(["XBT/USD"])
+
+        self.assertEqual(1, self.under_test["XBT/USD"].price_decimals)
+        self.assertEqual(8, self.under_test["XBT/USD"].volume_decimals)
+
+    async def test_books_are_keyed_by_the_resolved_websocket_name(self):
+        self.api.pair_resolver = AsyncMock(return_value=["XBT/USD"])
+
+        await self.under_test.subscribe(["XBTUSD"])
+        await self.api.dispatcher.route(snapshot([("2.0", "1.0")], [("1.0", "1.0")]))
+
+        self.assertEqual(["XBT/USD"], list(self.under_test.books))
+        self.assertTrue(self.under_test["XBT/USD"].synced)
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+import numpy
+
+from kraken_async_api.candles import CandleBuffer, CandleManager
+from kraken_async_api.constants import Interval
+from kraken_async_api.records import OhlcColumns
+from kraken_async_api.rest import PublicRestApi
+from kraken_async_api.websocket import PublicWebSocketApi
+
+
+def candle(start, close, volume=1.0):
+    return [start, close, close, close, close, close, volume, 1]
+
+
+def ohlc(*candles):
+    rows = [[int(c[0]), *map(str, c[1:7]), c[7]] for c in candles]
+    return OhlcColumns.from_result({"XBTUSD": rows, "last": 0})
+
+
+def ohlc_message(start, close, volume=1.0):
+    values = [str(value) for value in [start + 1, start + 60, *candle(start, close, volume)[1:]]]
+    return [42, values, "ohlc-1", "XBT/USD"]
+
+
+class TestCandleBuffer(unittest.TestCase):
+
+    def test_candles_with_the_same_start_time_replace_the_last_candle(self):
+        # given
+        under_test = CandleBuffer(3)
+
+        # when
+        added = [under_test.upsert(candle(60, 1)), under_test.upsert(candle(60, 2)),
+                 under_test.upsert(candle(0, 3))]
+
+        # then
+        self.assertEqual([True, False, False], added)
+        self.assertEqual([2], under_test.column("close").tolist())
+
+    def test_windows_are_views_in_order_after_wrapping(self):
+        # given
+        under_test = CandleBuffer(3)
+
+        # when
+        for start in range(5):
+            under_test.upsert(candle(start * 60, start))
+
+        # then
+        window = under_test.window()
+        self.assertEqual([2, 3, 4], window[:, 4].tolist())
+        self.assertFalse(window.flags.owndata)
+        self.assertEqual([3, 4], under_test.column("close", 2).tolist())
+
+    def test_persisted_candles_are_reloaded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # given
+            path = os.path.join(directory, "candles")
+            buffer = CandleBuffer(3, path)
+            buffer.upsert(candle(0, 1))
+            buffer.upsert(candle(60, 2))
+            buffer.flush()
+            del buffer
+
+            # when
+            under_test = CandleBuffer(3, path)
+
+            # then
+            self.assertEqual([1, 2], under_test.column("close").tolist())
+
+
+class TestCandleManager(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.rest = Mock(PublicRestApi)
+        self.rest.get_ohlc_data = AsyncMock()
+        self.api = Mock(PublicWebSocketApi)
+        self.on_close = AsyncMock()
+        self.under_test = CandleManager(self.rest, self.api, capacity=10, on_close=self.on_close)
+
+    async def test_candles_are_seeded_from_rest_and_subscribed_to(self):
+        # given
+        self.rest.get_ohlc_data.return_value = ohlc(candle(0, 1), candle(60, 2))
+
+        # when
+        await self.under_test.track(["XBT/USD"])
+
+        # then
+        self.rest.get_ohlc_data.assert_awaited_once_with("XBTUSD", Interval.I1, None,
+                                                         compact=True)
+        self.api.subscribe_to_ohlc.assert_awaited_once_with(["XBT/USD"], Interval.I1)
+        self.assertEqual([1, 2], self.under_test["XBT/USD", Interval.I1].column("close").tolist())
+
+    async def test_updates_close_candles(self):
+        # given
+        self.rest.get_ohlc_data.return_value = ohlc(candle(0, 1))
+        await self.under_test.track(["XBT/USD"])
+
+        # when
+        await self.under_test.handle(ohlc_message(0, 2))
+        await self.under_test.handle(ohlc_message(60, 3))
+
+        # then
+        self.assertEqual([2, 3], self.under_test["XBT/USD", Interval.I1].column("close").tolist())
+        pair, interval, closed = self.on_close.await_args.args
+        self.assertEqual(("XBT/USD", Interval.I1, 2), (pair, interval, closed[4]))
+
+    async def test_longer_intervals_are_built_from_minutes(self):
+        # given
+        self.rest.get_ohlc_data.side_effect = [ohlc(candle(0, 1), candle(60, 2)),
+                                               ohlc(candle(0, 2, volume=2))]
+        await self.under_test.track(["XBT/USD"], [Interval.I5])
+
+        # when
+        await self.under_test.handle(ohlc_message(60, 3))
+        await self.under_test.handle(ohlc_message(120, 4, volume=2))
+
+        # then
+        five_minutes = self.under_test["XBT/USD", Interval.I5].window()
+        self.assertEqual(1, len(five_minutes))
+        self.assertEqual([0, 1, 4, 1, 4], five_minutes[0, :5].tolist())
+        self.assertEqual(4, five_minutes[0, 6])
+
+    async def test_longer_candles_close_when_a_minute_starts_a_new_interval(self):
+        # given
+        self.rest.get_ohlc_data.side_effect = [ohlc(candle(240, 1)), ohlc(candle(0, 1))]
+        await self.under_test.track(["XBT/USD"], [Interval.I5])
+
+        # when
+        await self.under_test.handle(ohlc_message(300, 2))
+
+        # then
+        self.assertEqual(2, len(self.under_test["XBT/USD", Interval.I5]))
+        self.assertIn(("XBT/USD", Interval.I5), [call.args[:2]
+                                                 for call in self.on_close.await_args_list])
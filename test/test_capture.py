@@ -0,0 +1,98 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock
+
+from websockets.exceptions import ConnectionClosedOK
+
+from kraken_async_api.capture import FrameRecorder, ReplaySocket
+from kraken_async_api.websocket import PublicWebSocketApi
+
+FRAMES = ['{"event":"heartbeat"}', b'\x00\x01binary',
+          '[336,{"a":[["5541.50000","1.00000000","1534614248.456738"]],"c":"1"},"book-10","XBT/USD"]']
+
+
+class TestCapture(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "feed.capture")
+
+    def record(self, frames, times=None):
+        with FrameRecorder(self.path, buffer_size=64) as recorder:
+            for index, frame in enumerate(frames):
+                recorder.record(frame, None if times is None else times[index])
+        return recorder
+
+    async def test_recorded_frames_are_replayed_in_order_with_their_types(self):
+        # given
+        recorder = self.record(FRAMES)
+
+        # when
+        socket = ReplaySocket(self.path)
+        replayed = [frame async for frame in socket]
+
+        # then
+        self.assertEqual(3, recorder.frames)
+        self.assertEqual(FRAMES, replayed)
+        await socket.close()
+
+    async def test_raw_replay_returns_text_frames_as_bytes(self):
+        self.record(FRAMES[:1])
+
+        socket = ReplaySocket(self.path, raw=True)
+
+        self.assertEqual(FRAMES[0].encode(), await socket.recv())
+        await socket.close()
+
+    async def test_recv_raises_connection_closed_once_all_frames_are_replayed(self):
+        self.record(FRAMES[:1])
+        socket = ReplaySocket(self.path)
+        await socket.recv()
+
+        with self.assertRaises(ConnectionClosedOK):
+            await socket.recv()
+        self.assertFalse(socket.remaining)
+
+    async def test_replay_at_speed_keeps_the_recorded_pace(self):
+        # given
+        self.record(FRAMES[:2], times=[0, 50_000_000])
+        socket = ReplaySocket(self.path, speed=1)
+
+        # when
+        started = time.monotonic()
+        await socket.recv()
+        await socket.recv()
+
+        # then
+        self.assertGreaterEqual(time.monotonic() - started, 0.045)
+        await socket.close()
+
+    async def test_files_without_the_capture_header_are_rejected(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a capture")
+
+        with self.assertRaisesRegex(ValueError, "is not a capture file"):
+            ReplaySocket(self.path)
+
+    async def test_websocket_api_records_received_frames_and_replays_them(self):
+        # given
+        self.record(FRAMES[::2])
+        callback = AsyncMock()
+        api = PublicWebSocketApi(callback, ReplaySocket(self.path))
+        api.recorder = FrameRecorder(os.path.join(self.directory.name, "copy.capture"))
+
+        # when
+        api.start()
+        with self.assertRaises(ConnectionClosedOK):
+            await asyncio.wait_for(api.listening, 1)
+        api.recorder.close()
+
+        # then
+        self.assertEqual("XBT/USD", callback.await_args.args[0][-1])
+        socket = ReplaySocket(api.recorder.path)
+        self.assertEqual(FRAMES[::2], [frame async for frame in socket])
+        await socket.close()
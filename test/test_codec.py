@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch
+
+from kraken_async_api.codec import get_codec, PREFERENCE
+
+FRAME = '[336, {"a": [["5541.30000", "2.50700000", "1534614248.456738"]], "c": "974942666"}, ' \
+        '"book-10", "XBT/USD"]'
+
+
+class TestCodec(unittest.TestCase):
+
+    def installed_codecs(self):
+        for name in PREFERENCE:
+            try:
+                yield get_codec(name)
+            except ImportError:
+                continue
+
+    def test_all_installed_codecs_decode_str_and_bytes(self):
+        for codec in self.installed_codecs():
+            with self.subTest(codec.name):
+                self.assertEqual(codec.loads(FRAME), codec.loads(FRAME.encode()))
+                self.assertEqual("XBT/USD", codec.loads(FRAME)[-1])
+
+    def test_all_installed_codecs_encode_to_str(self):
+        payload = {"event": "subscribe", "pair": ["XBT/USD"], "subscription": {"name": "ticker"}}
+        for codec in self.installed_codecs():
+            with self.subTest(codec.name):
+                encoded = codec.dumps(payload)
+                self.assertIsInstance(encoded, str)
+                self.assertEqual(payload, codec.loads(encoded))
+
+    def test_auto_falls_back_to_the_standard_library(self):
+        with patch("importlib.import_module", side_effect=ImportError):
+            self.assertEqual("json", get_codec().name)
+
+    def test_unknown_codec_raises_a_value_error(self):
+        with self.assertRaisesRegex(ValueError, "Unknown codec 'foo'"):
+            get_codec("foo")
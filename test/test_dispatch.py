@@ -0,0 +1,144 @@
+import time
+import unittest
+from unittest.mock import AsyncMock
+
+from kraken_async_api.dispatch import Dispatcher, EVENT
+from kraken_async_api.websocket import PublicSubscription, PrivateSubscription
+
+
+class TestDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.default = AsyncMock()
+        self.under_test = Dispatcher(self.default)
+
+    async def test_heartbeats_are_dropped(self):
+        handler = AsyncMock()
+        self.under_test.add_handler(EVENT, handler)
+
+        await self.under_test.dispatch('{"event":"heartbeat"}')
+
+        handler.assert_not_awaited()
+        self.default.assert_not_awaited()
+
+    async def test_event_messages_are_routed_to_the_event_handler(self):
+        handler = AsyncMock()
+        self.under_test.add_handler(EVENT, handler)
+
+        await self.under_test.dispatch('{"event": "systemStatus", "status": "online"}')
+
+        handler.assert_awaited_once_with({"event": "systemStatus", "status": "online"})
+
+    async def test_public_messages_are_routed_by_channel_name(self):
+        handler = AsyncMock()
+        self.under_test.add_handler(PublicSubscription.BOOK, handler)
+
+        await self.under_test.dispatch('[1, {"a": []}, {"b": []}, "book-10", "XBT/USD"]')
+
+        handler.assert_awaited_once_with([1, {"a": []}, {"b": []}, "book-10", "XBT/USD"])
+
+    async def test_pair_handlers_take_precedence_over_channel_handlers(self):
+        channel_handler = AsyncMock()
+        pair_handler = AsyncMock()
+        self.under_test.add_handler("ohlc", channel_handler)
+        self.under_test.add_handler("ohlc", pair_handler, "XBT/USD")
+
+        await self.under_test.dispatch('[1, [], "ohlc-5", "XBT/USD"]')
+        await self.under_test.dispatch('[1, [], "ohlc-5", "ETH/USD"]')
+
+        pair_handler.assert_awaited_once_with([1, [], "ohlc-5", "XBT/USD"])
+        channel_handler.assert_awaited_once_with([1, [], "ohlc-5", "ETH/USD"])
+
+    async def test_private_messages_are_routed_by_channel_name(self):
+        handler = AsyncMock()
+        self.under_test.add_handler(PrivateSubscription.OWN_TRADES, handler)
+
+        await self.under_test.dispatch('[[], "ownTrades", {"sequence": 1}]')
+
+        handler.assert_awaited_once_with([[], "ownTrades", {"sequence": 1}])
+
+    async def test_messages_without_a_handler_are_sent_to_the_default(self):
+        await self.under_test.dispatch('[1, [], "trade", "XBT/USD"]')
+
+        self.default.assert_awaited_once_with([1, [], "trade", "XBT/USD"])
+
+    async def test_removed_handlers_no_longer_receive_messages(self):
+        handler = AsyncMock()
+        self.under_test.add_handler("trade", handler)
+        self.under_test.remove_handler("trade")
+
+        await self.under_test.dispatch('[1, [], "trade", "XBT/USD"]')
+
+        handler.assert_not_awaited()
+        self.default.assert_awaited_once()
+
+    async def test_replies_resolve_the_future_expecting_their_reqid(self):
+        # given
+        reqid, reply = self.under_test.expect()
+
+        # when
+        await self.under_test.dispatch(f'{{"event": "addOrderStatus", "reqid": {reqid}}}')
+
+        # then
+        self.assertEqual({"event": "addOrderStatus", "reqid": reqid}, reply.result())
+        self.default.assert_awaited_once()
+
+    async def test_future_expecting_several_replies_is_resolved_once_all_are_received(self):
+        # given
+        reqid, replies = self.under_test.expect(2)
+
+        # when
+        await self.under_test.route({"event": "subscriptionStatus", "reqid": reqid, "pair": "A"})
+        done_after_first = replies.done()
+        await self.under_test.route({"event": "subscriptionStatus", "reqid": reqid, "pair": "B"})
+
+        # then
+        self.assertFalse(done_after_first)
+        self.assertEqual(["A", "B"], [reply["pair"] for reply in replies.result()])
+
+    async def test_chained_handlers_are_called_after_the_registered_handler(self):
+        # given
+        calls = []
+        first, second = AsyncMock(side_effect=calls.append), AsyncMock(
+            side_effect=lambda _: calls.append("second"))
+        self.under_test.add_handler("ticker", first)
+
+        # when
+        self.under_test.chain_handler("ticker", second)
+        await self.under_test.route([1, {}, "ticker", "A"])
+
+        # then
+        self.assertEqual([[1, {}, "ticker", "A"], "second"], calls)
+
+    async def test_future_expecting_several_replies_is_resolved_by_an_error_without_pair(self):
+        # given
+        reqid, replies = self.under_test.expect(2)
+
+        # when
+        await self.under_test.route({"event": "subscriptionStatus", "reqid": reqid,
+                                     "status": "error",
+                                     "errorMessage": "Subscription depth not supported"})
+
+        # then
+        self.assertEqual("Subscription depth not supported",
+                         replies.result()[0]["errorMessage"])
+
+    async def test_delivery_and_handler_latency_are_recorded_when_metrics_are_enabled(self):
+        # given
+        self.under_test.metrics.enabled = True
+        self.under_test.add_handler(PublicSubscription.TRADE, AsyncMock())
+
+        # when
+        await self.under_test.route(
+            [0, [["5541.2", "0.1", f"{time.time() - 1:.6f}", "b", "l", ""]], "trade", "XBT/USD"])
+
+        # then
+        histograms = self.under_test.metrics.histograms
+        self.assertGreaterEqual(histograms["delivery", "trade"].min, 1)
+        self.assertEqual(1, histograms["handler", "trade"].count)
+        self.assertEqual(1, self.under_test.metrics.counters["messages", "trade"])
+
+    async def test_nothing_is_recorded_when_metrics_are_disabled(self):
+        await self.under_test.route([0, ["1", "2", "3", "4", "5"], "spread", "XBT/USD"])
+
+        self.assertEqual({}, self.under_test.metrics.histograms)
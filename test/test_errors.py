@@ -0,0 +1,32 @@
+import unittest
+
+from kraken_async_api.errors import error_for, KrakenError, RateLimitError, InvalidNonceError, \
+    AuthenticationError, OrderError
+
+
+class TestErrors(unittest.TestCase):
+
+    def test_no_error_is_returned_for_warnings_only(self):
+        self.assertIsNone(error_for(["WGeneral:Something"]))
+
+    def test_error_type_matches_the_first_error(self):
+        cases = {
+            "EAPI:Rate limit exceeded": RateLimitError,
+            "EAPI:Invalid nonce": InvalidNonceError,
+            "EAPI:Invalid key": AuthenticationError,
+            "EOrder:Insufficient funds": OrderError,
+            "EQuery:Unknown asset pair": KrakenError,
+        }
+        for error, error_type in cases.items():
+            with self.subTest(error=error):
+                self.assertIs(error_type, type(error_for([error])))
+
+    def test_first_error_is_described_by_the_attributes(self):
+        # when
+        error = error_for(["WGeneral:Something", "EOrder:Insufficient funds"])
+
+        # then
+        self.assertEqual("E", error.severity)
+        self.assertEqual("Order", error.category)
+        self.assertEqual("Insufficient funds", error.message)
+        self.assertEqual(["EOrder:Insufficient funds", "WGeneral:Something"], error.errors)
@@ -1,17 +1,32 @@
+import asyncio
 import unittest
 from unittest.mock import AsyncMock, patch, Mock
 
 from aiohttp import ClientSession
+from websockets.legacy.client import WebSocketClientProtocol
 
-from kraken_async_api import Kraken
+from kraken_async_api import Kraken, Config, ShardedPublicWebSocketApi, exchange
 
 mock_client_session = Mock(ClientSession)
 
 
-# Patch the websockets connect function to stop actual connection attempts
-@patch(target="kraken_async_api.exchange.connect", new=AsyncMock())
 class TestExchange(unittest.IsolatedAsyncioTestCase):
 
+    async def asyncSetUp(self) -> None:
+        # Patch the websockets connect function to stop actual connection attempts.
+        # The returned socket never receives any messages.
+        self.socket = AsyncMock(WebSocketClientProtocol)
+        self.socket.recv.side_effect = asyncio.Event().wait
+        patcher = patch(target="kraken_async_api.exchange.connect",
+                        new=AsyncMock(return_value=self.socket))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Patch the ClientSession to stop warm up requests being sent
+        session_patcher = patch(target="kraken_async_api.pool.ClientSession",
+                                new=Mock(return_value=AsyncMock()))
+        session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+
     async def test_if_ClientSession_is_given_to_exchange_then_it_is_not_closed_on_closing_exchange_connection(self):
         # given
         http = AsyncMock()
@@ -24,7 +39,7 @@ class TestExchange(unittest.IsolatedAsyncioTestCase):
         http.close.assert_not_awaited()
 
     async def test_if_exchange_creates_ClientSession_then_it_closes_it_on_closing_exchange_connection(self):
-        with patch('kraken_async_api.exchange.ClientSession') as session_class:
+        with patch('kraken_async_api.pool.ClientSession') as session_class:
             # given
             instantiated_http_session = AsyncMock()
             session_class.return_value = instantiated_http_session
@@ -36,6 +51,30 @@ class TestExchange(unittest.IsolatedAsyncioTestCase):
             # then
             instantiated_http_session.close.assert_awaited_once()
 
+    async def test_closing_exchange_connection_closes_the_nonce_file(self):
+        # given
+        kraken = await Kraken.connect(AsyncMock(), config=None, http_session=AsyncMock())
+        kraken.private_rest.nonce = Mock()
+
+        # when
+        await kraken.close()
+
+        # then
+        kraken.private_rest.nonce.close.assert_called_once()
+
+    async def test_failing_to_connect_closes_the_exchange(self):
+        with patch('kraken_async_api.pool.ClientSession') as session_class:
+            # given
+            session = session_class.return_value = AsyncMock()
+            exchange.connect.side_effect = OSError("unreachable")
+
+            # when
+            with self.assertRaises(OSError):
+                await Kraken.connect(AsyncMock(), config=None)
+
+            # then
+            session.close.assert_awaited_once()
+
     async def test_setting_callback_updates_all_websocket_callbacks(self):
         # given
         http = AsyncMock()
@@ -63,3 +102,99 @@ class TestExchange(unittest.IsolatedAsyncioTestCase):
         # then
         private_listening_task.cancel.assert_called_once()
         public_listening_task.cancel.assert_called_once()
+
+    async def test_connecting_with_credentials_starts_listening_on_both_websockets(self):
+        # when
+        config = Config(api_key="key", api_sec="c2VjcmV0")
+        kraken = await Kraken.connect(AsyncMock(), config, http_session=AsyncMock())
+
+        # then
+        self.assertFalse(kraken.public.listening.done())
+        self.assertFalse(kraken.private.listening.done())
+        await kraken.close()
+
+    async def test_messages_are_routed_to_handlers_registered_on_the_exchange(self):
+        # given
+        callback = AsyncMock()
+        handler = AsyncMock()
+        kraken = await Kraken.connect(callback, http_session=AsyncMock())
+        kraken.add_handler("ticker", handler)
+
+        # when
+        await kraken.dispatcher.dispatch('[1, {"a": []}, "ticker", "XBT/USD"]')
+
+        # then
+        handler.assert_awaited_once_with([1, {"a": []}, "ticker", "XBT/USD"])
+        callback.assert_not_awaited()
+        await kraken.close()
+
+    async def test_metrics_are_shared_by_the_rest_and_websocket_apis(self):
+        # when
+        kraken = await Kraken.connect(AsyncMock(), Config(metrics=True, warm_up_http=False),
+                                      http_session=AsyncMock())
+
+        # then
+        self.assertTrue(kraken.metrics.enabled)
+        self.assertIs(kraken.metrics, kraken.public_rest.metrics)
+        self.assertIs(kraken.metrics, kraken.dispatcher.metrics)
+        self.assertIs(kraken.metrics, kraken.private.token_manager.metrics)
+        self.assertIs(kraken.private_rest.rate_limiter.wait_time,
+                      kraken.metrics.histograms["rate_limit_wait", "private"])
+        await kraken.close()
+
+    async def test_multiple_public_connections_create_a_sharded_public_api(self):
+        # when
+        kraken = await Kraken.connect(AsyncMock(), Config(public_connections=3),
+                                      http_session=AsyncMock())
+
+        # then
+        self.assertIsInstance(kraken.public, ShardedPublicWebSocketApi)
+        self.assertEqual(3, len(kraken.public.shards))
+        await kraken.close()
+
+    async def test_private_websocket_is_opened_lazily_without_credentials(self):
+        # when
+        kraken = await Kraken.connect(AsyncMock(), http_session=AsyncMock())
+
+        # then
+        self.assertIsNone(kraken.private.socket)
+        exchange.connect.assert_awaited_once_with(Config().public_websocket_url)
+
+        # when
+        await kraken.private.send({"event": "ping"})
+
+        # then
+        self.assertIs(self.socket, kraken.private.socket)
+        self.socket.send.assert_awaited_once()
+        await kraken.close()
+
+    async def test_handshakes_token_prefetch_and_warm_up_run_concurrently(self):
+        # given
+        started = []
+        release = asyncio.Event()
+
+        async def slow(name):
+            started.append(name)
+            await release.wait()
+            return self.socket
+
+        exchange.connect.side_effect = slow
+        async def warm_up(*_, **__):
+            return await slow("http")
+
+        http = AsyncMock()
+        http.get.side_effect = warm_up
+        config = Config(api_key="key", api_sec="c2VjcmV0")
+
+        with patch("kraken_async_api.rest.PrivateRestApi.get_ws_token",
+                   new=lambda _: slow("token")):
+            # when
+            connecting = asyncio.ensure_future(Kraken.connect(AsyncMock(), config, http))
+            await asyncio.sleep(0.01)
+
+            # then
+            self.assertCountEqual([config.public_websocket_url, config.private_websocket_url,
+                                   "token", "http"], started)
+            release.set()
+            kraken = await connecting
+            await kraken.close()
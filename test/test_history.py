@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from kraken_async_api.history import iter_pages, backfill, Checkpoint, NpyColumnWriter, History
+from kraken_async_api.records import TradeColumns
+from kraken_async_api.rest import PublicRestApi
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def trades(*times, last):
+    rows = [[str(100 + time), "0.5", time, "b", "l", "", time] for time in times]
+    return TradeColumns.from_result({"XXBTZUSD": rows, "last": str(last)})
+
+
+class TestHistory(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.api = Mock(PublicRestApi)
+        self.api.get_recent_trades = AsyncMock(side_effect=[
+            trades(1, 2, last=20), trades(3, last=30), trades(last=30)])
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    async def test_pages_follow_the_last_cursor_until_there_is_no_more_data(self):
+        # when
+        pages = [page async for page in iter_pages(self.api, "XXBTZUSD", since=10)]
+
+        # then
+        self.assertEqual([[1, 2], [3]], [list(page.trade_id) for page in pages])
+        self.assertEqual([("XXBTZUSD", 10), ("XXBTZUSD", "20"), ("XXBTZUSD", "30")],
+                         [call.args for call in self.api.get_recent_trades.call_args_list])
+
+    async def test_pages_stop_at_the_until_timestamp(self):
+        # when
+        pages = [page async for page in iter_pages(self.api, "XXBTZUSD", until=2)]
+
+        # then
+        self.assertEqual(1, len(pages))
+
+    async def test_backfill_saves_progress_to_the_checkpoint(self):
+        # given
+        checkpoint = Checkpoint(os.path.join(self.directory.name, "checkpoint.json"))
+
+        # when
+        rows = await backfill(self.api, ["XXBTZUSD"], self.directory.name, checkpoint=checkpoint)
+
+        # then
+        self.assertEqual({"XXBTZUSD": 3}, rows)
+        with open(checkpoint.path, encoding="utf-8") as file:
+            self.assertEqual({"XXBTZUSD": {"since": "30", "rows": 3}}, json.load(file))
+
+    async def test_backfill_resumes_from_the_checkpoint(self):
+        # given
+        checkpoint = Checkpoint(os.path.join(self.directory.name, "checkpoint.json"))
+        checkpoint.save("XXBTZUSD", "20", 2)
+
+        # when
+        await backfill(self.api, ["XXBTZUSD"], self.directory.name, checkpoint=checkpoint)
+
+        # then
+        self.assertEqual("20", self.api.get_recent_trades.call_args_list[0].args[1])
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestNpyColumnWriter(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self, name):
+        return numpy.load(os.path.join(self.directory.name, name + ".npy"))
+
+    def test_pages_are_appended_to_npy_files(self):
+        # when
+        with NpyColumnWriter(self.directory.name) as writer:
+            writer.write(trades(1, 2, last=20))
+            writer.write(trades(3, last=30))
+
+        # then
+        self.assertEqual([101.0, 102.0, 103.0], self.load("price").tolist())
+        self.assertEqual([1, 2, 3], self.load("trade_id").tolist())
+        self.assertEqual(b"bbb", self.load("side").tobytes())
+
+    def test_rows_after_those_given_are_discarded_on_resume(self):
+        # given
+        with NpyColumnWriter(self.directory.name) as writer:
+            writer.write(trades(1, 2, last=20))
+
+        # when
+        with NpyColumnWriter(self.directory.name, rows=1) as writer:
+            writer.write(trades(3, last=30))
+
+        # then
+        self.assertEqual([1, 3], self.load("trade_id").tolist())
+
+    def test_pages_with_columns_of_different_lengths_are_rejected(self):
+        # given
+        page = trades(1, 2, last=20)._replace(trade_id=TradeColumns.from_result(
+            {"XXBTZUSD": [], "last": "0"}).trade_id)
+
+        # when/then
+        with NpyColumnWriter(self.directory.name) as writer:
+            with self.assertRaisesRegex(ValueError, "different numbers of rows"):
+                writer.write(page)
+            self.assertEqual(0, writer.rows)
+
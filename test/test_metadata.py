@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from kraken_async_api.metadata import MetadataCache, PairInfo
+
+PAIRS = {
+    "XXBTZGBP": {"altname": "XBTGBP", "wsname": "XBT/GBP", "base": "XXBT", "quote": "ZGBP",
+                 "pair_decimals": 1, "lot_decimals": 8, "ordermin": "0.0001", "tick_size": "0.1"}
+}
+ASSETS = {"XXBT": {"altname": "XBT", "decimals": 10}}
+
+
+class TestMetadataCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.fetch_pairs = AsyncMock(return_value=PAIRS)
+        self.fetch_assets = AsyncMock(return_value=ASSETS)
+        self.under_test = MetadataCache(self.fetch_pairs, self.fetch_assets, ttl=60)
+
+    async def test_pairs_are_indexed_by_every_name(self):
+        # when
+        await self.under_test.load()
+
+        # then
+        for name in ("XXBTZGBP", "XBTGBP", "XBT/GBP"):
+            with self.subTest(name=name):
+                self.assertEqual("XBT/GBP", self.under_test.wsname(name))
+                self.assertEqual("XXBTZGBP", self.under_test.rest_name(name))
+        self.assertEqual(ASSETS, self.under_test.assets)
+
+    async def test_concurrent_loads_share_one_fetch(self):
+        # when
+        await asyncio.gather(self.under_test.load(), self.under_test.load())
+        await self.under_test.load()
+
+        # then
+        self.fetch_pairs.assert_awaited_once()
+        self.fetch_assets.assert_awaited_once()
+
+    async def test_metadata_is_reloaded_after_the_ttl(self):
+        # given
+        with patch("time.monotonic", return_value=0):
+            await self.under_test.load()
+
+        # when
+        with patch("time.monotonic", return_value=61):
+            await self.under_test.load()
+
+        # then
+        self.assertEqual(2, self.fetch_pairs.await_count)
+
+    async def test_unknown_names_are_left_unchanged(self):
+        # when
+        names = await self.under_test.wsnames(["XBTGBP", "FOO/BAR"])
+
+        # then
+        self.assertEqual(["XBT/GBP", "FOO/BAR"], names)
+
+    async def test_websocket_names_are_returned_without_loading(self):
+        # when
+        names = await self.under_test.wsnames(["XBT/GBP", "ETH/USD"])
+
+        # then
+        self.assertEqual(["XBT/GBP", "ETH/USD"], names)
+        self.fetch_pairs.assert_not_awaited()
+
+    async def test_names_are_returned_unchanged_if_loading_fails(self):
+        # given
+        self.fetch_pairs.side_effect = OSError("unreachable")
+
+        # when
+        with self.assertLogs("kraken_async_api.metadata", "WARNING"):
+            names = await self.under_test.wsnames(["XBTGBP"])
+
+        # then
+        self.assertEqual(["XBTGBP"], names)
+
+
+class TestPairInfo(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.under_test = PairInfo("XXBTZGBP", PAIRS["XXBTZGBP"])
+
+    def test_prices_and_volumes_are_scaled_to_integers(self):
+        self.assertEqual(274563, self.under_test.to_ticks("27456.3"))
+        self.assertEqual(125000000, self.under_test.to_lots("1.25"))
+
+    def test_integers_are_formatted_with_the_pair_decimals(self):
+        self.assertEqual("27456.3", self.under_test.format_price(274563))
+        self.assertEqual("0.00000001", self.under_test.format_volume(1))
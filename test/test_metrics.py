@@ -0,0 +1,94 @@
+import unittest
+
+from kraken_async_api.metrics import LatencyHistogram, Metrics
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_empty_histogram_has_no_percentiles(self):
+        histogram = LatencyHistogram()
+
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+
+    def test_small_values_are_recorded_exactly(self):
+        histogram = LatencyHistogram()
+        for micros in range(1, 11):
+            histogram.record(micros / 1e6)
+
+        self.assertAlmostEqual(5e-6, histogram.percentile(50))
+        self.assertAlmostEqual(10e-6, histogram.percentile(100))
+        self.assertEqual(10, histogram.count)
+
+    def test_large_values_are_recorded_within_the_relative_error(self):
+        histogram = LatencyHistogram(precision_bits=5)
+        for seconds in [0.0123, 0.456, 1.5, 12.0]:
+            histogram.reset()
+            histogram.record(seconds)
+
+            self.assertLessEqual(abs(histogram.percentile(50) - seconds) / seconds, 1 / 16)
+            self.assertEqual(seconds, histogram.max)
+
+    def test_percentiles_are_ordered(self):
+        histogram = LatencyHistogram()
+        for millis in range(1, 1001):
+            histogram.record(millis / 1e3)
+
+        p50, p99 = histogram.percentile(50), histogram.percentile(99)
+
+        self.assertLess(p50, p99)
+        self.assertAlmostEqual(0.5, p50, delta=0.5 / 16)
+        self.assertAlmostEqual(0.5005, histogram.mean)
+
+    def test_merged_histograms_contain_the_values_of_both(self):
+        histogram, other = LatencyHistogram(), LatencyHistogram()
+        histogram.record(0.001)
+        other.record(0.003)
+        other.record(0.002)
+
+        histogram.merge(other)
+
+        self.assertEqual(3, histogram.count)
+        self.assertEqual((0.001, 0.003), (histogram.min, histogram.max))
+        self.assertAlmostEqual(0.002, histogram.percentile(50), delta=0.002 / 16)
+
+    def test_histograms_of_different_precision_cannot_be_merged(self):
+        with self.assertRaises(ValueError):
+            LatencyHistogram(5).merge(LatencyHistogram(6))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_observations_and_counts_are_kept_by_name_and_label(self):
+        # given
+        metrics = Metrics(enabled=True)
+
+        # when
+        metrics.observe("rest", "Ticker", 0.001)
+        metrics.observe("rest", "Ticker", 0.003)
+        metrics.increment("rest_errors", "Ticker")
+
+        # then
+        self.assertEqual(2, metrics.histograms["rest", "Ticker"].count)
+        self.assertEqual({"count": 1}, metrics.summary()["rest_errors:Ticker"])
+        self.assertEqual(2, metrics.summary()["rest:Ticker"]["count"])
+
+    def test_exporter_is_called_with_every_value(self):
+        exported = []
+        metrics = Metrics(enabled=True, exporter=lambda *value: exported.append(value))
+
+        metrics.observe("sign", "Balance", 0.5)
+        metrics.increment("messages", "book", 2)
+
+        self.assertEqual([("sign", "Balance", 0.5), ("messages", "book", 2)], exported)
+
+    def test_registered_histograms_are_summarised_and_reset(self):
+        metrics = Metrics()
+        histogram = LatencyHistogram()
+        histogram.record(0.25)
+
+        metrics.register("rate_limit_wait", "public", histogram)
+
+        self.assertEqual(0.25, metrics.summary()["rate_limit_wait:public"]["max"])
+        metrics.reset()
+        self.assertEqual(0, histogram.count)
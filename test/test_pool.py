@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from kraken_async_api.config import Config
+from kraken_async_api.pool import PoolStats, create_connector, create_session
+
+
+class TestPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        app = web.Application()
+        app.router.add_get("/0/public/Time", self.time)
+        app.router.add_get("/stream", self.stream)
+        self.finish_stream = asyncio.Event()
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+
+    @staticmethod
+    async def time(_):
+        return web.json_response({"error": [], "result": {"unixtime": 1}})
+
+    async def stream(self, request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await self.finish_stream.wait()
+        await response.write_eof()
+        return response
+
+    async def test_connector_is_configured_by_the_config(self):
+        connector = create_connector(Config(http_limit_per_host=4, http_keepalive_timeout=5))
+
+        self.assertEqual(4, connector.limit_per_host)
+        await connector.close()
+
+    async def test_sequential_calls_reuse_a_kept_alive_connection(self):
+        # given
+        stats = PoolStats()
+        session = create_session(Config(), stats)
+        url = str(self.server.make_url("/0/public/Time"))
+
+        # when
+        for _ in range(3):
+            async with session.get(url) as response:
+                await response.read()
+
+        # then
+        self.assertEqual(1, stats.created)
+        self.assertEqual(2, stats.reused)
+        self.assertAlmostEqual(2 / 3, stats.reuse_rate)
+        self.assertEqual(1, stats.idle)
+        self.assertEqual(0, stats.awaiting_response)
+        await session.close()
+
+    async def test_connection_is_active_until_its_response_is_read(self):
+        # given
+        stats = PoolStats()
+        session = create_session(Config(), stats)
+        url = str(self.server.make_url("/stream"))
+
+        # when
+        async with session.get(url) as response:
+            active = stats.active
+            self.finish_stream.set()
+            await response.read()
+
+        # then
+        self.assertEqual(1, active)
+        self.assertEqual(0, stats.active)
+        self.assertEqual(1, stats.idle)
+        await session.close()
+
+    async def test_reuse_rate_is_unknown_before_any_connection(self):
+        self.assertIsNone(PoolStats().reuse_rate)
+        self.assertEqual(0, PoolStats().idle)
+        self.assertEqual(0, PoolStats().active)
@@ -0,0 +1,210 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from kraken_async_api.queues import MessageQueue, Overflow, QueuedHandler, merge_book_updates, \
+    merge_messages
+
+
+def ticker(price, pair="XBT/USD"):
+    return [340, {"c": [price, "1.0"]}, "ticker", pair]
+
+
+class TestMessageQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.release = asyncio.Event()
+        self.handled = []
+
+        async def handler(message):
+            await self.release.wait()
+            self.handled.append(message)
+
+        self.handler = handler
+
+    async def drain(self, queue: MessageQueue):
+        self.release.set()
+        while queue.depth:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        queue.close()
+
+    async def test_messages_are_handled_in_order_without_waiting_for_the_handler(self):
+        # given
+        queue = MessageQueue(self.handler, maxsize=10)
+
+        # when
+        for price in ("1", "2", "3"):
+            await queue.put(ticker(price))
+
+        # then
+        self.assertEqual([], self.handled)
+        await self.drain(queue)
+        self.assertEqual([ticker("1"), ticker("2"), ticker("3")], self.handled)
+        self.assertEqual(3, queue.stats.handled)
+        self.assertEqual(3, queue.stats.lag.count)
+
+    async def test_drop_oldest_discards_the_oldest_queued_message(self):
+        # given
+        queue = MessageQueue(self.handler, maxsize=2, overflow=Overflow.DROP_OLDEST)
+        await queue.put(ticker("1"))
+        await asyncio.sleep(0)
+
+        # when
+        for price in ("2", "3", "4"):
+            await queue.put(ticker(price))
+
+        # then
+        await self.drain(queue)
+        self.assertEqual([ticker("1"), ticker("3"), ticker("4")], self.handled)
+        self.assertEqual(1, queue.stats.dropped)
+
+    async def test_block_waits_for_space_on_the_queue(self):
+        # given
+        queue = MessageQueue(self.handler, maxsize=1, overflow=Overflow.BLOCK)
+        await queue.put(ticker("1"))
+        await asyncio.sleep(0)
+        await queue.put(ticker("2"))
+
+        # when
+        put = asyncio.ensure_future(queue.put(ticker("3")))
+        await asyncio.sleep(0.01)
+
+        # then
+        self.assertFalse(put.done())
+        self.release.set()
+        await asyncio.wait_for(put, 1)
+        await self.drain(queue)
+        self.assertEqual([ticker("1"), ticker("2"), ticker("3")], self.handled)
+        self.assertEqual(0, queue.stats.dropped)
+
+    async def test_conflate_keeps_only_the_latest_ticker(self):
+        # given
+        queue = MessageQueue(self.handler, maxsize=1, overflow=Overflow.CONFLATE)
+        await queue.put(ticker("1"))
+        await asyncio.sleep(0)
+
+        # when
+        for price in ("2", "3", "4"):
+            await queue.put(ticker(price))
+
+        # then
+        await self.drain(queue)
+        self.assertEqual([ticker("1"), ticker("4")], self.handled)
+        self.assertEqual(2, queue.stats.conflated)
+
+    async def test_conflate_queues_trades_rather_than_replacing_them(self):
+        # given
+        queue = MessageQueue(self.handler, maxsize=100, overflow=Overflow.CONFLATE)
+        trades = [[0, [[price, "1.0", "1.0", "b", "l", ""]], "trade", "XBT/USD"]
+                  for price in ("1", "2", "3", "4")]
+
+        # when
+        for trade in trades:
+            await queue.put(trade)
+
+        # then
+        await self.drain(queue)
+        self.assertEqual(trades, self.handled)
+        self.assertEqual(0, queue.stats.conflated)
+
+    async def test_conflate_replaces_queued_messages_with_a_book_snapshot(self):
+        # given
+        queue = MessageQueue(self.handler, maxsize=1, overflow=Overflow.CONFLATE)
+        await queue.put(ticker("1"))
+        await asyncio.sleep(0)
+        await queue.put([1, {"a": [["2.0", "1.0", "1"]]}, "book-10", "XBT/USD"])
+        snapshot = [1, {"as": [["3.0", "1.0", "1"]], "bs": [["1.0", "1.0", "1"]]}, "book-10",
+                    "XBT/USD"]
+
+        # when
+        await queue.put(snapshot)
+
+        # then
+        await self.drain(queue)
+        self.assertEqual([ticker("1"), snapshot], self.handled)
+        self.assertEqual(1, queue.stats.dropped)
+
+    async def test_conflate_waits_for_space_for_an_update_after_a_snapshot(self):
+        # given
+        queue = MessageQueue(self.handler, maxsize=1, overflow=Overflow.CONFLATE)
+        await queue.put(ticker("1"))
+        await asyncio.sleep(0)
+        snapshot = [1, {"as": [["3.0", "1.0", "1"]], "bs": [["1.0", "1.0", "1"]]}, "book-10",
+                    "XBT/USD"]
+        update = [1, {"a": [["2.0", "1.0", "1"]]}, "book-10", "XBT/USD"]
+        await queue.put(snapshot)
+
+        # when
+        put = asyncio.ensure_future(queue.put(update))
+        await asyncio.sleep(0.01)
+
+        # then
+        self.assertFalse(put.done())
+        self.release.set()
+        await asyncio.wait_for(put, 1)
+        await self.drain(queue)
+        self.assertEqual([ticker("1"), snapshot, update], self.handled)
+        self.assertEqual(0, queue.stats.dropped)
+
+    async def test_handler_errors_are_counted_and_do_not_stop_the_queue(self):
+        # given
+        handler = AsyncMock(side_effect=[ValueError("boom"), None])
+        queue = MessageQueue(handler, maxsize=10)
+        asyncio.get_running_loop().set_exception_handler(lambda *_: None)
+
+        # when
+        await queue.put(ticker("1"))
+        await queue.put(ticker("2"))
+        await asyncio.sleep(0.01)
+
+        # then
+        self.assertEqual(2, handler.await_count)
+        self.assertEqual(1, queue.stats.errors)
+        queue.close()
+
+
+class TestMergeBookUpdates(unittest.TestCase):
+
+    def test_updates_are_combined_with_the_latest_checksum(self):
+        first = [336, {"a": [["1.0", "1.0", "1"]]}, {"b": [["0.5", "1.0", "1"]], "c": "1"},
+                 "book-10", "XBT/USD"]
+        second = [336, {"a": [["1.0", "0.0", "2"]], "c": "2"}, "book-10", "XBT/USD"]
+
+        merged = merge_book_updates(first, second)
+
+        self.assertEqual([336, {"a": [["1.0", "1.0", "1"], ["1.0", "0.0", "2"]],
+                                "b": [["0.5", "1.0", "1"]], "c": "2"}, "book-10", "XBT/USD"],
+                         merged)
+
+    def test_only_messages_of_state_channels_replace_each_other(self):
+        self.assertEqual(ticker("2"), merge_messages(ticker("1"), ticker("2")))
+        self.assertIsNone(merge_messages(ticker("1", "ETH/USD"), ticker("2")))
+        self.assertIsNone(merge_messages([0, [], "ownTrades", {"sequence": 1}],
+                                         [0, [], "ownTrades", {"sequence": 2}]))
+        self.assertIsNone(merge_messages({"event": "systemStatus"}, {"event": "systemStatus"}))
+
+    def test_snapshots_are_not_merged(self):
+        snapshot = [336, {"as": [], "bs": []}, "book-10", "XBT/USD"]
+        update = [336, {"a": [["1.0", "0.0", "2"]], "c": "2"}, "book-10", "XBT/USD"]
+
+        self.assertIsNone(merge_book_updates(snapshot, update))
+
+
+class TestQueuedHandler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_each_pair_has_its_own_queue(self):
+        # given
+        handler = AsyncMock()
+        under_test = QueuedHandler(handler)
+
+        # when
+        await under_test(ticker("1", "XBT/USD"))
+        await under_test(ticker("2", "ETH/USD"))
+        await asyncio.sleep(0.01)
+
+        # then
+        self.assertEqual({"XBT/USD", "ETH/USD"}, set(under_test.queues))
+        self.assertEqual(1, under_test.stats["ETH/USD"].handled)
+        self.assertEqual(2, handler.await_count)
+        under_test.close()
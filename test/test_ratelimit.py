@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+
+from kraken_async_api.ratelimit import RateLimiter, CounterLimit, Priority, PairRateLimiter, \
+    cost_of
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_calls_under_the_limit_are_not_delayed(self):
+        # given
+        under_test = RateLimiter(CounterLimit(3, 0.001))
+
+        # when
+        for _ in range(3):
+            await asyncio.wait_for(under_test.acquire(), 0.01)
+
+        # then
+        self.assertAlmostEqual(3, under_test.counter, places=2)
+        self.assertEqual(0, under_test.wait_time.count)
+
+    async def test_calls_over_the_limit_wait_for_the_counter_to_decay(self):
+        # given
+        under_test = RateLimiter(CounterLimit(1, 50))
+        await under_test.acquire()
+
+        # when
+        waiting = asyncio.ensure_future(under_test.acquire())
+        await asyncio.sleep(0)
+
+        # then
+        self.assertFalse(waiting.done())
+        self.assertEqual(1, under_test.queue_depth)
+        await asyncio.wait_for(waiting, 0.5)
+        self.assertEqual(0, under_test.queue_depth)
+        self.assertEqual(1, under_test.wait_time.count)
+
+    async def test_waiting_calls_are_made_in_priority_order(self):
+        # given
+        under_test = RateLimiter(CounterLimit(1, 50))
+        await under_test.acquire()
+        made = []
+
+        async def call(name, priority):
+            await under_test.acquire(priority=priority)
+            made.append(name)
+
+        # when
+        await asyncio.gather(call("history", Priority.HISTORY), call("normal", Priority.NORMAL),
+                             call("order", Priority.ORDER))
+
+        # then
+        self.assertEqual(["order", "normal", "history"], made)
+
+    async def test_cancelled_calls_leave_the_queue(self):
+        # given
+        under_test = RateLimiter(CounterLimit(1, 50))
+        await under_test.acquire()
+        cancelled = asyncio.ensure_future(under_test.acquire())
+        waiting = asyncio.ensure_future(under_test.acquire())
+        await asyncio.sleep(0)
+
+        # when
+        cancelled.cancel()
+
+        # then
+        await asyncio.wait_for(waiting, 0.5)
+        self.assertEqual(0, under_test.queue_depth)
+
+    async def test_pairs_have_separate_counters(self):
+        # given
+        under_test = PairRateLimiter(CounterLimit(1, 0.001))
+        await under_test.acquire("XBT/USD")
+
+        # when/then
+        await asyncio.wait_for(under_test.acquire("ETH/USD"), 0.01)
+
+
+class TestCosts(unittest.TestCase):
+
+    def test_endpoint_costs(self):
+        self.assertEqual((2, Priority.HISTORY), cost_of("Ledgers"))
+        self.assertEqual((0, Priority.ORDER), cost_of("AddOrder"))
+        self.assertEqual((1, Priority.HISTORY), cost_of("OHLC?pair=XBTUSD&interval=1"))
+        self.assertEqual((1, Priority.NORMAL), cost_of("Balance"))
@@ -0,0 +1,43 @@
+import unittest
+
+from kraken_async_api.reconnect import Backoff, ReconnectStats
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_delays_grow_exponentially_within_jitter_bounds(self):
+        backoff = Backoff(initial=1, maximum=100, factor=2)
+
+        for window in [1, 2, 4, 8]:
+            delay = backoff.next()
+            self.assertTrue(window / 2 <= delay <= window, (window, delay))
+
+    def test_delays_are_capped_at_the_maximum(self):
+        backoff = Backoff(initial=1, maximum=5, factor=10)
+        backoff.next()
+
+        self.assertLessEqual(backoff.next(), 5)
+
+    def test_reset_restarts_from_the_initial_window(self):
+        backoff = Backoff(initial=1, maximum=100)
+        for _ in range(5):
+            backoff.next()
+
+        backoff.reset()
+
+        self.assertLessEqual(backoff.next(), 1)
+
+
+class TestReconnectStats(unittest.TestCase):
+
+    def test_combined_stats_add_counts_and_keep_the_latest_disconnection(self):
+        first, second = ReconnectStats(reconnects=1, last_disconnect=5.0), ReconnectStats(
+            reconnects=2, failed_attempts=3, last_disconnect=7.0)
+        first.reconnect_latency.record(0.1)
+        second.reconnect_latency.record(0.2)
+
+        combined = ReconnectStats.combined([first, second, ReconnectStats()])
+
+        self.assertEqual((3, 3, 7.0), (combined.reconnects, combined.failed_attempts,
+                                       combined.last_disconnect))
+        self.assertEqual(2, combined.reconnect_latency.count)
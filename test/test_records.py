@@ -0,0 +1,55 @@
+import unittest
+
+from kraken_async_api.records import TradeColumns, SpreadColumns, OhlcColumns
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_trades_are_split_into_columns(self):
+        # given
+        result = {"XXBTZUSD": [["30243.40000", "0.34507674", 1688669597.8277369, "b", "m", "", 1],
+                               ["30243.30000", "0.00376960", 1688669598.2804112, "s", "l", "", 2]],
+                  "last": "1688671969993150842"}
+
+        # when
+        columns = TradeColumns.from_result(result)
+
+        # then
+        self.assertEqual([30243.4, 30243.3], list(columns.price))
+        self.assertEqual("bs", columns.side)
+        self.assertEqual("ml", columns.order_type)
+        self.assertEqual([1, 2], list(columns.trade_id))
+        self.assertEqual("1688671969993150842", columns.last)
+
+    def test_trades_without_trade_ids_have_a_trade_id_of_minus_one(self):
+        # given
+        result = {"XXBTZUSD": [["30243.40000", "0.34507674", 1688669597.8277369, "b", "m", ""]],
+                  "last": "1688671969993150842"}
+
+        # when
+        columns = TradeColumns.from_result(result)
+
+        # then
+        self.assertEqual([30243.4], list(columns.price))
+        self.assertEqual("b", columns.side)
+        self.assertEqual([-1], list(columns.trade_id))
+
+    def test_spreads_are_split_into_columns(self):
+        # given
+        result = {"XXBTZUSD": [[1688671834, "30292.10000", "30297.50000"]], "last": 1688672106}
+
+        # when
+        columns = SpreadColumns.from_result(result)
+
+        # then
+        self.assertEqual([1688671834], list(columns.time))
+        self.assertEqual([30292.1], list(columns.bid))
+        self.assertEqual([30297.5], list(columns.ask))
+
+    def test_empty_results_give_empty_columns(self):
+        # when
+        columns = OhlcColumns.from_result({"XXBTZUSD": [], "last": 0})
+
+        # then
+        self.assertEqual(0, len(columns.time))
+        self.assertEqual(0, len(columns.close))
@@ -1,17 +1,24 @@
+import json
 import unittest
 from unittest.mock import AsyncMock, Mock, patch
 
 from aiohttp import ClientSession
 
+from kraken_async_api.errors import KrakenError, RateLimitError
+from kraken_async_api.metadata import MetadataCache
+from kraken_async_api.ratelimit import Priority
 from kraken_async_api.rest import PublicRestApi, PrivateRestApi
 from kraken_async_api.constants import AssetClass, InfoType
 
+EMPTY_RESPONSE = b'{"error": [], "result": {}}'
+
 
 class TestPublicRestApi(unittest.IsolatedAsyncioTestCase):
 
     async def asyncSetUp(self) -> None:
         self.client_session = ClientSession()
         self.client_session.get = AsyncMock()
+        self.client_session.get.return_value.read = AsyncMock(return_value=EMPTY_RESPONSE)
         self.client_session.post = AsyncMock()
         self.under_test = PublicRestApi(self.client_session)
 
@@ -146,6 +153,153 @@ class TestPublicRestApi(unittest.IsolatedAsyncioTestCase):
 
         self.verify_get_call("https://api.kraken.com/bla/new_path?foo=bar")
 
+    def respond_with(self, body: bytes):
+        self.client_session.get.return_value.read.return_value = body
+
+    async def test_responses_are_released_even_if_reading_fails(self):
+        # given
+        self.client_session.get.return_value.read.side_effect = ConnectionResetError()
+
+        # when
+        with self.assertRaises(ConnectionResetError):
+            await self.under_test.get_server_time()
+
+        # then
+        self.client_session.get.return_value.__aexit__.assert_awaited_once()
+
+    async def test_warm_up_sends_concurrent_requests(self):
+        await self.under_test.warm_up(3)
+
+        self.assertEqual(3, self.client_session.get.await_count)
+
+    async def test_calls_are_timed_by_endpoint_when_metrics_are_enabled(self):
+        # given
+        self.under_test.metrics.enabled = True
+        self.client_session.get.return_value.read.side_effect = [
+            EMPTY_RESPONSE, b'{"error": ["EQuery:Unknown asset pair"]}']
+
+        # when
+        await self.under_test.get_server_time()
+        with self.assertRaises(KrakenError):
+            await self.under_test.get_ticker_information("XBTUSD")
+
+        # then
+        metrics = self.under_test.metrics
+        self.assertEqual(1, metrics.histograms["rest", "Time"].count)
+        self.assertEqual(1, metrics.histograms["rest", "Ticker"].count)
+        self.assertEqual(1, metrics.counters["rest_errors", "Ticker"])
+
+    async def test_tickers_are_requested_in_chunks_and_merged(self):
+        # given
+        self.client_session.get.return_value.read.side_effect = [
+            b'{"error": [], "result": {"A": 1, "B": 2}}', b'{"error": [], "result": {"C": 3}}']
+
+        # when
+        result = await self.under_test.get_tickers(["A", "B", "C"], chunk_size=2)
+
+        # then
+        self.assertEqual({"A": 1, "B": 2, "C": 3}, result)
+        self.assertEqual(["https://api.kraken.com/0/public/Ticker?pair=A,B",
+                          "https://api.kraken.com/0/public/Ticker?pair=C"],
+                         [call.args[0] for call in self.client_session.get.call_args_list])
+
+    async def test_tickers_are_keyed_by_the_pairs_given(self):
+        # given
+        self.client_session.get.return_value.read.side_effect = [
+            b'{"error": [], "result": {"XETHZUSD": 2, "XXBTZUSD": 1}}']
+        pair_info = {"base": "", "quote": "", "pair_decimals": 1, "lot_decimals": 8}
+        self.under_test.metadata = MetadataCache(AsyncMock(return_value={
+            "XXBTZUSD": {"altname": "XBTUSD", "wsname": "XBT/USD", **pair_info},
+            "XETHZUSD": {"altname": "ETHUSD", "wsname": "ETH/USD", **pair_info}}),
+            AsyncMock(return_value={}))
+
+        # when
+        result = await self.under_test.get_tickers(["XBTUSD", "ETH/USD"])
+
+        # then
+        self.assertEqual({"XBTUSD": 1, "ETH/USD": 2}, result)
+
+    async def test_order_books_are_requested_for_each_pair_and_merged(self):
+        # given
+        self.client_session.get.return_value.read.side_effect = [
+            b'{"error": [], "result": {"XA": {"asks": [], "bids": []}}}',
+            b'{"error": [], "result": {"XB": {"asks": [], "bids": []}}}']
+
+        # when
+        result = await self.under_test.get_order_books(["A", "B"], 10)
+
+        # then
+        self.assertEqual(["A", "B"], list(result))
+        self.assertEqual(["https://api.kraken.com/0/public/Depth?pair=A&count=10",
+                          "https://api.kraken.com/0/public/Depth?pair=B&count=10"],
+                         [call.args[0] for call in self.client_session.get.call_args_list])
+
+    async def test_result_is_returned_without_the_envelope(self):
+        # given
+        self.respond_with(b'{"error": [], "result": {"unixtime": 5}}')
+
+        # when
+        result = await self.under_test.get_server_time()
+
+        # then
+        self.assertEqual({"unixtime": 5}, result)
+
+    async def test_errors_are_raised_as_the_matching_kraken_error(self):
+        # given
+        self.respond_with(b'{"error": ["EAPI:Rate limit exceeded"]}')
+
+        # when/then
+        with self.assertRaises(RateLimitError) as context:
+            await self.under_test.get_server_time()
+        self.assertEqual("API", context.exception.category)
+        self.assertEqual("Rate limit exceeded", context.exception.message)
+
+    async def test_unknown_errors_are_raised_as_a_kraken_error(self):
+        # given
+        self.respond_with(b'{"error": ["EQuery:Unknown asset pair"]}')
+
+        # when/then
+        with self.assertRaisesRegex(KrakenError, "EQuery:Unknown asset pair"):
+            await self.under_test.get_recent_trades("abc")
+
+    async def test_warnings_do_not_raise(self):
+        # given
+        self.respond_with(b'{"error": ["WGeneral:Something"], "result": {"a": 1}}')
+
+        # when
+        result = await self.under_test.get_server_time()
+
+        # then
+        self.assertEqual({"a": 1}, result)
+
+    async def test_compact_ohlc_data_is_returned_as_columns(self):
+        # given
+        self.respond_with(b'{"error": [], "result": {"XXBTZUSD": ['
+                          b'[1688671200, "30306.1", "30306.2", "30305.7", "30305.7", "30306.1",'
+                          b' "3.39243896", 23]], "last": 1688672160}}')
+
+        # when
+        result = await self.under_test.get_ohlc_data("XXBTZUSD", compact=True)
+
+        # then
+        self.assertEqual([1688671200], list(result.time))
+        self.assertEqual([30305.7], list(result.close))
+        self.assertEqual([23], list(result.count))
+        self.assertEqual(1688672160, result.last)
+
+    async def test_compact_order_book_is_returned_as_columns(self):
+        # given
+        self.respond_with(b'{"error": [], "result": {"XXBTZUSD": {'
+                          b'"asks": [["30384.10000", "2.059", 1688671659]],'
+                          b'"bids": [["30297.00000", "0.115", 1688671656]]}}}')
+
+        # when
+        result = await self.under_test.get_order_book("XXBTZUSD", compact=True)
+
+        # then
+        self.assertEqual([30384.1], list(result.asks.price))
+        self.assertEqual([0.115], list(result.bids.volume))
+
 
 # Patch time.time() which is used for the nonce and api-sign
 @patch(target="time.time", new=lambda: 5)
@@ -161,6 +315,7 @@ class TestPrivateRest(unittest.IsolatedAsyncioTestCase):
         self.client_session = Mock(ClientSession)
         self.client_session.get = AsyncMock()
         self.client_session.post = AsyncMock()
+        self.client_session.post.return_value.read = AsyncMock(return_value=EMPTY_RESPONSE)
         self.under_test = PrivateRestApi(self.client_session)
         self.under_test.config.api_key = "abc"
         self.under_test.config.api_sec = "123="
@@ -169,25 +324,130 @@ class TestPrivateRest(unittest.IsolatedAsyncioTestCase):
         await self.client_session.close()
 
     def check_post_call(self, url, api_sign, **kwargs):
-        data = {"nonce": "5000"}  # Patched time.time() returns 5
+        data = "nonce=5000000"  # Patched time.time() returns 5
         headers = {"API-KEY": "abc",
-                   "API-Sign": api_sign}
+                   "API-Sign": api_sign,
+                   "Content-Type": "application/x-www-form-urlencoded"}
         self.client_session.post.assert_called_once_with(url, data=data, headers=headers, **kwargs)
 
+    def respond_with(self, *results):
+        self.client_session.post.return_value.read.side_effect = [
+            json.dumps({"error": [], "result": result}).encode() for result in results]
+
+    def posted(self):
+        return [(call.args[0], call.kwargs["data"], call.kwargs["headers"]["Content-Type"])
+                for call in self.client_session.post.call_args_list]
+
     async def test_calls_are_made_to_the_rest_url_supplied_by_the_config(self):
         self.under_test.config.rest_url = "bar"
         await self.under_test.post_with_auth("Balance")
 
         self.check_post_call("bar/0/private/Balance",
-                             "3SwKsOrZPBX3YSG1Bkh6EWTPcE2UPFNsNBIx"
-                             "/j2PZnLYHpsbsNYciDNDnmmg6QAuw2uxAIYO8a7xjryWfXvEMA==")
+                             "XrO8qJN01EbSNXU4+Z+Q0i6SQDt4HtpTS2JmXQ3lsoeOCF9nGP9nG"
+                             "BR4jtIrUdIK0mstry9nfur81/V4rba+Aw==")
 
     async def test_get_ws_token(self):
         await self.under_test.get_ws_token()
 
         self.check_post_call("https://api.kraken.com/0/private/GetWebSocketsToken",
-                             "HB54iWkvRJhBAzVz6EzvWLllGfguM9wKlsG1gQj6WLvYTAlAoVY1s"
-                             "I9RFBbXidaregrNOxys9MDqpa+5aATRlQ==")
+                             "AVAFMiUEGcJlEgv7RAQZA2WXsUgh2OUZ04PDqyBlfua6V/4KkYIeW"
+                             "mrwkV2bQFf30B6ueJaH1xduaHpfLtVl4g==")
+
+    async def test_calls_wait_for_the_rate_limiter_with_the_cost_of_the_endpoint(self):
+        # given
+        self.under_test.rate_limiter = AsyncMock()
+
+        # when
+        await self.under_test.post_with_auth("Ledgers")
+
+        # then
+        self.under_test.rate_limiter.acquire.assert_awaited_once_with(2, Priority.HISTORY)
+
+    async def test_nonces_increase_for_calls_in_the_same_microsecond(self):
+        # when
+        await self.under_test.post_with_auth("Balance")
+        await self.under_test.post_with_auth("Balance")
+
+        # then
+        bodies = [call.kwargs["data"] for call in self.client_session.post.call_args_list]
+        self.assertEqual(["nonce=5000000", "nonce=5000001"], bodies)
+
+    async def test_signer_is_replaced_when_the_secret_changes(self):
+        # given
+        signer = self.under_test.signer
+
+        # when
+        self.under_test.config.api_sec = "456="
+
+        # then
+        self.assertIsNot(signer, self.under_test.signer)
+        self.assertEqual("456=", self.under_test.signer.api_sec)
+
+    async def test_parameters_are_form_encoded(self):
+        # when
+        await self.under_test.get_closed_orders(trades=True, start=10)
+
+        # then
+        self.assertEqual([("https://api.kraken.com/0/private/ClosedOrders",
+                           "nonce=5000000&trades=true&start=10&closetime=both",
+                           "application/x-www-form-urlencoded")], self.posted())
+
+    async def test_add_order(self):
+        # when
+        await self.under_test.add_order("limit", "buy", "1.25", "XBTUSD", "27500.0",
+                                        oflags="post")
+
+        # then
+        self.assertEqual("nonce=5000000&ordertype=limit&type=buy&volume=1.25&pair=XBTUSD"
+                         "&price=27500.0&oflags=post", self.posted()[0][1])
+
+    async def test_order_batches_are_split_and_results_map_back_to_orders(self):
+        # given
+        orders = [{"ordertype": "limit", "type": "buy", "volume": "1", "price": str(price)}
+                  for price in range(16)]
+        self.respond_with({"orders": [{"txid": f"A{i}"} for i in range(15)]},
+                          {"txid": ["B0"], "descr": {}})
+
+        # when
+        results = await self.under_test.add_order_batch(orders, "XBTUSD", validate=True)
+
+        # then
+        posted = self.posted()
+        self.assertEqual(["https://api.kraken.com/0/private/AddOrderBatch",
+                          "https://api.kraken.com/0/private/AddOrder"],
+                         [url for url, _, _ in posted])
+        batch = json.loads(posted[0][1])
+        self.assertEqual(orders[:15], batch["orders"])
+        self.assertEqual(("XBTUSD", True), (batch["pair"], batch["validate"]))
+        self.assertEqual("application/json", posted[0][2])
+        self.assertEqual(16, len(results))
+        self.assertEqual("A14", results[14]["txid"])
+        self.assertEqual({"txid": "B0", "descr": {}}, results[15])
+
+    async def test_rejected_order_batches_map_their_error_to_each_order(self):
+        # given
+        orders = [{"ordertype": "limit", "type": "buy", "volume": "1", "price": "1"}] * 2
+        self.client_session.post.return_value.read.return_value = \
+            b'{"error": ["EOrder:Insufficient funds"]}'
+
+        # when
+        results = await self.under_test.add_order_batch(orders, "XBTUSD")
+
+        # then
+        self.assertEqual([{"error": "EOrder:Insufficient funds"}] * 2, results)
+
+    async def test_cancel_order_batches_are_split(self):
+        # given
+        txids = [f"O{i}" for i in range(60)]
+        self.respond_with({"count": 50}, {"count": 10})
+
+        # when
+        count = await self.under_test.cancel_order_batch(txids)
+
+        # then
+        self.assertEqual(60, count)
+        self.assertEqual([txids[:50], txids[50:]],
+                         [json.loads(body)["orders"] for _, body, _ in self.posted()])
 
     async def test_error_raised_if_api_key_missing(self):
         # given
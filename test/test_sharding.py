@@ -0,0 +1,107 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock
+
+from websockets.legacy.client import WebSocketClientProtocol
+
+from kraken_async_api.constants import Depth
+from kraken_async_api.dispatch import Dispatcher
+from kraken_async_api.sharding import ShardedPublicWebSocketApi
+from kraken_async_api.websocket import Event, PublicSubscription, PublicWebSocketApi
+
+
+class TestShardedPublicWebSocketApi(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.callback = AsyncMock()
+        self.dispatcher = Dispatcher(self.callback)
+        self.sockets = [AsyncMock(WebSocketClientProtocol) for _ in range(3)]
+        self.shards = [PublicWebSocketApi(None, socket) for socket in self.sockets]
+        self.under_test = ShardedPublicWebSocketApi(self.shards, self.dispatcher)
+
+    def sent_pairs(self, socket):
+        return [pair for call in socket.send.call_args_list
+                for pair in json.loads(call[0][0]).get("pair", [])]
+
+    async def test_pairs_are_spread_evenly_across_shards(self):
+        await self.under_test.subscribe_to_ticker(["A", "B", "C", "D", "E", "F"])
+
+        self.assertEqual([2, 2, 2], [self.under_test.load(shard) for shard in self.shards])
+        self.assertEqual(["A", "D"], self.sent_pairs(self.sockets[0]))
+
+    async def test_all_channels_for_a_pair_use_the_same_shard(self):
+        await self.under_test.subscribe_to_ticker(["A", "B", "C"])
+
+        await self.under_test.subscribe_to_book(["B"], Depth.D100)
+
+        self.assertEqual(["B", "B"], self.sent_pairs(self.sockets[1]))
+
+    async def test_new_pairs_are_placed_on_the_least_loaded_shard(self):
+        await self.under_test.subscribe_to_ticker(["A", "B", "C"])
+        await self.under_test.unsubscribe_from_ticker(["B"])
+
+        await self.under_test.subscribe_to_trades(["D"])
+
+        self.assertIs(self.shards[1], self.under_test.placement["D"])
+
+    async def test_shards_are_rebalanced_after_subscribing(self):
+        await self.under_test.subscribe_to_ticker(["A", "B", "C", "D", "E", "F", "G", "H", "I"])
+        await self.under_test.unsubscribe_from_ticker(["B", "C", "E", "F", "H", "I"])
+
+        await self.under_test.subscribe_to_trades(["J"])
+
+        loads = [self.under_test.load(shard) for shard in self.shards]
+        self.assertLessEqual(max(loads) - min(loads), 1)
+        self.assertEqual(4, sum(loads))
+
+    async def test_shards_share_the_dispatcher(self):
+        handler = AsyncMock()
+        self.under_test.add_handler("ticker", handler)
+
+        await self.shards[2].dispatcher.dispatch('[1, {}, "ticker", "A"]')
+
+        handler.assert_awaited_once_with([1, {}, "ticker", "A"])
+
+    async def test_closing_closes_every_shard(self):
+        await self.under_test.close()
+
+        for socket in self.sockets:
+            socket.close.assert_awaited_once()
+
+    async def test_subscriptions_of_all_shards_are_exposed(self):
+        await self.under_test.subscribe_to_ticker(["A", "B", "C"])
+
+        self.assertEqual({(PublicSubscription.TICKER, pair, ()) for pair in "ABC"},
+                         set(self.under_test.subscriptions))
+
+    async def test_reconnect_stats_of_all_shards_are_added_together(self):
+        self.shards[0].reconnect_stats.reconnects = 1
+        self.shards[2].reconnect_stats.reconnects = 2
+
+        self.assertEqual(3, self.under_test.reconnect_stats.reconnects)
+
+    async def test_subscription_requests_return_the_replies_of_every_shard(self):
+        # given
+        for shard, socket in zip(self.shards, self.sockets):
+            socket.send.side_effect = self.replier(shard)
+
+        # when
+        replies = await self.under_test.request_subscription(
+            Event.SUBSCRIBE, PublicSubscription.TICKER, ["A", "B", "BAD"])
+
+        # then
+        self.assertEqual({"A": "subscribed", "B": "subscribed", "BAD": "error"},
+                         {reply["pair"]: reply["status"] for reply in replies})
+        self.assertNotIn("BAD", self.under_test.placement)
+        self.assertEqual(2, len(self.under_test.subscriptions))
+
+    def replier(self, shard):
+        async def send(frame):
+            payload = json.loads(frame)
+            for pair in payload["pair"]:
+                status = "error" if pair == "BAD" else "subscribed"
+                asyncio.get_running_loop().call_soon(asyncio.ensure_future, shard.dispatcher.route(
+                    {"event": "subscriptionStatus", "reqid": payload["reqid"], "pair": pair,
+                     "status": status}))
+        return send
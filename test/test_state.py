@@ -0,0 +1,106 @@
+import math
+import unittest
+from unittest.mock import AsyncMock
+
+from websockets.legacy.client import WebSocketClientProtocol
+
+from kraken_async_api.state import MarketState
+from kraken_async_api.websocket import PublicWebSocketApi
+
+
+def ticker(bid, ask, pair="XBT/USD"):
+    return [340, {"a": [ask, 1, "1.500"], "b": [bid, 2, "2.500"], "c": ["100.5", "0.1"],
+                  "v": ["10.0", "25.0"]}, "ticker", pair]
+
+
+def spread(bid, ask, pair="XBT/USD"):
+    return [338, [bid, ask, "1648745692.530112", "3.0", "4.0"], "spread", pair]
+
+
+class TestMarketState(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.socket = AsyncMock(WebSocketClientProtocol)
+        self.api = PublicWebSocketApi(None, self.socket)
+        self.on_change = AsyncMock()
+        self.under_test = MarketState(self.api, self.on_change)
+
+    async def test_ticker_messages_update_the_quote_of_their_pair(self):
+        # when
+        await self.api.dispatcher.route(ticker("100.0", "101.0"))
+
+        # then
+        quote = self.under_test["XBT/USD"]
+        self.assertEqual((100.0, 2.5, 101.0, 1.5), (quote.bid, quote.bid_volume, quote.ask,
+                                                    quote.ask_volume))
+        self.assertEqual((100.5, 0.1, 25.0), (quote.last, quote.last_volume, quote.volume))
+        self.assertEqual(100.5, quote.mid)
+        self.on_change.assert_awaited_once_with(quote)
+
+    async def test_spread_messages_update_the_best_bid_and_ask(self):
+        # given
+        await self.api.dispatcher.route(ticker("100.0", "101.0"))
+
+        # when
+        await self.api.dispatcher.route(spread("100.2", "100.4"))
+
+        # then
+        quote = self.under_test["XBT/USD"]
+        self.assertEqual((100.2, 3.0, 100.4, 4.0), (quote.bid, quote.bid_volume, quote.ask,
+                                                    quote.ask_volume))
+        self.assertEqual(100.5, quote.last)
+        self.assertEqual(1648745692.530112, quote.time)
+
+    async def test_mids_of_all_pairs_are_read_at_once(self):
+        # given
+        await self.api.dispatcher.route(spread("1.0", "3.0", "ETH/USD"))
+        await self.api.dispatcher.route(spread("100.0", "102.0", "XBT/USD"))
+        await self.api.dispatcher.route(spread("2.0", "4.0", "ETH/USD"))
+
+        # when
+        mids = self.under_test.mids()
+
+        # then
+        self.assertEqual(["ETH/USD", "XBT/USD"], self.under_test.pairs)
+        self.assertEqual([3.0, 101.0], list(mids))
+
+    async def test_pairs_without_messages_have_no_quote(self):
+        self.assertIsNone(self.under_test.get("XBT/USD"))
+        self.assertNotIn("XBT/USD", self.under_test)
+        self.assertEqual(0, len(self.under_test.mids()))
+
+    async def test_subscribe_subscribes_to_ticker_and_spread(self):
+        await self.under_test.subscribe(["XBT/USD"])
+
+        self.assertEqual(2, self.socket.send.await_count)
+        self.assertIn('"spread"', self.socket.send.call_args[0][0])
+
+    async def test_unknown_values_are_nan(self):
+        await self.api.dispatcher.route(spread("1.0", "3.0"))
+
+        self.assertTrue(math.isnan(self.under_test["XBT/USD"].last))
+
+    async def test_handlers_registered_before_are_kept(self):
+        # given
+        existing = AsyncMock()
+        self.api.add_handler("ticker", existing)
+
+        # when
+        under_test = MarketState(self.api)
+        await self.api.dispatcher.route(ticker("100.0", "101.0"))
+
+        # then
+        existing.assert_awaited_once_with(ticker("100.0", "101.0"))
+        self.assertEqual(100.5, under_test["XBT/USD"].mid)
+
+    async def test_messages_still_reach_the_default_callback(self):
+        # given
+        callback = AsyncMock()
+        self.api.async_callback = callback
+
+        # when
+        await self.api.dispatcher.route(spread("1.0", "3.0"))
+
+        # then
+        callback.assert_awaited_once_with(spread("1.0", "3.0"))
+        self.assertEqual(2.0, self.under_test["XBT/USD"].mid)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from websockets.legacy.client import WebSocketClientProtocol
+
+from kraken_async_api.subscriptions import SubscriptionBatcher
+from kraken_async_api.websocket import PublicSubscription, PublicWebSocketApi
+
+
+class TestSubscriptionBatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.socket = AsyncMock(WebSocketClientProtocol)
+        self.socket.send.side_effect = self.acknowledge
+        self.api = PublicWebSocketApi(None, self.socket)
+        self.rejected = set()
+        self.under_test = SubscriptionBatcher(self.api, window=0.01, max_pairs=2)
+
+    async def acknowledge(self, frame):
+        payload = json.loads(frame)
+        for pair in payload["pair"]:
+            reply = {"event": "subscriptionStatus", "reqid": payload["reqid"], "pair": pair,
+                     "status": "subscribed"}
+            if pair in self.rejected:
+                reply.update(status="error", errorMessage="Currency pair not supported")
+            asyncio.get_running_loop().call_soon(
+                asyncio.ensure_future, self.api.dispatcher.route(reply))
+
+    def sent(self):
+        return [json.loads(call.args[0]) for call in self.socket.send.call_args_list]
+
+    async def test_requests_within_the_window_are_merged_and_split_by_size(self):
+        # when
+        failed = await asyncio.gather(
+            self.under_test.subscribe(PublicSubscription.TICKER, ["A", "B"]),
+            self.under_test.subscribe(PublicSubscription.TICKER, ["C", "B"]),
+            self.under_test.subscribe(PublicSubscription.BOOK, ["A"], depth=100))
+
+        # then
+        self.assertEqual([{}, {}, {}], failed)
+        sent = self.sent()
+        self.assertEqual(3, self.under_test.frames)
+        self.assertEqual([["A", "B"], ["C"], ["A"]], [payload["pair"] for payload in sent])
+        self.assertEqual({"name": "book", "depth": 100}, sent[2]["subscription"])
+        self.assertEqual(4, len(self.api.subscriptions))
+
+    async def test_failed_pairs_are_reported_to_the_requests_containing_them(self):
+        # given
+        self.rejected.add("B")
+
+        # when
+        failed = await asyncio.gather(
+            self.under_test.subscribe(PublicSubscription.TICKER, ["A", "B"]),
+            self.under_test.subscribe(PublicSubscription.TICKER, ["C"]))
+
+        # then
+        self.assertEqual([{"B": "Currency pair not supported"}, {}], failed)
+
+    async def test_pairs_without_replies_are_reported_as_timed_out(self):
+        # given
+        self.socket.send.side_effect = None
+        self.api.request_timeout = 0.05
+
+        # when
+        failed = await self.under_test.unsubscribe(PublicSubscription.SPREAD, ["A"])
+
+        # then
+        self.assertEqual({"A": "Timed out waiting for a reply"}, failed)
+        self.assertEqual("unsubscribe", self.sent()[0]["event"])
+
+    async def test_errors_without_a_pair_fail_every_pair_of_the_request(self):
+        # given
+        async def reject(event, name, pairs, **options):
+            return [{"event": "subscriptionStatus", "status": "error",
+                     "errorMessage": "Subscription depth not supported"}]
+        self.api.request_subscription = reject
+
+        # when
+        failed = await self.under_test.subscribe(PublicSubscription.BOOK, ["A", "B"], depth=7)
+
+        # then
+        self.assertEqual({"A": "Subscription depth not supported",
+                          "B": "Subscription depth not supported"}, failed)
+
+    async def test_waiters_are_resolved_when_the_request_cannot_be_sent(self):
+        # given
+        self.under_test._request = AsyncMock(side_effect=RuntimeError("closed"))
+
+        # when
+        results = await asyncio.gather(
+            self.under_test.subscribe(PublicSubscription.TICKER, ["A"]),
+            self.under_test.subscribe(PublicSubscription.TICKER, ["B"]),
+            return_exceptions=True)
+
+        # then
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    def test_apis_without_request_subscription_are_rejected(self):
+        with self.assertRaises(TypeError):
+            SubscriptionBatcher(Mock(spec=["subscribe", "unsubscribe"]))
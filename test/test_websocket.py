@@ -4,11 +4,16 @@ import unittest
 from asyncio import Queue
 from unittest.mock import AsyncMock
 
+from aiohttp import ServerDisconnectedError
+from websockets.exceptions import ConnectionClosedError
 from websockets.legacy.client import WebSocketClientProtocol
 
 from kraken_async_api import PrivateWebSocketApi
 from kraken_async_api.constants import Interval, Depth
-from kraken_async_api.websocket import PublicWebSocketApi
+from kraken_async_api.errors import KrakenError
+from kraken_async_api.metadata import MetadataCache
+from kraken_async_api.reconnect import Backoff
+from kraken_async_api.websocket import Event, PublicWebSocketApi, PublicSubscription
 
 
 class TestPublicWebsocket(unittest.IsolatedAsyncioTestCase):
@@ -94,6 +99,23 @@ class TestPublicWebsocket(unittest.IsolatedAsyncioTestCase):
             }
         })
 
+    async def test_pairs_are_converted_by_the_pair_resolver(self):
+        # given
+        self.under_test.pair_resolver = AsyncMock(return_value=["XBT/USD"])
+
+        # when
+        await self.under_test.subscribe_to_ticker(["XBTUSD"])
+
+        # then
+        self.under_test.pair_resolver.assert_awaited_once_with(["XBTUSD"])
+        self.assert_correct_payload({
+            "event": "subscribe",
+            "pair": ["XBT/USD"],
+            "subscription": {
+                "name": "ticker"
+            }
+        })
+
     async def test_subscribe_to_spread(self):
         await self.under_test.subscribe_to_spread(["foo"])
 
@@ -193,10 +215,10 @@ class TestPublicWebsocket(unittest.IsolatedAsyncioTestCase):
         queue = Queue()
         self.socket.recv = queue.get
 
-        await queue.put("hello")
+        await queue.put('{"event": "hello"}')
         await asyncio.sleep(0.01)
 
-        self.callback.assert_awaited_once_with("hello")
+        self.callback.assert_awaited_once_with({"event": "hello"})
 
     async def test_new_callback_is_used_after_updating(self):
         asyncio.create_task(self.under_test._listen())
@@ -206,16 +228,145 @@ class TestPublicWebsocket(unittest.IsolatedAsyncioTestCase):
         # queue.get mimics the behaviour of socket.recv
         self.under_test.socket.recv = queue.get
 
-        await queue.put("1")
+        await queue.put('{"event": "1"}')
         await asyncio.sleep(0.01)  # allow the created task to progress
 
         self.under_test.async_callback = second_callback
 
-        await queue.put("2")
+        await queue.put('{"event": "2"}')
+        await asyncio.sleep(0.01)
+
+        self.callback.assert_awaited_once_with({"event": "1"})
+        second_callback.assert_awaited_once_with({"event": "2"})
+
+    async def test_received_messages_are_routed_to_channel_handlers(self):
+        # given
+        self.under_test.start()
+        queue = Queue()
+        self.socket.recv = queue.get
+        handler = AsyncMock()
+        self.under_test.add_handler(PublicSubscription.SPREAD, handler)
+
+        # when
+        await queue.put('[2, ["1", "2", "3", "4", "5"], "spread", "XBT/USD"]')
+        await asyncio.sleep(0.01)
+
+        # then
+        handler.assert_awaited_once_with([2, ["1", "2", "3", "4", "5"], "spread", "XBT/USD"])
+        self.callback.assert_not_awaited()
+        self.under_test.listening.cancel()
+
+    async def test_subscriptions_are_replayed_after_reconnecting(self):
+        # given
+        await self.under_test.subscribe_to_ticker(["XBTGBP", "XBTUSD"])
+        await self.under_test.subscribe_to_book(["XBTGBP"], Depth.D100)
+        await self.under_test.unsubscribe_from_ticker(["XBTUSD"])
+        self.socket.recv.side_effect = ConnectionClosedError(None, None)
+        new_socket = AsyncMock(WebSocketClientProtocol)
+        new_socket.recv.side_effect = asyncio.Event().wait
+        self.under_test.connector = AsyncMock(side_effect=[OSError(), new_socket])
+        self.under_test.backoff = Backoff(initial=0.001)
+
+        # when
+        self.under_test.start()
+        await asyncio.sleep(0.01)
+
+        # then
+        payloads = [json.loads(call[0][0]) for call in new_socket.send.call_args_list]
+        self.assertEqual([
+            {"event": "subscribe", "pair": ["XBTGBP"], "subscription": {"name": "ticker"}},
+            {"event": "subscribe", "pair": ["XBTGBP"],
+             "subscription": {"name": "book", "depth": 100}},
+        ], payloads)
+        self.assertIs(new_socket, self.under_test.socket)
+        self.assertEqual(1, self.under_test.reconnect_stats.reconnects)
+        self.assertEqual(1, self.under_test.reconnect_stats.failed_attempts)
+        self.assertEqual(1, self.under_test.reconnect_stats.reconnect_latency.count)
+        self.under_test.listening.cancel()
+
+    def reply_to_subscription(self, replies):
+        async def send(frame):
+            reqid = json.loads(frame)["reqid"]
+            for reply in replies:
+                asyncio.get_running_loop().call_soon(
+                    asyncio.ensure_future,
+                    self.under_test.dispatcher.route({"reqid": reqid, **reply}))
+        self.mock_send.side_effect = send
+
+    async def test_pairs_failing_to_subscribe_are_not_replayed(self):
+        # given
+        self.reply_to_subscription([
+            {"event": "subscriptionStatus", "pair": "XBT/USD", "status": "subscribed"},
+            {"event": "subscriptionStatus", "pair": "FOO/BAR", "status": "error",
+             "errorMessage": "Currency pair not supported"}])
+
+        # when
+        replies = await self.under_test.request_subscription(
+            Event.SUBSCRIBE, PublicSubscription.TICKER, ["XBT/USD", "FOO/BAR"])
+
+        # then
+        self.assertEqual(["subscribed", "error"], [reply["status"] for reply in replies])
+        self.assertEqual([(PublicSubscription.TICKER, "XBT/USD", ())],
+                         list(self.under_test.subscriptions))
+
+    async def test_error_rejecting_the_whole_request_is_returned_at_once(self):
+        # given
+        self.reply_to_subscription([{"event": "subscriptionStatus", "status": "error",
+                                     "errorMessage": "Subscription depth not supported"}])
+        self.under_test.request_timeout = 1
+
+        # when
+        replies = await asyncio.wait_for(self.under_test.request_subscription(
+            Event.SUBSCRIBE, PublicSubscription.BOOK, ["XBT/USD", "ETH/USD"], depth=7), 0.5)
+
+        # then
+        self.assertEqual("Subscription depth not supported", replies[0]["errorMessage"])
+        self.assertEqual({}, self.under_test.subscriptions)
+
+    async def test_gap_duration_is_recorded_on_the_first_message_after_reconnecting(self):
+        # given
+        queue = Queue()
+        new_socket = AsyncMock(WebSocketClientProtocol)
+        new_socket.recv = queue.get
+        self.socket.recv.side_effect = ConnectionClosedError(None, None)
+        self.under_test.connector = AsyncMock(return_value=new_socket)
+
+        # when
+        self.under_test.start()
+        await queue.put('{"event": "systemStatus"}')
+        await asyncio.sleep(0.01)
+
+        # then
+        self.assertEqual(1, self.under_test.reconnect_stats.gap_duration.count)
+        self.callback.assert_awaited_once_with({"event": "systemStatus"})
+        self.under_test.listening.cancel()
+
+    async def test_failing_handler_does_not_stop_the_feed(self):
+        # given
+        queue = Queue()
+        self.socket.recv = queue.get
+        self.callback.side_effect = [ValueError("bad message"), None]
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda _, context: errors.append(context))
+        self.addCleanup(loop.set_exception_handler, None)
+
+        # when
+        self.under_test.start()
+        await queue.put('{"event": "first"}')
+        await queue.put('{"event": "second"}')
         await asyncio.sleep(0.01)
 
-        self.callback.assert_awaited_once_with("1")
-        second_callback.assert_awaited_once_with("2")
+        # then
+        self.callback.assert_awaited_with({"event": "second"})
+        self.assertIsInstance(errors[0]["exception"], ValueError)
+        self.under_test.listening.cancel()
+
+    async def test_lost_connection_is_raised_without_a_connector(self):
+        self.socket.recv.side_effect = ConnectionClosedError(None, None)
+
+        with self.assertRaises(ConnectionClosedError):
+            await self.under_test._listen()
 
 
 class TestPrivateWebsocket(unittest.IsolatedAsyncioTestCase):
@@ -226,15 +377,22 @@ class TestPrivateWebsocket(unittest.IsolatedAsyncioTestCase):
 
         self.socket = AsyncMock(WebSocketClientProtocol)
         self.socket.send = self.mock_send
+        # Requests are acknowledged by the exchange with a status event for their reqid
+        self.mock_send.side_effect = self.acknowledge
 
         self.get_ws_token = AsyncMock()
-        self.get_ws_token.return_value = json.dumps({
-            "result": {"token": "fakeToken", "expires": 900},
-            "error": []
-        })
+        self.get_ws_token.return_value = {"token": "fakeToken", "expires": 900}
 
         self.under_test = PrivateWebSocketApi(self.get_ws_token, self.callback, self.socket)
 
+    async def acknowledge(self, frame):
+        payload = json.loads(frame)
+        if "reqid" in payload:
+            reply = {"event": payload["event"] + "Status", "reqid": payload["reqid"],
+                     "status": "ok"}
+            asyncio.get_running_loop().call_soon(
+                asyncio.ensure_future, self.under_test.dispatcher.route(reply))
+
     def assert_correct_payload(self, expected_payload):
         actual_payload = self.mock_send.call_args[0][0]
         self.assertDictEqual(expected_payload, json.loads(actual_payload))
@@ -294,9 +452,30 @@ class TestPrivateWebsocket(unittest.IsolatedAsyncioTestCase):
             "price": "baz",
             "type": "buy",
             "volume": "1",
-            "token": "fakeToken"
+            "token": "fakeToken",
+            "reqid": 1
         })
 
+    async def test_add_order_formats_scaled_price_and_volume(self):
+        # given
+        self.under_test.metadata = MetadataCache(AsyncMock(return_value={"XXBTZUSD": {
+            "altname": "XBTUSD", "wsname": "XBT/USD", "base": "XXBT", "quote": "ZUSD",
+            "pair_decimals": 1, "lot_decimals": 8}}), AsyncMock(return_value={}))
+
+        # when
+        await self.under_test.add_order(order_type="limit", pair="XBT/USD", price=554125,
+                                        side="buy", volume=150000000)
+
+        # then
+        payload = json.loads(self.mock_send.call_args[0][0])
+        self.assertEqual("55412.5", payload["price"])
+        self.assertEqual("1.50000000", payload["volume"])
+
+    async def test_add_order_with_scaled_price_requires_metadata(self):
+        with self.assertRaisesRegex(ValueError, "require pair metadata"):
+            await self.under_test.add_order(order_type="limit", pair="XBT/USD", price=554125,
+                                            side="buy", volume="1")
+
     async def test_cancel_order(self):
         await self.under_test.cancel_order(["A"])
 
@@ -305,7 +484,8 @@ class TestPrivateWebsocket(unittest.IsolatedAsyncioTestCase):
             "token": "fakeToken",
             "txid": [
                 "A"
-            ]
+            ],
+            "reqid": 1
         })
 
     async def test_cancel_all(self):
@@ -313,7 +493,8 @@ class TestPrivateWebsocket(unittest.IsolatedAsyncioTestCase):
 
         self.assert_correct_payload({
             "event": "cancelAll",
-            "token": "fakeToken"
+            "token": "fakeToken",
+            "reqid": 1
         })
 
     async def test_cancel_all_orders_after(self):
@@ -322,17 +503,39 @@ class TestPrivateWebsocket(unittest.IsolatedAsyncioTestCase):
         self.assert_correct_payload({
             "event": "cancelAllOrdersAfter",
             "token": "fakeToken",
-            "timeout": 30
+            "timeout": 30,
+            "reqid": 1
         })
 
+    async def test_orders_return_the_status_replying_to_them(self):
+        # when
+        status = await self.under_test.add_order(order_type="limit", pair="bar", price="1",
+                                                 side="buy", volume="1")
+
+        # then
+        self.assertEqual({"event": "addOrderStatus", "reqid": 1, "status": "ok"}, status)
+        self.assertEqual(1, self.under_test.request_latency.count)
+
+    async def test_replies_with_other_reqids_are_not_returned(self):
+        # given
+        self.mock_send.side_effect = None
+        self.under_test.request_timeout = 0.05
+        order = asyncio.ensure_future(self.under_test.cancel_all())
+        await asyncio.sleep(0.01)
+
+        # when
+        await self.under_test.dispatcher.route({"event": "cancelAllStatus", "reqid": 2})
+
+        # then
+        with self.assertRaises(asyncio.TimeoutError):
+            await order
+        self.assertEqual(0, self.under_test.request_latency.count)
+
     async def test_failing_to_get_token_raises_a_connection_error(self):
-        self.get_ws_token.return_value = json.dumps({
-            "result": {},
-            "error": ["failed to get token!", "boo hoo"]
-        })
+        self.get_ws_token.side_effect = KrakenError(["EGeneral:failed to get token!", "boo hoo"])
 
         expected_msg = "Token could not be fetched. Please verify your api-key and api-sec. " \
-                       "failed to get token! boo hoo"
+                       "EGeneral:failed to get token! boo hoo"
 
         with self.assertRaisesRegex(ConnectionError, expected_msg):
             await self.under_test.get_ws_token()
@@ -344,3 +547,58 @@ class TestPrivateWebsocket(unittest.IsolatedAsyncioTestCase):
 
         # then
         self.get_ws_token.assert_awaited_once()
+
+    async def test_sending_orders_with_a_cached_token_makes_no_rest_calls(self):
+        # given
+        await self.under_test.get_ws_token()
+
+        # when
+        await self.under_test.add_order(order_type="limit", pair="bar", price="1", side="buy",
+                                        volume="1")
+        await self.under_test.cancel_order(["A"])
+        await self.under_test.cancel_all()
+
+        # then
+        self.get_ws_token.assert_awaited_once()
+        self.assertEqual(1, self.under_test.token_manager.stats.misses)
+        self.assertEqual(3, self.under_test.token_manager.stats.hits)
+
+    async def test_reconnecting_retries_when_refreshing_the_token_fails(self):
+        # given
+        await self.under_test.subscribe_to_own_trades()
+        self.under_test.token_manager.close()
+        self.get_ws_token.side_effect = [ServerDisconnectedError(),
+                                         {"token": "freshToken", "expires": 900}]
+        self.socket.recv.side_effect = ConnectionClosedError(None, None)
+        new_socket = AsyncMock(WebSocketClientProtocol)
+        new_socket.recv.side_effect = asyncio.Event().wait
+        self.under_test.connector = AsyncMock(return_value=new_socket)
+        self.under_test.backoff = Backoff(initial=0.001)
+
+        # when
+        self.under_test.start()
+        await asyncio.sleep(0.05)
+
+        # then
+        self.assertFalse(self.under_test.listening.done())
+        self.assertEqual(1, self.under_test.reconnect_stats.failed_attempts)
+        self.assertEqual(1, self.under_test.reconnect_stats.reconnects)
+        self.assertIn("freshToken", new_socket.send.call_args[0][0])
+        self.under_test.listening.cancel()
+
+    async def test_private_subscriptions_are_replayed_with_a_fresh_token(self):
+        # given
+        await self.under_test.subscribe_to_own_trades()
+        self.get_ws_token.return_value = {"token": "freshToken", "expires": 900}
+        new_socket = AsyncMock(WebSocketClientProtocol)
+        self.under_test.socket = new_socket
+        self.under_test.token_manager.close()
+
+        # when
+        await self.under_test._replay()
+
+        # then
+        self.assertDictEqual({
+            "event": "subscribe",
+            "subscription": {"name": "ownTrades", "token": "freshToken"}
+        }, json.loads(new_socket.send.call_args[0][0]))
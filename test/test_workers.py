@@ -0,0 +1,219 @@
+import asyncio
+import json
+import marshal
+import multiprocessing
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from websockets.legacy.client import WebSocketClientProtocol
+
+from kraken_async_api.dispatch import Dispatcher
+from kraken_async_api.websocket import PublicWebSocketApi, PublicSubscription
+from kraken_async_api.reconnect import Backoff
+from kraken_async_api.workers import _ResultWriter, _WorkerFeed, _WorkerHandle, _connect, \
+    ProcessPublicWebSocketApi, worker_for
+
+
+class TestWorkerFeed(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.socket = AsyncMock(WebSocketClientProtocol)
+        self.api = PublicWebSocketApi(None, self.socket)
+        self.frames = []
+        self.under_test = _WorkerFeed(self.api, self.frames.append)
+
+    def sent_messages(self):
+        return [message for frame in self.frames for message in marshal.loads(frame)]
+
+    async def test_messages_decoded_in_one_loop_iteration_are_sent_as_one_frame(self):
+        await self.api.dispatcher.dispatch('[1, ["1", "2"], "spread", "A"]')
+        await self.api.dispatcher.dispatch('[2, ["3", "4"], "spread", "B"]')
+        await asyncio.sleep(0)
+
+        self.assertEqual(1, len(self.frames))
+        self.assertEqual([[1, ["1", "2"], "spread", "A"], [2, ["3", "4"], "spread", "B"]],
+                         self.sent_messages())
+
+    async def test_books_are_maintained_and_sent_as_compact_snapshots(self):
+        under_test = _WorkerFeed(self.api, self.frames.append, book_levels=1)
+        await under_test.command(marshal.dumps(("subscribe", "book", ["A"], {"depth": 25})))
+
+        await self.api.dispatcher.dispatch(
+            '[1, {"as": [["2.0", "1.0", "1"], ["3.0", "1.0", "1"]], "bs": [["1.0", "1.0", "1"]]},'
+            ' "book-25", "A"]')
+        await asyncio.sleep(0)
+
+        self.assertEqual([[-1, {"as": [("2.0", "1.0")], "bs": [("1.0", "1.0")]}, "book-1", "A"]],
+                         self.sent_messages())
+        self.assertEqual(25, under_test.books["A"].depth)
+
+    async def test_books_keep_the_depth_each_pair_was_subscribed_with(self):
+        under_test = _WorkerFeed(self.api, self.frames.append, book_levels=1)
+
+        await under_test.command(marshal.dumps(("subscribe", "book", ["A"], {"depth": 25})))
+        await under_test.command(marshal.dumps(("subscribe", "book", ["B"], {"depth": 100})))
+        await under_test.command(marshal.dumps(("unsubscribe", "book", ["A"], {"depth": 25})))
+
+        self.assertEqual(100, under_test.books["B"].depth)
+        self.assertNotIn("A", under_test.books.books)
+        self.assertEqual(25, json.loads(self.socket.send.call_args[0][0])["subscription"]["depth"])
+
+    async def test_subscription_commands_are_sent_on_the_worker_socket(self):
+        keep_running = await self.under_test.command(
+            marshal.dumps(("subscribe", "ticker", ["A", "B"], {})))
+
+        self.assertTrue(keep_running)
+        self.assertIn((PublicSubscription.TICKER, "A", ()), self.api.subscriptions)
+        self.socket.send.assert_awaited_once()
+
+    async def test_stop_command_stops_the_worker(self):
+        self.assertFalse(await self.under_test.command(marshal.dumps(("stop",))))
+
+
+class TestWorkerConnect(unittest.IsolatedAsyncioTestCase):
+
+    async def test_first_connection_is_retried_with_backoff(self):
+        socket = AsyncMock(WebSocketClientProtocol)
+        socket.recv.side_effect = asyncio.Event().wait
+        api = PublicWebSocketApi(None, None, connector=AsyncMock(side_effect=[OSError(), socket]))
+        api.backoff = Backoff(initial=0.001)
+
+        await _connect(api)
+
+        self.assertIs(socket, api.socket)
+        self.assertEqual(1, api.reconnect_stats.failed_attempts)
+        await api.close()
+
+
+class TestResultWriter(unittest.TestCase):
+
+    def test_frames_are_sent_in_order_from_a_thread(self):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        under_test = _ResultWriter(writer)
+
+        under_test.send_bytes(b"1")
+        under_test.send_bytes(b"2")
+        under_test.close()
+
+        self.assertEqual([b"1", b"2"], [reader.recv_bytes(), reader.recv_bytes()])
+
+    def test_writer_stops_once_the_parent_has_gone(self):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        reader.close()
+        under_test = _ResultWriter(writer)
+
+        under_test.send_bytes(b"1")
+        under_test.close()
+
+        self.assertFalse(under_test._thread.is_alive())
+
+
+class TestProcessPublicWebSocketApi(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.callback = AsyncMock()
+        self.under_test = ProcessPublicWebSocketApi("url", Dispatcher(self.callback), workers=2)
+        self.handles = []
+        for _ in range(2):
+            handle = _WorkerHandle(Mock(), Mock(), Mock())
+            self.handles.append(handle)
+        self.under_test._handles = self.handles
+
+    async def test_pairs_are_sent_to_the_worker_they_are_assigned_to(self):
+        pairs = ["XBT/USD", "ETH/USD", "XBT/EUR", "DOT/USD"]
+
+        await self.under_test.subscribe_to_trades(pairs)
+
+        for index, handle in enumerate(self.handles):
+            for call in handle.commands.send_bytes.call_args_list:
+                action, name, worker_pairs, options = marshal.loads(call[0][0])
+                self.assertEqual(("subscribe", "trade", {}), (action, name, options))
+                self.assertTrue(all(worker_for(pair, 2) == index for pair in worker_pairs))
+
+    async def test_subscriptions_without_pairs_are_sent_to_the_first_worker(self):
+        await self.under_test.subscribe(PublicSubscription.TICKER)
+
+        self.assertEqual(("subscribe", "ticker", None, {}),
+                         marshal.loads(self.handles[0].commands.send_bytes.call_args[0][0]))
+        self.handles[1].commands.send_bytes.assert_not_called()
+
+    async def test_workers_are_started_by_the_first_subscription(self):
+        under_test = ProcessPublicWebSocketApi("url", Dispatcher(self.callback), workers=2)
+        under_test.start = Mock(side_effect=lambda: setattr(under_test, "_handles", self.handles))
+
+        await under_test.subscribe_to_ticker(["XBT/USD"])
+
+        under_test.start.assert_called_once()
+        self.assertEqual(1, sum(handle.commands.send_bytes.call_count for handle in self.handles))
+
+    async def test_pairs_are_converted_by_the_pair_resolver(self):
+        self.under_test.pair_resolver = AsyncMock(return_value=["XBT/USD"])
+
+        await self.under_test.subscribe(PublicSubscription.TICKER, ["XBTUSD"])
+
+        handle = self.handles[worker_for("XBT/USD", 2)]
+        self.assertEqual(["XBT/USD"], marshal.loads(handle.commands.send_bytes.call_args[0][0])[2])
+
+    async def test_subscriptions_sent_to_workers_are_tracked(self):
+        await self.under_test.subscribe_to_trades(["XBT/USD", "ETH/USD"])
+        await self.under_test.unsubscribe_from_trades(["ETH/USD"])
+
+        self.assertEqual([(PublicSubscription.TRADE, "XBT/USD", ())],
+                         list(self.under_test.subscriptions))
+        self.assertIsNone(self.under_test.reconnect_stats)
+
+    async def test_frames_from_workers_are_routed_through_the_dispatcher(self):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        handle = _WorkerHandle(Mock(), Mock(), reader)
+        handle.routing = asyncio.ensure_future(self.under_test._route_frames(handle))
+        asyncio.get_running_loop().add_reader(reader.fileno(), self.under_test._read_frames,
+                                              handle)
+
+        writer.send_bytes(marshal.dumps([[1, [], "trade", "A"], {"event": "systemStatus"}]))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(2, self.callback.await_count)
+        self.callback.assert_awaited_with({"event": "systemStatus"})
+        asyncio.get_running_loop().remove_reader(reader.fileno())
+        handle.routing.cancel()
+
+    def route_through(self, handle):
+        handle.routing = asyncio.ensure_future(self.under_test._route_frames(handle))
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda _, context: errors.append(context))
+        self.addCleanup(loop.set_exception_handler, None)
+        self.addCleanup(handle.routing.cancel)
+        return errors
+
+    async def test_handler_errors_do_not_stop_routing_a_worker_feed(self):
+        # given
+        handle = _WorkerHandle(Mock(), Mock(), Mock())
+        errors = self.route_through(handle)
+        self.callback.side_effect = [ValueError("boom"), None]
+
+        # when
+        handle.frames.put_nowait(marshal.dumps([{"event": "first"}, {"event": "second"}]))
+        await asyncio.sleep(0.01)
+
+        # then
+        self.callback.assert_awaited_with({"event": "second"})
+        self.assertIsInstance(errors[0]["exception"], ValueError)
+        self.assertFalse(handle.routing.done())
+
+    async def test_exited_workers_are_reported_and_refuse_commands(self):
+        # given
+        errors = self.route_through(self.handles[0])
+
+        # when
+        self.handles[0].frames.put_nowait(None)
+        await asyncio.sleep(0.01)
+
+        # then
+        self.assertIn("exited", errors[0]["message"])
+        with self.assertRaisesRegex(ConnectionError, "Worker 0 has exited"):
+            await self.under_test.subscribe(PublicSubscription.TICKER)
+
+    def test_pairs_are_assigned_to_workers_stably(self):
+        self.assertEqual(worker_for("XBT/USD", 4), worker_for("XBT/USD", 4))
+        self.assertIn(worker_for("XBT/USD", 4), range(4))